@@ -15,17 +15,116 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///reservations.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+    app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', '268435456'))
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    app.config['DASHBOARD_PAGE_SIZE'] = int(os.getenv('DASHBOARD_PAGE_SIZE', '50'))
+    app.config['DASHBOARD_MAX_PAGE_SIZE'] = int(os.getenv('DASHBOARD_MAX_PAGE_SIZE', '500'))
+    app.config['YEARS_CACHE_TTL'] = int(os.getenv('YEARS_CACHE_TTL', '3600'))
+    app.config['STATS_CACHE_TTL'] = int(os.getenv('STATS_CACHE_TTL', '300'))
+    app.config['FRAGMENT_CACHE_TTL'] = int(os.getenv('FRAGMENT_CACHE_TTL', '600'))
+    app.config['FRAGMENT_CACHE_SIZE'] = int(os.getenv('FRAGMENT_CACHE_SIZE', '256'))
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', '300'))
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', '1024'))
+    app.config['LOGIN_IP_RATE'] = os.getenv('LOGIN_IP_RATE', '20/60')
+    app.config['LOGIN_USER_RATE'] = os.getenv('LOGIN_USER_RATE', '10/60')
+    app.config['RATE_LIMIT_BACKEND'] = os.getenv('RATE_LIMIT_BACKEND', 'app.security:MemoryRateLimitBackend')
+    # Every login hashing or waiting for a hash holds a request thread. LOGIN_HASH_WORKERS + LOGIN_HASH_QUEUE
+    # must stay below WEB_THREADS; by default a flood gets at most half of the threads and half of the cores
+    web_threads = int(os.getenv('WEB_THREADS', '8'))
+    app.config['LOGIN_HASH_WORKERS'] = int(os.getenv('LOGIN_HASH_WORKERS',
+                                                     max(1, min((os.cpu_count() or 2) // 2, web_threads // 4))))
+    app.config['LOGIN_HASH_QUEUE'] = int(os.getenv('LOGIN_HASH_QUEUE',
+                                                   max(0, web_threads // 2 - app.config['LOGIN_HASH_WORKERS'])))
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    # Number of reverse proxies in front of the app; 0 trusts no X-Forwarded-* headers
+    app.config['PROXY_FIX_HOPS'] = int(os.getenv('PROXY_FIX_HOPS', '0'))
+    app.config['INSTRUMENTATION_ENABLED'] = os.getenv('INSTRUMENTATION_ENABLED') == '1'
+    app.config['INSTRUMENTATION_SAMPLE_RATE'] = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', '1.0'))
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', '100'))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv('N_PLUS_ONE_THRESHOLD', '10'))
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+    app.config['MIGRATION_BATCH_SIZE'] = int(os.getenv('MIGRATION_BATCH_SIZE', '2000'))
+    app.config['MIGRATION_PAUSE'] = float(os.getenv('MIGRATION_PAUSE', '0.05'))
+    app.config['AVAILABILITY_MAX_DAYS'] = int(os.getenv('AVAILABILITY_MAX_DAYS', '366'))
+    app.config['API_BULK_MAX'] = int(os.getenv('API_BULK_MAX', '5000'))
+    app.config['SYNC_PAGE_SIZE'] = int(os.getenv('SYNC_PAGE_SIZE', '1000'))
+    app.config['SYNC_MAX_PAGE_SIZE'] = int(os.getenv('SYNC_MAX_PAGE_SIZE', '5000'))
+    app.config['SYNC_PUSH_MAX'] = int(os.getenv('SYNC_PUSH_MAX', '500'))
+    app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+    app.config['SEARCH_RANK_LIMIT'] = int(os.getenv('SEARCH_RANK_LIMIT', '5000'))
+    app.config['EXPORT_ARTIFACT_DIR'] = os.getenv('EXPORT_ARTIFACT_DIR', os.path.join(app.instance_path, 'exports'))
+    app.config['EXPORT_ARTIFACT_TTL'] = int(os.getenv('EXPORT_ARTIFACT_TTL', '86400'))
+    app.config['EXPORT_WORKERS'] = int(os.getenv('EXPORT_WORKERS', '2'))
+    app.config['EXPORT_INLINE_WAIT'] = float(os.getenv('EXPORT_INLINE_WAIT', '1'))
+    app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', '1'))
+    app.config['IMPORT_INLINE_WAIT'] = float(os.getenv('IMPORT_INLINE_WAIT', '1'))
+    app.config['IMPORT_UPLOAD_DIR'] = os.getenv('IMPORT_UPLOAD_DIR', os.path.join(app.instance_path, 'uploads'))
+    app.config['VOUCHER_CACHE_DIR'] = os.getenv('VOUCHER_CACHE_DIR', os.path.join(app.instance_path, 'vouchers'))
+    app.config['VOUCHER_CACHE_TTL'] = int(os.getenv('VOUCHER_CACHE_TTL', str(30 * 86400)))
+    app.config['VOUCHER_WORKERS'] = int(os.getenv('VOUCHER_WORKERS', '2'))
+    app.config['ARCHIVE_DIR'] = os.getenv('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+    app.config['ARCHIVE_AFTER_MONTHS'] = int(os.getenv('ARCHIVE_AFTER_MONTHS', '12'))
+
+    if app.config['PROXY_FIX_HOPS']:
+        # The login throttle keys on remote_addr, which is otherwise the proxy's address
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['PROXY_FIX_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
 
     # Testing helpers: when running tests set TESTING=1 in env to disable CSRF
     if os.getenv('TESTING') == '1':
         app.config['TESTING'] = True
         app.config['WTF_CSRF_ENABLED'] = False
 
+    from .database import engine_options, configure_engine
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
     login_manager.init_app(app)
     login_manager.login_view = 'main.login'
 
+    from .cache import TTLCache
+    app.extensions['years_cache'] = TTLCache(ttl=app.config['YEARS_CACHE_TTL'], maxsize=1)
+    app.extensions['stats_cache'] = TTLCache(ttl=app.config['STATS_CACHE_TTL'], maxsize=256)
+    app.extensions['fragment_cache'] = TTLCache(ttl=app.config['FRAGMENT_CACHE_TTL'],
+                                                maxsize=app.config['FRAGMENT_CACHE_SIZE'])
+    app.extensions['user_cache'] = TTLCache(ttl=app.config['USER_CACHE_TTL'], maxsize=app.config['USER_CACHE_SIZE'])
+
+    from .security import LoginThrottle, PasswordVerifier, load_backend
+    app.extensions['login_throttle'] = LoginThrottle(load_backend(app.config['RATE_LIMIT_BACKEND']),
+                                                     app.config['LOGIN_IP_RATE'], app.config['LOGIN_USER_RATE'])
+    app.extensions['password_verifier'] = PasswordVerifier(workers=app.config['LOGIN_HASH_WORKERS'],
+                                                           queue=app.config['LOGIN_HASH_QUEUE'],
+                                                           method=app.config['PASSWORD_HASH_METHOD'])
+
+    from .jobs import JobQueue
+    app.extensions['export_jobs'] = JobQueue(app, max_workers=app.config['EXPORT_WORKERS'])
+    from .importing import ImportResult
+    app.extensions['import_jobs'] = JobQueue(app, max_workers=app.config['IMPORT_WORKERS'], name='import-job',
+                                             result_type=ImportResult)
+
+    from .vouchers import VoucherRenderer
+    app.extensions['voucher_renderer'] = VoucherRenderer(app.config['VOUCHER_CACHE_DIR'],
+                                                         max_workers=app.config['VOUCHER_WORKERS'],
+                                                         ttl=app.config['VOUCHER_CACHE_TTL'])
+
     from . import routes
     app.register_blueprint(routes.bp)
+    from . import api
+    app.register_blueprint(api.bp)
+    # Registers the hook that records a freshly created schema as fully migrated
+    from . import migrations
+
+    if app.config['INSTRUMENTATION_ENABLED']:
+        from .instrumentation import init_instrumentation
+        init_instrumentation(app, db)
 
     return app
@@ -0,0 +1,364 @@
+"""Versioned JSON API over reservations (/api/v1).
+
+List endpoints read plain rows with a Core select of just the requested
+columns and turn them into dicts directly, skipping ORM object hydration.
+Writes are validated with the same ReservationForm rules as the HTML form
+and the bulk importer.
+"""
+import gzip
+from datetime import date, timedelta
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from .models import Reservation
+from .forms import ReservationForm
+from .pagination import paginate, paginate_offset
+from .queries import month_filter, unpaid_filter
+from .search import apply_search
+from .cache import reservations_changed
+from .importing import form_record, import_rows
+from .availability import availability, date_span, is_capacity_error, remaining_seats
+from .receivables import GROUPINGS, receivables
+from .sync import SyncConflict, apply_delete, apply_update, changes_since, current_seq, is_deleted, row_seq
+from . import db
+
+bp = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+FIELDS = ('id', 'date', 'tour_option', 'hotel', 'room_number', 'customer_name', 'passport_id', 'contact',
+          'pax', 'amount', 'paid_amount', 'balance_due', 'payment_status', 'payment_method', 'created_at')
+EQUALITY_FILTERS = ('tour_option', 'hotel', 'payment_status', 'payment_method')
+ISO_FIELDS = {'date', 'created_at'}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@bp.errorhandler(ApiError)
+def api_error(exc):
+    return jsonify(error=exc.message), exc.status
+
+
+@bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return jsonify(error='authentication required'), 401
+
+
+def requested_fields():
+    """The ``fields=`` sparse fieldset, in canonical order; all fields by default."""
+    raw = request.args.get('fields', '')
+    if not raw:
+        return FIELDS
+    wanted = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = wanted - set(FIELDS)
+    if unknown:
+        raise ApiError(f"unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in FIELDS if name in wanted)
+
+
+def row_serializer(fields):
+    """Build a function turning a Core row (selected by ``columns(fields)``) into a dict."""
+    converters = [(i, name, name in ISO_FIELDS) for i, name in enumerate(fields)]
+
+    def serialize(row):
+        item = {}
+        for i, name, iso in converters:
+            value = row[i]
+            item[name] = value.isoformat() if iso and value is not None else value
+        return item
+    return serialize
+
+
+def columns(fields):
+    # date and id drive the keyset cursor, so they are read even when not returned
+    table = Reservation.__table__
+    extra = [name for name in ('date', 'id') if name not in fields]
+    return [table.c[name] for name in fields] + [table.c[name] for name in extra]
+
+
+def fetch_rows(stmt):
+    return db.session.execute(stmt).all()
+
+
+def parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ApiError(f'{name} must be an ISO date')
+
+
+def list_filters():
+    criteria = []
+    args = request.args
+    if args.get('month') or args.get('year'):
+        try:
+            criteria.append(month_filter(int(args['year']), int(args['month'])))
+        except (KeyError, ValueError):
+            raise ApiError('month and year must be given together as numbers')
+    if args.get('start'):
+        criteria.append(Reservation.date >= parse_day(args['start'], 'start'))
+    if args.get('end'):
+        # Inclusive, like /api/stats
+        criteria.append(Reservation.date < parse_day(args['end'], 'end') + timedelta(days=1))
+    for name in EQUALITY_FILTERS:
+        if args.get(name):
+            criteria.append(getattr(Reservation, name) == args[name])
+    if args.get('unpaid') == '1':
+        criteria.append(unpaid_filter())
+    return criteria
+
+
+@bp.route('/reservations')
+def reservation_list():
+    """Newest-first reservations with keyset cursors (``after``/``before``), or page numbers with ``q``."""
+    fields = requested_fields()
+    per_page = request.args.get('per_page', type=int) or current_app.config['DASHBOARD_PAGE_SIZE']
+    per_page = max(1, min(per_page, current_app.config['DASHBOARD_MAX_PAGE_SIZE']))
+    stmt = select(*columns(fields)).where(*list_filters())
+
+    q = request.args.get('q', '').strip()
+    if q:
+        page = paginate_offset(apply_search(stmt, q), page=request.args.get('page', 1, type=int),
+                               per_page=per_page, fetch=fetch_rows)
+    else:
+        try:
+            page = paginate(stmt, after=request.args.get('after'), before=request.args.get('before'),
+                            per_page=per_page, fetch=fetch_rows)
+        except ValueError:
+            raise ApiError('malformed cursor')
+
+    serialize = row_serializer(fields)
+    links = {}
+    for rel, args in (('next', page.next_args), ('prev', page.prev_args)):
+        if args:
+            query = {k: v for k, v in request.args.items() if k not in ('after', 'before', 'page')}
+            links[rel] = url_for('api_v1.reservation_list', **query, **args)
+    return jsonify(data=[serialize(row) for row in page], links=links)
+
+
+@bp.route('/reservations/<int:reservation_id>')
+def reservation_detail(reservation_id):
+    fields = requested_fields()
+    row = db.session.execute(select(*columns(fields)).where(Reservation.id == reservation_id)).first()
+    if row is None:
+        raise ApiError('reservation not found', 404)
+    return jsonify(data=row_serializer(fields)(row))
+
+
+@bp.route('/availability')
+def tour_availability():
+    """Booked and remaining seats for ``tour_option`` on ``dates`` (comma separated) or ``start``..``end``."""
+    tour = request.args.get('tour_option', '').strip()
+    if not tour:
+        raise ApiError('tour_option is required')
+    if request.args.get('dates'):
+        days = [parse_day(value.strip(), 'dates') for value in request.args['dates'].split(',') if value.strip()]
+    elif request.args.get('start') and request.args.get('end'):
+        start, end = parse_day(request.args['start'], 'start'), parse_day(request.args['end'], 'end')
+        days = date_span(start, end) if start <= end else []
+    else:
+        raise ApiError('give dates, or start and end')
+    if len(days) > current_app.config['AVAILABILITY_MAX_DAYS']:
+        raise ApiError(f"at most {current_app.config['AVAILABILITY_MAX_DAYS']} dates per request")
+    seats = availability(tour, days)
+    return jsonify(tour_option=tour,
+                   data=[{'date': day.isoformat(), **counts} for day, counts in seats.items()])
+
+
+@bp.route('/receivables')
+def receivables_summary():
+    """Outstanding balances grouped ``by`` age (default), tour ``date`` or ``hotel``, with totals.
+
+    Takes the list filters (``start``, ``end``, ``tour_option``, ``hotel``,
+    ...); the reservations themselves are listed by /reservations?unpaid=1.
+    """
+    by = request.args.get('by', 'age')
+    if by not in GROUPINGS:
+        raise ApiError(f"by must be one of {', '.join(GROUPINGS)}")
+    return jsonify(receivables(by, date.today(), list_filters()))
+
+
+def json_body():
+    # Requiring a JSON content type also keeps cross-site form posts out
+    if not request.is_json:
+        raise ApiError('expected an application/json body', 415)
+    payload = request.get_json(silent=True)
+    if payload is None:
+        raise ApiError('malformed JSON')
+    return payload
+
+
+def as_formdata(item):
+    """Render a JSON object as the string form data ReservationForm expects."""
+    if not isinstance(item, dict):
+        raise ApiError('each reservation must be a JSON object')
+    return {k: str(v) for k, v in item.items() if v is not None}
+
+
+@bp.route('/reservations', methods=['POST'])
+def reservation_create():
+    form = ReservationForm(formdata=None, meta={'csrf': False})
+    form.process(MultiDict(as_formdata(json_body())))
+    if not form.validate():
+        return jsonify(error='validation failed', errors=form.errors), 422
+    reservation = Reservation(**form_record(form))
+    db.session.add(reservation)
+    try:
+        db.session.commit()
+    except IntegrityError as exc:
+        db.session.rollback()
+        if not is_capacity_error(exc):
+            raise
+        remaining = remaining_seats(reservation.tour_option, reservation.date)
+        return jsonify(error='capacity exceeded', remaining=remaining), 409
+    reservations_changed([reservation.date])
+    row = db.session.execute(select(*columns(FIELDS)).where(Reservation.id == reservation.id)).first()
+    response = jsonify(data=row_serializer(FIELDS)(row))
+    response.status_code = 201
+    response.headers['Location'] = url_for('api_v1.reservation_detail', reservation_id=reservation.id)
+    return response
+
+
+@bp.route('/reservations/bulk', methods=['POST'])
+def reservation_bulk_create():
+    """Validate and insert a JSON array of reservations with the bulk importer.
+
+    Rows are numbered from 1 in the error report. ``dry_run=1`` validates
+    without writing.
+    """
+    items = json_body()
+    if not isinstance(items, list):
+        raise ApiError('expected a JSON array of reservations')
+    if len(items) > current_app.config['API_BULK_MAX']:
+        raise ApiError(f"at most {current_app.config['API_BULK_MAX']} reservations per request", 413)
+    dry_run = request.args.get('dry_run') == '1'
+    records = [(i, as_formdata(item)) for i, item in enumerate(items, start=1)]
+    result = import_rows(records, batch_size=current_app.config['IMPORT_BATCH_SIZE'], dry_run=dry_run)
+    if items and not result.inserted:
+        status = 422
+    else:
+        status = 201 if result.inserted and not dry_run else 200
+    return jsonify(result.to_dict()), status
+
+
+def compressed_json(payload):
+    """jsonify ``payload``, gzipped when the client accepts it."""
+    response = jsonify(payload)
+    response.vary.add('Accept-Encoding')
+    if 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@bp.route('/sync')
+def sync_pull():
+    """Reservations changed and deleted after sequence ``since``, oldest change first.
+
+    A client starts from ``since=0`` (a full copy, in pages of ``limit``),
+    stores ``cursor`` and asks from it next time; ``more`` means another
+    page is ready now.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', type=int) or current_app.config['SYNC_PAGE_SIZE']
+    limit = max(1, min(limit, current_app.config['SYNC_MAX_PAGE_SIZE']))
+    serialize = row_serializer(FIELDS)
+    rows, deleted, cursor, more = changes_since(since, limit, [Reservation.__table__.c[name] for name in FIELDS])
+    upserts = []
+    for row in rows:
+        item = serialize(row)
+        item['change_seq'] = row[-1]
+        upserts.append(item)
+    return compressed_json({'since': since, 'cursor': cursor, 'more': more, 'upserts': upserts, 'deleted': deleted})
+
+
+def current_formdata(reservation_id):
+    row = db.session.execute(select(*columns(FIELDS)).where(Reservation.id == reservation_id)).first()
+    if row is None:
+        return None
+    item = row_serializer(FIELDS)(row)
+    del item['id'], item['created_at'], item['balance_due']
+    return as_formdata(item)
+
+
+def push_change(form, change):
+    """Apply one pushed change and describe the outcome."""
+    if not isinstance(change, dict) or change.get('op') not in ('upsert', 'delete'):
+        return {'status': 'invalid', 'errors': {'op': ['must be upsert or delete']}}
+    reservation_id = change.get('id')
+    base_seq = change.get('base_seq')
+    if reservation_id is None:
+        if change['op'] == 'delete':
+            return {'status': 'invalid', 'errors': {'id': ['required for delete']}}
+        data = {}
+    else:
+        data = current_formdata(reservation_id)
+        if data is None:
+            return {'status': 'deleted' if is_deleted(reservation_id) else 'not_found'}
+
+    try:
+        if change['op'] == 'delete':
+            apply_delete(reservation_id, base_seq)
+            db.session.commit()
+            return {'status': 'deleted'}
+        data.update(as_formdata(change.get('data') or {}))
+        form.process(MultiDict(data))
+        if not form.validate():
+            return {'status': 'invalid', 'errors': form.errors}
+        values = form_record(form)
+        if reservation_id is None:
+            reservation_id = db.session.execute(insert(Reservation).values(**values)).inserted_primary_key[0]
+            status = 'created'
+        else:
+            apply_update(reservation_id, values, base_seq)
+            status = 'updated'
+        db.session.commit()
+    except SyncConflict:
+        return {'status': 'conflict', 'change_seq': row_seq(reservation_id)}
+    except IntegrityError as exc:
+        db.session.rollback()
+        if not is_capacity_error(exc):
+            raise
+        return {'status': 'rejected', 'errors': {'pax': ['Not enough seats left on this tour and date.']}}
+    return {'status': status, 'id': reservation_id, 'change_seq': row_seq(reservation_id), 'date': values['date']}
+
+
+@bp.route('/sync', methods=['POST'])
+def sync_push():
+    """Apply a batch of offline edits: ``{"changes": [{"op", "id", "base_seq", "data"}, ...]}``.
+
+    The batch is checked for malformed changes before any is applied, so a
+    400 means nothing was written. After that each change commits on its
+    own. An edit or delete carrying ``base_seq``
+    only applies if the row is still at that sequence, otherwise it comes
+    back as a conflict with the current sequence. Results are in the order
+    of the changes and echo each change's ``ref``.
+    """
+    body = json_body()
+    changes = body.get('changes') if isinstance(body, dict) else None
+    if not isinstance(changes, list):
+        raise ApiError('expected {"changes": [...]}')
+    if len(changes) > current_app.config['SYNC_PUSH_MAX']:
+        raise ApiError(f"at most {current_app.config['SYNC_PUSH_MAX']} changes per request", 413)
+    for i, change in enumerate(changes):
+        if isinstance(change, dict) and not isinstance(change.get('data') or {}, dict):
+            raise ApiError(f'changes[{i}].data must be a JSON object')
+    form = ReservationForm(formdata=None, meta={'csrf': False})
+    results = []
+    dates = set()
+    for change in changes:
+        result = push_change(form, change)
+        if 'date' in result:
+            dates.add(result.pop('date'))
+        if isinstance(change, dict) and 'ref' in change:
+            result['ref'] = change['ref']
+        results.append(result)
+    if dates or any(r['status'] == 'deleted' for r in results):
+        reservations_changed(dates)
+    return compressed_json({'results': results, 'cursor': current_seq()})
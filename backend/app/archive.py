@@ -0,0 +1,233 @@
+"""Cold storage for closed months: one compressed Parquet file per month.
+
+archive_month() moves the reservations of a month that is older than
+ARCHIVE_AFTER_MONTHS out of the reservation table into ARCHIVE_DIR. The
+archived_month table records which file holds each month. Exports, range
+and yearly reports and the stats API then read those months from the file,
+so callers never see where a month lives.
+
+Reads memory-map the file and push the date range and column list down to
+pyarrow. Only the needed columns of the matching row groups are decoded.
+Monthly summaries keep coming from the rollup table, which keeps the rows of
+archived months (see rollups.install_rollup). Reservations with a balance
+due stay in the table, where receivables can list them, and are archived
+once settled.
+
+pyarrow is imported on first use, so app startup does not pay for it.
+"""
+import heapq
+import os
+import tempfile
+from datetime import date
+from flask import current_app
+from sqlalchemy import delete, func, insert, inspect, not_, select, tuple_
+from .models import ArchivedMonth, Reservation, ReservationMonthlyRollup as Rollup
+from .queries import month_range, reservation_years, unpaid_filter
+from .sync import without_tombstones
+from . import db
+
+ARCHIVE_COLUMNS = [column.name for column in Reservation.__table__.columns if column.computed is None]
+TOTAL_KEYS = ['tour_option', 'payment_status', 'payment_method']
+COMPRESSION = 'zstd'
+# Small row groups give the date filter min/max statistics to skip by, even within one month
+ROW_GROUP_SIZE = 2048
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _schema():
+    import pyarrow as pa
+    types = {'id': pa.int64(), 'date': pa.date32(), 'pax': pa.int32(), 'amount': pa.float64(),
+             'paid_amount': pa.float64(), 'created_at': pa.timestamp('us'), 'change_seq': pa.int64()}
+    return pa.schema([(name, types.get(name, pa.string())) for name in ARCHIVE_COLUMNS])
+
+
+_available = {}
+
+
+def archive_available(engine):
+    key = str(engine.url)
+    if key not in _available:
+        _available[key] = inspect(engine).has_table(ArchivedMonth.__tablename__)
+    return _available[key]
+
+
+def archived_months(start, end):
+    """ArchivedMonth rows for the months overlapping [start, end), oldest first."""
+    if not archive_available(db.engine):
+        return []
+    first = (start.year, start.month)
+    last = ((end.year, end.month - 1) if end.month > 1 else (end.year - 1, 12)) if end.day == 1 \
+        else (end.year, end.month)
+    return db.session.execute(
+        select(ArchivedMonth)
+        .where(tuple_(ArchivedMonth.year, ArchivedMonth.month).between(first, last))
+        .order_by(ArchivedMonth.year, ArchivedMonth.month)).scalars().all()
+
+
+def all_reservation_years():
+    """Distinct reservation years in the table or the archive, newest first."""
+    years = set(reservation_years())
+    if archive_available(db.engine):
+        years.update(db.session.execute(select(ArchivedMonth.year).distinct()).scalars())
+    return sorted(years, reverse=True)
+
+
+def archive_fingerprint(year, month):
+    """The file currently holding the month, or None; it changes whenever the month is (re)archived."""
+    if not archive_available(db.engine):
+        return None
+    return db.session.execute(select(ArchivedMonth.filename)
+                              .where(ArchivedMonth.year == year, ArchivedMonth.month == month)).scalar()
+
+
+def archive_period_fingerprint(start, end):
+    """The files holding the archived months of [start, end); it changes whenever one is (re)archived."""
+    return tuple(entry.filename for entry in archived_months(start, end))
+
+
+def archive_path(filename):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], filename)
+
+
+def read_archive(start, end, columns=None):
+    """A pyarrow Table of the archived reservations dated in [start, end), ordered by (date, id)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = list(columns or ARCHIVE_COLUMNS)
+    filters = [('date', '>=', start), ('date', '<', end)]
+    tables = [pq.read_table(archive_path(entry.filename), columns=columns, filters=filters, memory_map=True)
+              for entry in archived_months(start, end)]
+    if not tables:
+        return _schema().empty_table().select(columns)
+    return pa.concat_tables(tables)
+
+
+def iter_archive_rows(start, end, columns, batch_size=1000):
+    """Yield the archived rows of [start, end) as tuples of ``columns``, one record batch at a time."""
+    if not archived_months(start, end):
+        return  # without touching pyarrow, which takes a while to import
+    for batch in read_archive(start, end, columns).to_batches(max_chunksize=batch_size):
+        yield from zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns)))
+
+
+def merge_rows(archived, live):
+    """Merge two (date, ...) row streams that are each ordered by date."""
+    return heapq.merge(archived, live, key=lambda row: row[0])
+
+
+def archive_totals(start, end):
+    """Per (tour option, payment status, payment method) totals of the archived rows in [start, end)."""
+    if not archived_months(start, end):
+        return []
+    table = read_archive(start, end, ['id', 'pax', 'amount', 'paid_amount', *TOTAL_KEYS])
+    if table.num_rows == 0:
+        return []
+    grouped = table.group_by(TOTAL_KEYS).aggregate(
+        [('id', 'count'), ('pax', 'sum'), ('amount', 'sum'), ('paid_amount', 'sum')])
+    columns = [grouped.column(name).to_pylist() for name in
+               (*TOTAL_KEYS, 'id_count', 'pax_sum', 'amount_sum', 'paid_amount_sum')]
+    return [(tour, status, method, count, pax or 0, amount or 0.0, paid or 0.0)
+            for tour, status, method, count, pax, amount, paid in zip(*columns)]
+
+
+def archived_max_id(connection):
+    """Highest reservation id held in any archive file, or 0."""
+    filenames = connection.execute(select(ArchivedMonth.filename)).scalars().all()
+    if not filenames:
+        return 0
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    return max(pc.max(pq.read_table(archive_path(name), columns=['id']).column('id')).as_py() or 0
+               for name in filenames)
+
+
+def archive_cutoff(today=None):
+    """First day of the oldest month that is still open; months before it may be archived."""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - current_app.config['ARCHIVE_AFTER_MONTHS']
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def archivable_months(today=None):
+    """(year, month) pairs before the cutoff that still have settled rows in the reservation table."""
+    year = func.extract('year', Reservation.date)
+    month = func.extract('month', Reservation.date)
+    stmt = (select(year, month).where(Reservation.date < archive_cutoff(today), not_(unpaid_filter()))
+            .group_by(year, month).order_by(year, month))
+    return [(int(y), int(m)) for y, m in db.session.execute(stmt)]
+
+
+def _write(table, directory, prefix):
+    import pyarrow.parquet as pq
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.part')
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+    except Exception:
+        os.remove(tmp)
+        raise
+    path = tmp[:-len('.part')] + '.parquet'
+    os.replace(tmp, path)
+    return path
+
+
+def archive_month(year, month, today=None):
+    """Move a closed month's settled reservations to its archive file and return how many rows moved.
+
+    The rows are removed with DELETE ... RETURNING and written out in the
+    same transaction, so a booking written meanwhile either stays in the
+    table or is archived, never lost or duplicated. A month archived before
+    that has gained rows since is rewritten with those rows added. The
+    delete triggers would subtract the month from the rollup; its rollup
+    rows are saved first and put back, because archived months are still
+    summarised from it. The moved rows leave no sync tombstones, so clients
+    keep their copies of them.
+    """
+    import pyarrow as pa
+    start, end = month_range(year, month)
+    if end > archive_cutoff(today):
+        raise ArchiveError(f'{year}-{month:02d} is not closed yet')
+    if not archive_available(db.engine):
+        raise ArchiveError('the archived_month table is missing; run migrate.py')
+
+    entry = db.session.get(ArchivedMonth, (year, month))
+    key = tuple_(Rollup.year, Rollup.month) == (year, month)
+    saved = db.session.execute(select(Rollup.__table__).where(key).with_for_update()).mappings().all()
+    table = Reservation.__table__
+    with without_tombstones():
+        removed = db.session.execute(
+            delete(table).where(table.c.date >= start, table.c.date < end, not_(unpaid_filter()))
+            .returning(*(table.c[name] for name in ARCHIVE_COLUMNS))).all()
+    if not removed:
+        db.session.rollback()
+        return 0
+    db.session.execute(delete(Rollup).where(key))
+    if saved:
+        db.session.execute(insert(Rollup), [dict(row) for row in saved])
+
+    old = entry.filename if entry is not None else None
+    path = None
+    try:
+        parts = [pa.Table.from_pylist([dict(zip(ARCHIVE_COLUMNS, row)) for row in removed], schema=_schema())]
+        if entry is not None:
+            parts.insert(0, read_archive(start, end))
+        combined = pa.concat_tables(parts).sort_by([('date', 'ascending'), ('id', 'ascending')])
+        path = _write(combined, current_app.config['ARCHIVE_DIR'], f'reservations-{year}-{month:02d}-')
+        if entry is None:
+            entry = ArchivedMonth(year=year, month=month)
+            db.session.add(entry)
+        entry.filename = os.path.basename(path)
+        entry.rows = combined.num_rows
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if path:
+            os.remove(path)
+        raise
+    if old:
+        os.remove(archive_path(old))
+    return len(removed)
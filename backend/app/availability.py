@@ -0,0 +1,153 @@
+from datetime import timedelta
+from sqlalchemy import DDL, delete, event, func, insert, select
+from .models import Reservation, TourCapacity, TourDayBooking
+from . import db
+
+CAPACITY_ERROR = 'capacity exceeded'
+
+# Row triggers keep booked_pax per (tour, date) in step with reservation and
+# refuse any write that pushes a day past its tour's capacity. The check runs
+# after the aggregate row has been updated inside the same statement, so two
+# concurrent bookings for the last seats cannot both pass: SQLite serialises
+# writers, and on Postgres the upsert locks the (tour, date) row until commit.
+SQLITE_BOOK = """INSERT INTO tour_day_booking (tour_option, date, booked_pax)
+        VALUES (new.tour_option, new.date, coalesce(new.pax, 0))
+        ON CONFLICT (tour_option, date) DO UPDATE SET booked_pax = booked_pax + excluded.booked_pax;"""
+SQLITE_RELEASE = """UPDATE tour_day_booking SET booked_pax = booked_pax - coalesce(old.pax, 0)
+        WHERE tour_option = old.tour_option AND date = old.date;"""
+SQLITE_CHECK = f"""SELECT RAISE(ABORT, '{CAPACITY_ERROR}')
+        WHERE (SELECT booked_pax FROM tour_day_booking WHERE tour_option = new.tour_option AND date = new.date)
+            > (SELECT seats FROM tour_capacity WHERE tour_option = new.tour_option);"""
+
+SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS tour_day_booking_ai AFTER INSERT ON reservation BEGIN
+        {SQLITE_BOOK}
+        {SQLITE_CHECK}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tour_day_booking_ad AFTER DELETE ON reservation BEGIN
+        {SQLITE_RELEASE}
+    END""",
+    # Only changes that add seats to a day are checked, so lowering a
+    # capacity never blocks editing or shrinking the bookings already made
+    f"""CREATE TRIGGER IF NOT EXISTS tour_day_booking_au AFTER UPDATE OF tour_option, date, pax
+    ON reservation BEGIN
+        {SQLITE_RELEASE}
+        {SQLITE_BOOK}
+        {SQLITE_CHECK.rstrip(';')}
+            AND (new.tour_option IS NOT old.tour_option OR new.date IS NOT old.date
+                 OR coalesce(new.pax, 0) > coalesce(old.pax, 0));
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION tour_day_booking_apply() RETURNS trigger AS $$
+    DECLARE
+        booked integer;
+        capacity integer;
+        adds_seats boolean;
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE tour_day_booking SET booked_pax = booked_pax - coalesce(OLD.pax, 0)
+            WHERE tour_option = OLD.tour_option AND date = OLD.date;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO tour_day_booking (tour_option, date, booked_pax)
+        VALUES (NEW.tour_option, NEW.date, coalesce(NEW.pax, 0))
+        ON CONFLICT (tour_option, date) DO UPDATE SET booked_pax = tour_day_booking.booked_pax + excluded.booked_pax
+        RETURNING booked_pax INTO booked;
+        IF TG_OP = 'INSERT' THEN
+            adds_seats := true;
+        ELSE
+            adds_seats := NEW.tour_option IS DISTINCT FROM OLD.tour_option OR NEW.date IS DISTINCT FROM OLD.date
+                          OR coalesce(NEW.pax, 0) > coalesce(OLD.pax, 0);
+        END IF;
+        IF adds_seats THEN
+            SELECT seats INTO capacity FROM tour_capacity WHERE tour_option = NEW.tour_option;
+            IF capacity IS NOT NULL AND booked > capacity THEN
+                RAISE EXCEPTION '{CAPACITY_ERROR}' USING ERRCODE = 'check_violation';
+            END IF;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS tour_day_booking ON reservation",
+    """CREATE TRIGGER tour_day_booking AFTER INSERT OR DELETE OR UPDATE OF tour_option, date, pax
+    ON reservation FOR EACH ROW EXECUTE FUNCTION tour_day_booking_apply()""",
+]
+
+
+def install_bookings(connection):
+    """Create the booking triggers (if missing) and recount booked pax from reservations."""
+    for statement in {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(connection.dialect.name, []):
+        connection.execute(DDL(statement))
+    connection.execute(delete(TourDayBooking))
+    rows = (select(Reservation.tour_option, Reservation.date, func.coalesce(func.sum(Reservation.pax), 0))
+            .group_by(Reservation.tour_option, Reservation.date))
+    connection.execute(insert(TourDayBooking).from_select(['tour_option', 'date', 'booked_pax'], rows))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _bookings_created(target, connection, tables=(), **kw):
+    if TourDayBooking.__table__ in tables:
+        install_bookings(connection)
+
+
+def rebuild_bookings():
+    """Create the capacity tables and triggers on an existing database and recount booked pax."""
+    TourCapacity.__table__.create(db.engine, checkfirst=True)
+    TourDayBooking.__table__.create(db.engine, checkfirst=True)
+    install_bookings(db.session.connection())
+    db.session.commit()
+    return db.session.query(func.count()).select_from(TourDayBooking).scalar()
+
+
+def is_capacity_error(exc):
+    """True if a DBAPI error came from the overbooking check."""
+    return CAPACITY_ERROR in str(getattr(exc, 'orig', exc))
+
+
+def availability(tour_option, dates):
+    """Seats per date for one tour: {date: {'booked': n, 'remaining': n or None}}.
+
+    Reads one capacity row and one aggregate row per date (a primary-key
+    range seek), however many reservations those days hold. ``remaining``
+    is None for tours without a capacity.
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return {}
+    seats = db.session.execute(
+        select(TourCapacity.seats).where(TourCapacity.tour_option == tour_option)).scalar()
+    booked = dict(db.session.execute(
+        select(TourDayBooking.date, TourDayBooking.booked_pax)
+        .where(TourDayBooking.tour_option == tour_option,
+               TourDayBooking.date >= dates[0], TourDayBooking.date <= dates[-1])).all())
+    result = {}
+    for day in dates:
+        taken = booked.get(day, 0)
+        result[day] = {'booked': taken, 'remaining': None if seats is None else max(seats - taken, 0)}
+    return result
+
+
+def remaining_seats(tour_option, day):
+    return availability(tour_option, [day])[day]['remaining']
+
+
+def date_span(start, end):
+    """Every date from ``start`` to ``end`` inclusive."""
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def set_capacity(tour_option, seats):
+    """Set (or with ``seats=None`` remove) the daily capacity of a tour."""
+    capacity = db.session.get(TourCapacity, tour_option)
+    if seats is None:
+        if capacity is not None:
+            db.session.delete(capacity)
+    elif capacity is None:
+        db.session.add(TourCapacity(tour_option=tour_option, seats=seats))
+    else:
+        capacity.seats = seats
+    db.session.commit()
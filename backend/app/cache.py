@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from .versions import data_version
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Small thread-safe in-process LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, ttl=300, maxsize=128):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._live(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def update(self, key, fn):
+        """Replace a live entry with ``fn(value)``; missing or expired entries are left alone."""
+        with self._lock:
+            value = self._live(key)
+            if value is not _MISSING:
+                expires, _ = self._data[key]
+                self._data[key] = (expires, fn(value))
+
+    def invalidate(self, key=_MISSING):
+        """Drop one entry, or everything when called without a key."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def versioned(key):
+    """``key`` tagged with the current data_version().
+
+    Every write bumps the version in the database, so entries cached under an
+    older one stop being found in every worker, not just the one that wrote.
+    Where the database keeps no counter the tag is None, and
+    reservations_changed() keeps this process's entries current instead.
+    """
+    return key, data_version()
+
+
+def reservations_changed(dates):
+    """Bring this process's caches up to date after reservations on ``dates`` were committed.
+
+    New years are merged into the cached year list; cached statistics are
+    dropped since any period may now have different totals.
+    """
+    years = {d.year for d in dates}
+
+    def merge(cached):
+        return sorted(set(cached) | years, reverse=True)
+
+    current_app.extensions['years_cache'].update(versioned('years'), merge)
+    current_app.extensions['stats_cache'].invalidate()
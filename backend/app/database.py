@@ -0,0 +1,54 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def engine_options(config):
+    """SQLAlchemy engine options for the configured database URL.
+
+    SQLite gets a driver-level lock timeout; server databases get a sized,
+    pre-pinged, recycled connection pool.
+    """
+    backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    if backend == 'sqlite':
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+    if backend in ('postgresql', 'mysql'):
+        return {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+        }
+    return {}
+
+
+def sqlite_pragmas(config):
+    """PRAGMAs applied to every new SQLite connection.
+
+    WAL lets readers proceed while a writer commits, synchronous=NORMAL is
+    durable under WAL except for the last transactions on power loss, and
+    busy_timeout makes writers wait for the lock instead of failing with
+    "database is locked".
+    """
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('cache_size', config['SQLITE_CACHE_SIZE']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def configure_engine(engine, config):
+    """Install per-connection tuning on ``engine``."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
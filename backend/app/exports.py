@@ -0,0 +1,104 @@
+import csv
+from io import StringIO
+from sqlalchemy import select
+from .archive import iter_archive_rows, merge_rows
+from .models import Reservation
+from .queries import month_range, period_filter
+from . import db
+
+# Column layout shared by every export format: (header, column)
+EXPORT_COLUMNS = [
+    ('Date', Reservation.date),
+    ('Tour Option', Reservation.tour_option),
+    ('Hotel', Reservation.hotel),
+    ('Room', Reservation.room_number),
+    ('Customer', Reservation.customer_name),
+    ('Contact', Reservation.contact),
+    ('PAX', Reservation.pax),
+    ('Tour Amount', Reservation.amount),
+    ('Paid Amount', Reservation.paid_amount),
+    ('Payment Status', Reservation.payment_status),
+    ('Payment Method', Reservation.payment_method),
+]
+EXPORT_HEADERS = [header for header, _ in EXPORT_COLUMNS]
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def iter_export_rows(criterion, chunk_size=1000):
+    """Yield export rows as plain tuples, fetching ``chunk_size`` rows at a time.
+
+    Selects bare columns rather than Reservation entities, so no ORM objects
+    are built and only one chunk is held in memory at once.
+    """
+    stmt = (select(*[column for _, column in EXPORT_COLUMNS])
+            .where(criterion)
+            .order_by(Reservation.date, Reservation.id)
+            .execution_options(yield_per=chunk_size))
+    for row in db.session.execute(stmt):
+        yield (row[0].strftime('%Y-%m-%d'),) + tuple(row[1:])
+
+
+def iter_period_rows(start, end, chunk_size=1000):
+    """Export rows dated in [start, end) from the table and the archive together, ordered by date.
+
+    Both sources are read in date order and merged as they stream, so
+    archived months need no extra memory.
+    """
+    archived = ((row[0].strftime('%Y-%m-%d'),) + row[1:] for row in
+                iter_archive_rows(start, end, [column.key for _, column in EXPORT_COLUMNS], chunk_size))
+    return merge_rows(archived, iter_export_rows(period_filter(start, end), chunk_size))
+
+
+def append_header(sheet):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    bold = Font(bold=True)
+    cells = []
+    for header in EXPORT_HEADERS:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = bold
+        cells.append(cell)
+    sheet.append(cells)
+
+
+def write_xlsx(rows, fileobj, sheet_name):
+    """Write ``rows`` to ``fileobj`` as a single-sheet workbook.
+
+    Uses openpyxl's write-only mode, which spools rows to a temporary file
+    instead of keeping a cell object per value.
+    """
+    # openpyxl is imported on first export so app startup does not pay for it
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    append_header(sheet)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(fileobj)
+
+
+def iter_csv(rows, chunk_rows=500):
+    """Yield CSV text in chunks of ``chunk_rows`` rows, header first."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_month_export(path, year, month, fmt='xlsx'):
+    """Render one month's export to ``path`` in the given format."""
+    rows = iter_period_rows(*month_range(year, month))
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            for chunk in iter_csv(rows):
+                f.write(chunk)
+    else:
+        with open(path, 'wb') as f:
+            write_xlsx(rows, f, sheet_name=f"{year}-{month:02d}")
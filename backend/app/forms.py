@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SelectField, DateField, SubmitField, DecimalField, IntegerField
-from wtforms.validators import DataRequired
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, PasswordField, SelectField, DateField, SubmitField, DecimalField, IntegerField, BooleanField
+from wtforms.validators import DataRequired, ValidationError
 
 
 class LoginForm(FlaskForm):
@@ -27,4 +28,21 @@ class ReservationForm(FlaskForm):
 class ExportForm(FlaskForm):
     year = SelectField('Year', choices=[], coerce=int, validators=[DataRequired()])
     month = SelectField('Month', choices=[(1,'January'),(2,'February'),(3,'March'),(4,'April'),(5,'May'),(6,'June'),(7,'July'),(8,'August'),(9,'September'),(10,'October'),(11,'November'),(12,'December')], coerce=int, validators=[DataRequired()])
+    format = SelectField('Format', choices=[('xlsx','Excel'),('csv','CSV')])
     submit = SubmitField('Generate Report')
+
+
+class ReportForm(FlaskForm):
+    start = DateField('From', format='%Y-%m-%d', validators=[DataRequired()])
+    end = DateField('To', format='%Y-%m-%d', validators=[DataRequired()])
+    submit = SubmitField('Range Report')
+
+    def validate_end(self, field):
+        if self.start.data and field.data and field.data < self.start.data:
+            raise ValidationError('End date must not be before start date')
+
+
+class ImportForm(FlaskForm):
+    file = FileField('Booking Sheet', validators=[FileRequired(), FileAllowed(['csv', 'xlsx'], 'CSV or Excel files only')])
+    dry_run = BooleanField('Validate only')
+    submit = SubmitField('Import')
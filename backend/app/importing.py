@@ -0,0 +1,180 @@
+import csv
+import io
+from datetime import date, datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from .models import Reservation
+from .forms import ReservationForm
+from .cache import reservations_changed
+from .availability import is_capacity_error
+from . import db
+
+# Accepted spellings of each column, normalised to lower_snake_case. The
+# export headers are included so an exported month can be re-imported as is.
+HEADER_ALIASES = {
+    'date': 'date',
+    'tour_option': 'tour_option',
+    'tour': 'tour_option',
+    'hotel': 'hotel',
+    'hotel_name': 'hotel',
+    'room': 'room_number',
+    'room_number': 'room_number',
+    'customer': 'customer_name',
+    'customer_name': 'customer_name',
+    'full_name': 'customer_name',
+    'contact': 'contact',
+    'contact_details': 'contact',
+    'pax': 'pax',
+    'amount': 'amount',
+    'tour_amount': 'amount',
+    'paid_amount': 'paid_amount',
+    'payment_status': 'payment_status',
+    'payment_method': 'payment_method',
+}
+
+
+class ImportResult:
+    """Outcome of an import: how many rows were inserted and why the others were rejected."""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.inserted = 0
+        self.errors = []
+
+    @property
+    def rejected(self):
+        return len(self.errors)
+
+    def to_dict(self):
+        return {'inserted': self.inserted, 'rejected': self.rejected, 'errors': self.errors}
+
+    def to_state(self):
+        return {'dry_run': self.dry_run, 'inserted': self.inserted, 'errors': self.errors}
+
+    @classmethod
+    def from_state(cls, state):
+        result = cls(dry_run=state['dry_run'])
+        result.inserted = state['inserted']
+        result.errors = state['errors']
+        return result
+
+
+def _normalise_header(value):
+    key = str(value or '').strip().lower().replace(' ', '_')
+    return HEADER_ALIASES.get(key)
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _records(header, rows):
+    fields = [_normalise_header(h) for h in header]
+    for line, values in enumerate(rows, start=2):
+        # Blank cells are left out, as if the field had not been filled in
+        record = {field: text for field, text in zip(fields, map(_cell_text, values)) if field and text}
+        if record:
+            yield line, record
+
+
+def read_rows(fileobj, filename):
+    """Yield (line number, raw field dict) pairs from an uploaded CSV or Excel file."""
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        sheet = load_workbook(fileobj, read_only=True, data_only=True).worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    header = next(rows, None)
+    if header is None:
+        return
+    yield from _records(header, rows)
+
+
+def form_record(form):
+    """Column values for a Reservation from a validated ReservationForm."""
+    return {
+        'tour_option': form.tour_option.data,
+        'date': form.date.data,
+        'hotel': form.hotel.data,
+        'room_number': form.room_number.data,
+        'customer_name': form.customer_name.data,
+        'contact': form.contact.data,
+        'pax': form.pax.data,
+        'amount': float(form.amount.data) if form.amount.data is not None else None,
+        'paid_amount': float(form.paid_amount.data) if form.paid_amount.data is not None else None,
+        'payment_status': form.payment_status.data,
+        'payment_method': form.payment_method.data,
+    }
+
+
+def import_rows(records, batch_size=1000, dry_run=False):
+    """Validate records with ReservationForm's rules and insert the valid ones in batches.
+
+    Each batch is written with a single executemany INSERT and committed on
+    its own, so a large file never holds one giant transaction. Rows that
+    fail validation are skipped and reported with their line number. If a
+    batch would overbook a tour, it is retried row by row so only the rows
+    that do not fit are rejected (a dry run does not check capacity).
+    """
+    result = ImportResult(dry_run)
+    # One form instance is re-bound per row; building fields is the expensive part
+    form = ReservationForm(formdata=None, meta={'csrf': False})
+    batch = []
+    lines = []
+    dates = set()
+
+    def flush():
+        inserted = len(batch)
+        if batch and not dry_run:
+            try:
+                db.session.execute(insert(Reservation), batch)
+                db.session.commit()
+            except IntegrityError as exc:
+                db.session.rollback()
+                if not is_capacity_error(exc):
+                    raise
+                inserted = insert_each(batch, lines)
+        result.inserted += inserted
+        batch.clear()
+        lines.clear()
+
+    def insert_each(rows, row_lines):
+        inserted = 0
+        for line, row in zip(row_lines, rows):
+            try:
+                db.session.execute(insert(Reservation), [row])
+                db.session.commit()
+                inserted += 1
+            except IntegrityError as exc:
+                db.session.rollback()
+                if not is_capacity_error(exc):
+                    raise
+                result.errors.append({'row': line, 'errors': {
+                    'pax': [f"Not enough seats left for {row['tour_option']} on {row['date']:%d/%m/%Y}."]}})
+        return inserted
+
+    for line, record in records:
+        form.process(MultiDict(record))
+        if not form.validate():
+            result.errors.append({'row': line, 'errors': {k: list(v) for k, v in form.errors.items()}})
+            continue
+        batch.append(form_record(form))
+        lines.append(line)
+        dates.add(form.date.data)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    if dates and not dry_run:
+        reservations_changed(dates)
+    result.errors.sort(key=lambda error: error['row'])
+    return result
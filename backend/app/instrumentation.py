@@ -0,0 +1,204 @@
+"""Opt-in per-request profiling: phase timings, SQL counts and Prometheus metrics.
+
+Enabled with INSTRUMENTATION_ENABLED=1. A fraction of requests
+(INSTRUMENTATION_SAMPLE_RATE) is traced; for those the response carries a
+``Server-Timing`` header splitting the time into SQL, template rendering,
+named phases (e.g. export) and the remaining application time. Repeated
+statements (likely N+1 patterns) and slow queries are logged and counted,
+and aggregate metrics are served in Prometheus text format at /metrics,
+to scrapers holding METRICS_TOKEN or, when no token is set, logged-in users.
+"""
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from flask import g, has_app_context, request, current_app, Response, abort, template_rendered, \
+    before_render_template
+from flask_login import current_user
+from sqlalchemy import event
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTrace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.slow = []
+        self.phases = defaultdict(float)
+        self.orm_objects = 0
+        self._render_started = None
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.duration_sum = Counter()
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.queries = Counter()
+        self.sql_seconds = Counter()
+        self.slow_queries = Counter()
+        self.n_plus_one = Counter()
+
+    def observe(self, endpoint, method, status, duration, trace, n_plus_one):
+        key = (endpoint, method, str(status))
+        with self._lock:
+            self.requests[key] += 1
+            self.duration_sum[key] += duration
+            buckets = self.buckets[key]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            self.queries[endpoint] += trace.query_count
+            self.sql_seconds[endpoint] += trace.sql_time
+            self.slow_queries[endpoint] += len(trace.slow)
+            self.n_plus_one[endpoint] += n_plus_one
+
+    def render(self):
+        lines = []
+
+        def labels(**kv):
+            return '{' + ','.join(f'{k}="{v}"' for k, v in kv.items()) + '}'
+
+        with self._lock:
+            lines.append('# HELP travel_request_duration_seconds Sampled request latency.')
+            lines.append('# TYPE travel_request_duration_seconds histogram')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                base = dict(endpoint=endpoint, method=method, status=status)
+                for bound, value in zip(DURATION_BUCKETS, self.buckets[(endpoint, method, status)]):
+                    lines.append(f'travel_request_duration_seconds_bucket{labels(**base, le=bound)} {value}')
+                lines.append(f'travel_request_duration_seconds_bucket{labels(**base, le="+Inf")} {count}')
+                lines.append(f'travel_request_duration_seconds_sum{labels(**base)} '
+                             f'{self.duration_sum[(endpoint, method, status)]:.6f}')
+                lines.append(f'travel_request_duration_seconds_count{labels(**base)} {count}')
+            for name, help_text, values in (
+                ('travel_sql_queries_total', 'SQL statements executed by sampled requests.', self.queries),
+                ('travel_sql_seconds_total', 'Time spent in SQL by sampled requests.', self.sql_seconds),
+                ('travel_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', self.slow_queries),
+                ('travel_n_plus_one_total', 'Statements repeated N_PLUS_ONE_THRESHOLD+ times in one request.',
+                 self.n_plus_one),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, value in sorted(values.items()):
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{labels(endpoint=endpoint)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def current_trace():
+    return getattr(g, '_trace', None) if has_app_context() else None
+
+
+@contextmanager
+def phase(name):
+    """Attribute the enclosed block's wall time to ``name`` in the Server-Timing breakdown."""
+    trace = current_trace()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.phases[name] += time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_trace() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = current_trace()
+    if trace is None or not conn.info.get('query_start'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    trace.sql_time += elapsed
+    trace.statements[statement] += 1
+    if elapsed * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        trace.slow.append((elapsed, statement))
+
+
+def _on_load(target, context):
+    trace = current_trace()
+    if trace is not None:
+        trace.orm_objects += 1
+
+
+def _render_started(sender, template, context, **extra):
+    trace = current_trace()
+    if trace is not None:
+        trace._render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    trace = current_trace()
+    if trace is not None and trace._render_started is not None:
+        trace.phases['render'] += time.perf_counter() - trace._render_started
+        trace._render_started = None
+
+
+def _start_trace():
+    if random.random() < current_app.config['INSTRUMENTATION_SAMPLE_RATE']:
+        g._trace = RequestTrace()
+
+
+def _finish_trace(response):
+    trace = current_trace()
+    if trace is None:
+        return response
+    total = time.perf_counter() - trace.start
+    endpoint = request.endpoint or 'unknown'
+    threshold = current_app.config['N_PLUS_ONE_THRESHOLD']
+    repeated = [(count, sql) for sql, count in trace.statements.items() if count >= threshold]
+    for count, sql in repeated:
+        current_app.logger.warning('Possible N+1 in %s: statement ran %d times: %s', endpoint, count, sql[:200])
+    for elapsed, sql in trace.slow:
+        current_app.logger.warning('Slow query in %s (%.1fms): %s', endpoint, elapsed * 1000, sql[:200])
+
+    accounted = trace.sql_time + sum(trace.phases.values())
+    parts = [f'sql;dur={trace.sql_time * 1000:.2f};desc="{trace.query_count} queries"']
+    parts += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in sorted(trace.phases.items())]
+    parts.append(f'orm;desc="{trace.orm_objects} objects"')
+    parts.append(f'app;dur={max(total - accounted, 0) * 1000:.2f}')
+    parts.append(f'total;dur={total * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(parts)
+
+    current_app.extensions['metrics'].observe(endpoint, request.method, response.status_code, total,
+                                              trace, len(repeated))
+    return response
+
+
+def metrics_view():
+    """Prometheus text format; needs the METRICS_TOKEN bearer token, or a logged-in user when none is set."""
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+    elif not current_user.is_authenticated:
+        abort(401)
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app, db):
+    """Wire request hooks, template signals and SQLAlchemy events into ``app``."""
+    app.extensions['metrics'] = Metrics()
+    app.before_request(_start_trace)
+    app.after_request(_finish_trace)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+    for mapper in db.Model.registry.mappers:
+        if not event.contains(mapper.class_, 'load', _on_load):
+            event.listen(mapper.class_, 'load', _on_load)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+
+class QueueClosed(Exception):
+    """Raised when a job is submitted to a queue that is draining for shutdown."""
+
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class Job:
+    """A unit of background work that produces one downloadable artifact."""
+
+    def __init__(self, key, filename, path, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.key = key
+        self.filename = filename
+        self.path = path
+        self.status = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.result = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'error': self.error,
+        }
+
+    def to_state(self):
+        """Everything another worker needs to report on or serve this job."""
+        return {'id': self.id, 'status': self.status, 'filename': self.filename, 'path': self.path,
+                'error': self.error, 'created_at': self.created_at, 'finished_at': self.finished_at,
+                'result': self.result.to_state() if self.result is not None else None}
+
+    @classmethod
+    def from_state(cls, state, result_type=None):
+        job = cls(None, state['filename'], state['path'], job_id=state['id'])
+        job.status = state['status']
+        job.error = state['error']
+        job.created_at = state['created_at']
+        job.finished_at = state['finished_at']
+        if state['result'] is not None and result_type is not None:
+            job.result = result_type.from_state(state['result'])
+        return job
+
+
+class JobQueue:
+    """Runs artifact-producing jobs on a thread pool, de-duplicating identical requests.
+
+    Jobs are identified by a key that must capture everything the artifact
+    depends on (including a fingerprint of the underlying data). Submitting a
+    key that is already queued, running or done returns the existing job, so
+    repeated clicks share a single render. ``run`` queues plain work whose
+    return value is the result (bulk imports).
+
+    Every status change is also written to a small JSON file under
+    EXPORT_ARTIFACT_DIR/jobs, so a job started by one gunicorn worker can be
+    polled and downloaded through any other. Results are stored with their
+    ``to_state()`` and read back with ``result_type.from_state()``.
+    """
+
+    def __init__(self, app, max_workers=2, name='export-job', result_type=None):
+        self.app = app
+        self.result_type = result_type
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self.closed = False
+
+    @property
+    def artifact_dir(self):
+        path = self.app.config['EXPORT_ARTIFACT_DIR']
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @property
+    def state_dir(self):
+        path = os.path.join(self.app.config['EXPORT_ARTIFACT_DIR'], 'jobs')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _save(self, job):
+        # Written to a temp file and renamed, so readers never see half a state
+        path = os.path.join(self.state_dir, f'{job.id}.json')
+        partial = f'{path}.part'
+        with open(partial, 'w') as f:
+            json.dump(job.to_state(), f)
+        os.replace(partial, path)
+
+    def _load(self, job_id):
+        if not JOB_ID.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f'{job_id}.json')) as f:
+                return Job.from_state(json.load(f), self.result_type)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def submit(self, key, filename, build):
+        """Queue ``build(path)`` to produce ``filename`` unless an identical job exists."""
+        self.prune()
+        with self._lock:
+            existing = self._by_key.get(key)
+            if existing is not None and existing.status != 'failed':
+                return existing
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+            job = Job(key, filename, os.path.join(self.artifact_dir, f"{digest}_{filename}"))
+            if os.path.exists(job.path):
+                # Artifact left by an earlier process for the same data
+                os.utime(job.path)
+                job.status = 'done'
+                job.finished_at = time.time()
+                self._save(job)
+            else:
+                self._enqueue(job, lambda: self._build_artifact(job, build))
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            return job
+
+    def run(self, fn):
+        """Queue ``fn()`` for its return value, which is kept on ``job.result``."""
+        self._forget_finished(time.time() - self.app.config['EXPORT_ARTIFACT_TTL'])
+        job = Job(None, None, None)
+        with self._lock:
+            self._enqueue(job, fn)
+            self._jobs[job.id] = job
+        return job
+
+    def _enqueue(self, job, work):
+        if self.closed:
+            raise QueueClosed('the job queue is shutting down')
+        self._save(job)
+        job.future = self.executor.submit(self._run, job, work)
+
+    def _build_artifact(self, job, build):
+        # Per-job temp name, so a failed attempt never deletes a retry's file
+        partial = f"{job.path}.{job.id}.part"
+        try:
+            build(partial)
+            os.replace(partial, job.path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def _run(self, job, work):
+        job.status = 'running'
+        self._save(job)
+        try:
+            with self.app.app_context():
+                job.result = work()
+            job.status = 'done'
+        except Exception as exc:
+            self.app.logger.exception('Job %s failed', job.id)
+            job.status = 'failed'
+            job.error = str(exc)
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+
+    def get(self, job_id):
+        """The job with ``job_id``, including ones run by another worker process, or None."""
+        return self._jobs.get(job_id) or self._load(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished and return it."""
+        job = self._jobs[job_id]
+        if job.future is not None:
+            job.future.result(timeout=timeout)
+        return job
+
+    def settle(self, job, timeout):
+        """Wait at most ``timeout`` seconds for ``job``; True once it has finished."""
+        if job.future is not None:
+            wait_futures([job.future], timeout=timeout)
+        return job.finished_at is not None
+
+    def prune(self):
+        """Forget finished jobs and delete artifacts older than EXPORT_ARTIFACT_TTL."""
+        cutoff = time.time() - self.app.config['EXPORT_ARTIFACT_TTL']
+        self._forget_finished(cutoff)
+        for directory in (self.artifact_dir, self.state_dir):
+            for entry in os.scandir(directory):
+                if entry.name.endswith('.part') or not entry.is_file():
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _forget_finished(self, cutoff):
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job.finished_at is not None and job.finished_at < cutoff:
+                    del self._jobs[job.id]
+                    if self._by_key.get(job.key) is job:
+                        del self._by_key[job.key]
+
+    def drain(self, timeout=None):
+        """Refuse new jobs, then wait up to ``timeout`` seconds for queued and running ones.
+
+        Jobs still queued when the time is up are cancelled. Returns the
+        number of jobs that did not finish.
+        """
+        with self._lock:
+            self.closed = True
+            futures = [job.future for job in self._jobs.values() if job.future is not None]
+        _, pending = wait_futures(futures, timeout=timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return len(pending)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+JOB_QUEUES = ('export_jobs', 'import_jobs')
+
+
+def drain_jobs(app, timeout=None):
+    """Drain every job queue of ``app`` within one overall ``timeout``; returns unfinished jobs."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    unfinished = 0
+    for name in JOB_QUEUES:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        unfinished += app.extensions[name].drain(remaining)
+    if unfinished:
+        app.logger.warning('%d background jobs still unfinished at shutdown', unfinished)
+    return unfinished
@@ -0,0 +1,292 @@
+"""Versioned schema and data migrations.
+
+Migrations run in version order and each is recorded in schema_migration
+once done. Schema migrations run in one transaction together with that
+record. Data migrations rewrite a table in primary-key ranges of
+``batch_size`` ids, each range in its own short transaction. They store
+the last finished id in migration_checkpoint and pause between batches,
+so bookings keep getting the write lock. An interrupted run resumes from
+its checkpoint.
+
+A database built by ``db.create_all()`` already has the current schema, so
+every migration is recorded as applied when the tables are first created.
+"""
+import time
+from datetime import datetime
+from sqlalchemy import DDL, MetaData, case, delete, event, func, insert, inspect, select, text, update
+from sqlalchemy.schema import CreateTable
+from .models import (ArchivedMonth, DataVersion, MigrationCheckpoint, Reservation, ReservationMonthlyRollup,
+                     ReservationTombstone, SchemaMigration, TourCapacity, TourDayBooking)
+# availability, rollups, sync and versions install their triggers from after_create hooks
+from . import archive, availability, db, rollups, search, sync, versions
+
+MIGRATIONS = []
+
+
+class Migration:
+    def __init__(self, version, fn, table=None):
+        self.version = version
+        self.fn = fn
+        self.table = table
+        self.description = (fn.__doc__ or fn.__name__).strip().splitlines()[0]
+
+    @property
+    def batched(self):
+        return self.table is not None
+
+
+def schema_migration(version):
+    """Register ``fn(connection)`` as a schema migration."""
+    def register(fn):
+        MIGRATIONS.append(Migration(version, fn))
+        return fn
+    return register
+
+
+def data_migration(version, table):
+    """Register ``fn(connection, after_id, upto_id)`` as a batched rewrite of ``table``; it returns rows changed."""
+    def register(fn):
+        MIGRATIONS.append(Migration(version, fn, table=table))
+        return fn
+    return register
+
+
+def _column_names(connection, table):
+    return {column['name'] for column in inspect(connection).get_columns(table)}
+
+
+def _index(name):
+    return next(index for index in Reservation.__table__.indexes if index.name == name)
+
+
+@schema_migration('0001_reservation_pax_and_amounts')
+def add_pax_and_amounts(connection):
+    """Add the pax, amount and paid_amount columns to reservation."""
+    existing = _column_names(connection, 'reservation')
+    for name, sql_type in (('pax', 'INTEGER'), ('amount', 'REAL'), ('paid_amount', 'REAL')):
+        if name not in existing:
+            connection.execute(text(f'ALTER TABLE reservation ADD COLUMN {name} {sql_type}'))
+
+
+@schema_migration('0002_reservation_date_id_index')
+def add_date_id_index(connection):
+    """Index reservation on (date, id) for newest-first keyset pagination."""
+    _index('ix_reservation_date_id').create(connection, checkfirst=True)
+
+
+@schema_migration('0003_reservation_search_index')
+def add_search_index(connection):
+    """Build the full-text (SQLite) or trigram (Postgres) search index over reservations."""
+    statements = {'sqlite': search.SQLITE_DDL, 'postgresql': search.POSTGRES_DDL}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(DDL(statement))
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("INSERT INTO reservation_fts(reservation_fts) VALUES ('rebuild')"))
+
+
+@schema_migration('0004_derived_tables')
+def add_derived_tables(connection):
+    """Create the monthly rollup, data version and tour capacity tables and their triggers."""
+    # Only tables that are missing are created, and their after_create hooks backfill them
+    db.metadata.create_all(connection, checkfirst=True, tables=[
+        ReservationMonthlyRollup.__table__, DataVersion.__table__, TourCapacity.__table__, TourDayBooking.__table__])
+
+
+# Old internal tour values and the labels forms.py uses for them
+TOUR_OPTION_RENAMES = {
+    'standard': 'Sapanca tour',
+    'premium': 'Red tour',
+}
+
+
+@data_migration('0005_tour_option_labels', table=Reservation.__table__)
+def rename_tour_options(connection, after_id, upto_id):
+    """Rename legacy tour option values to the labels used by the booking form."""
+    table = Reservation.__table__
+    stmt = (update(table)
+            .where(table.c.id > after_id, table.c.id <= upto_id, table.c.tour_option.in_(list(TOUR_OPTION_RENAMES)))
+            .values(tour_option=case(TOUR_OPTION_RENAMES, value=table.c.tour_option)))
+    return connection.execute(stmt).rowcount
+
+
+@schema_migration('0006_reservation_change_seq')
+def add_change_tracking(connection):
+    """Add reservation.change_seq and the tombstone table for delta sync."""
+    if 'change_seq' not in _column_names(connection, 'reservation'):
+        connection.execute(text('ALTER TABLE reservation ADD COLUMN change_seq INTEGER'))
+    _index('ix_reservation_change_seq').create(connection, checkfirst=True)
+    db.metadata.create_all(connection, checkfirst=True, tables=[ReservationTombstone.__table__])
+    if connection.dialect.name == 'sqlite':
+        # The version trigger must now ignore the writes that stamp change_seq
+        connection.execute(text('DROP TRIGGER IF EXISTS reservation_version_au'))
+        for statement in versions.SQLITE_DDL:
+            connection.execute(DDL(statement))
+
+
+@data_migration('0007_reservation_change_seq_backfill', table=Reservation.__table__)
+def backfill_change_seq(connection, after_id, upto_id):
+    """Give existing reservations a change sequence (their id; new writes are numbered above all ids)."""
+    table = Reservation.__table__
+    stmt = (update(table)
+            .where(table.c.id > after_id, table.c.id <= upto_id, table.c.change_seq.is_(None))
+            .values(change_seq=table.c.id))
+    return connection.execute(stmt).rowcount
+
+
+@schema_migration('0008_archived_month')
+def add_archived_month(connection):
+    """Create the table recording which months were moved to archive files."""
+    ArchivedMonth.__table__.create(connection, checkfirst=True)
+
+
+@schema_migration('0009_reservation_balance_due')
+def add_balance_due(connection):
+    """Add the generated reservation.balance_due column and the partial index of unpaid rows."""
+    if 'balance_due' not in _column_names(connection, 'reservation'):
+        expression = Reservation.__table__.c.balance_due.computed.sqltext
+        # SQLite can only add a VIRTUAL generated column to an existing table; it is indexed the same way
+        kind = 'STORED' if connection.dialect.name == 'postgresql' else 'VIRTUAL'
+        sql_type = 'DOUBLE PRECISION' if connection.dialect.name == 'postgresql' else 'FLOAT'
+        connection.execute(text(f'ALTER TABLE reservation ADD COLUMN balance_due {sql_type} '
+                                f'GENERATED ALWAYS AS ({expression}) {kind}'))
+    _index('ix_reservation_unpaid').create(connection, checkfirst=True)
+
+
+@schema_migration('0010_archive_without_tombstones')
+def skip_archive_tombstones(connection):
+    """Stop rows moved to the archive from leaving sync tombstones."""
+    if connection.dialect.name == 'sqlite':
+        # CREATE TRIGGER IF NOT EXISTS would keep the old definition
+        connection.execute(text('DROP TRIGGER IF EXISTS reservation_change_ad'))
+    sync.install_change_tracking(connection)
+
+
+@schema_migration('0011_reservation_autoincrement')
+def make_ids_monotonic(connection):
+    """Rebuild reservation with AUTOINCREMENT so ids of archived or deleted rows are never reused."""
+    if connection.dialect.name != 'sqlite':
+        return  # Postgres ids come from a sequence, which never goes back
+    existing = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'reservation'")).scalar()
+    if 'AUTOINCREMENT' in existing.upper():
+        return
+    # SQLite cannot alter a primary key in place: copy into a new table and swap them. The triggers
+    # and indexes go with the old table, so they are saved first and recreated on the new one; the
+    # copy itself must not fire them, or the rollup, search index and change sequence would count
+    # every row twice.
+    saved = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'reservation' AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL ORDER BY type")).scalars().all()
+    copy = Reservation.__table__.to_metadata(MetaData(), name='reservation_new')
+    connection.execute(CreateTable(copy))
+    names = ', '.join(archive.ARCHIVE_COLUMNS)
+    connection.execute(text(f'INSERT INTO reservation_new ({names}) SELECT {names} FROM reservation'))
+    connection.execute(text('DROP TABLE reservation'))
+    connection.execute(text('ALTER TABLE reservation_new RENAME TO reservation'))
+    for statement in saved:
+        connection.exec_driver_sql(statement)
+    # Start above every id ever handed out, including rows already archived or deleted
+    top = max(connection.execute(select(func.coalesce(func.max(Reservation.id), 0))).scalar(),
+              connection.execute(select(func.coalesce(func.max(ReservationTombstone.id), 0))).scalar(),
+              archive.archived_max_id(connection))
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'reservation'"))
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('reservation', :top)"), {'top': top})
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _migrations_created(target, connection, tables=(), **kw):
+    # A freshly created reservation table already has the current schema; an
+    # existing database keeps its migrations pending until migrate() runs them
+    if Reservation.__table__ not in tables:
+        return
+    SchemaMigration.__table__.create(connection, checkfirst=True)
+    applied = set(connection.execute(select(SchemaMigration.version)).scalars())
+    new = [{'version': m.version} for m in MIGRATIONS if m.version not in applied]
+    if new:
+        connection.execute(insert(SchemaMigration), new)
+
+
+def ensure_tables():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    MigrationCheckpoint.__table__.create(db.engine, checkfirst=True)
+
+
+def applied_versions():
+    with db.engine.connect() as connection:
+        return set(connection.execute(select(SchemaMigration.version)).scalars())
+
+
+def pending_migrations(target=None):
+    """Migrations not yet applied, in order, up to and including ``target``."""
+    applied = applied_versions()
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m.version)
+            if m.version not in applied and (target is None or m.version <= target)]
+
+
+def checkpoint(version):
+    with db.engine.connect() as connection:
+        return connection.execute(select(MigrationCheckpoint).where(MigrationCheckpoint.version == version)).first()
+
+
+def _forget_capabilities():
+    # Features probed once per engine may have appeared
+    key = str(db.engine.url)
+    for cache in (search._backends, rollups._available, versions._available, archive._available):
+        cache.pop(key, None)
+
+
+def run_schema_migration(migration):
+    with db.engine.begin() as connection:
+        migration.fn(connection)
+        connection.execute(insert(SchemaMigration).values(version=migration.version))
+
+
+def run_data_migration(migration, batch_size, pause=0.0, progress=None):
+    """Run a batched migration from its checkpoint to the highest id present when it started.
+
+    ``progress(migration, last_id, max_id, rows_done)`` is called after every
+    batch. Returns the number of rows changed over all runs.
+    """
+    id_column = migration.table.primary_key.columns.values()[0]
+    with db.engine.connect() as connection:
+        min_id, max_id = connection.execute(select(func.min(id_column), func.max(id_column))).one()
+    saved = checkpoint(migration.version)
+    if saved is not None:
+        last_id, rows_done = saved.last_id, saved.rows_done
+    else:
+        last_id, rows_done = (min_id or 1) - 1, 0
+        with db.engine.begin() as connection:
+            connection.execute(insert(MigrationCheckpoint).values(version=migration.version, last_id=last_id))
+
+    while max_id is not None and last_id < max_id:
+        upto_id = min(last_id + batch_size, max_id)
+        with db.engine.begin() as connection:
+            rows_done += migration.fn(connection, last_id, upto_id)
+            connection.execute(update(MigrationCheckpoint).where(MigrationCheckpoint.version == migration.version)
+                               .values(last_id=upto_id, rows_done=rows_done, updated_at=datetime.now()))
+        last_id = upto_id
+        if progress:
+            progress(migration, last_id, max_id, rows_done)
+        if pause and last_id < max_id:
+            time.sleep(pause)
+
+    with db.engine.begin() as connection:
+        connection.execute(delete(MigrationCheckpoint).where(MigrationCheckpoint.version == migration.version))
+        connection.execute(insert(SchemaMigration).values(version=migration.version))
+    return rows_done
+
+
+def migrate(batch_size=1000, pause=0.0, target=None, progress=None):
+    """Apply every pending migration (up to ``target``) and return the versions applied."""
+    if not inspect(db.engine).has_table(Reservation.__tablename__):
+        db.create_all()  # an empty database simply gets the current schema
+    ensure_tables()
+    done = []
+    for migration in pending_migrations(target):
+        if migration.batched:
+            run_data_migration(migration, batch_size, pause, progress)
+        else:
+            run_schema_migration(migration)
+        _forget_capabilities()
+        done.append(migration.version)
+    return done
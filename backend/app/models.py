@@ -9,14 +9,24 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+    def set_password(self, password, method='scrypt'):
+        self.password_hash = generate_password_hash(password, method=method)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
 
 class Reservation(db.Model):
+    __table_args__ = (
+        # Keyset pagination walks reservations newest-first on (date, id)
+        db.Index('ix_reservation_date_id', 'date', 'id'),
+        # Receivables only ever read unpaid rows, so the index holds just those (see receivables.py)
+        db.Index('ix_reservation_unpaid', 'date', 'id', sqlite_where=db.text('balance_due > 0'),
+                 postgresql_where=db.text('balance_due > 0')),
+        # Never hand out an id again once its row is gone, e.g. moved to the archive (see archive.py)
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     tour_option = db.Column(db.String(100), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -28,6 +38,76 @@ class Reservation(db.Model):
     pax = db.Column(db.Integer)
     amount = db.Column(db.Float)
     paid_amount = db.Column(db.Float)
+    # Computed by the database on every write, so it can never disagree with the amounts
+    balance_due = db.Column(db.Float, db.Computed('coalesce(amount, 0) - coalesce(paid_amount, 0)', persisted=True))
     payment_status = db.Column(db.String(50))
     payment_method = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Stamped from a database counter on every insert and update (see sync.py)
+    change_seq = db.Column(db.Integer, index=True)
+
+
+class ReservationTombstone(db.Model):
+    """A deleted reservation, kept so sync clients learn about the delete (see sync.py)."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    change_seq = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class ReservationMonthlyRollup(db.Model):
+    """Per-month reservation totals, kept current by database triggers (see rollups.py).
+
+    Missing tour/status/method values are stored as '' so they can be part
+    of the primary key.
+    """
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    tour_option = db.Column(db.String(100), primary_key=True)
+    payment_status = db.Column(db.String(50), primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    pax = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    paid_amount = db.Column(db.Float, nullable=False, default=0)
+
+
+class DataVersion(db.Model):
+    """Counters bumped by database triggers whenever a table changes (see versions.py)."""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TourCapacity(db.Model):
+    """Seats available per day on a tour. Tours without a row are not limited."""
+    tour_option = db.Column(db.String(100), primary_key=True)
+    seats = db.Column(db.Integer, nullable=False)
+
+
+class TourDayBooking(db.Model):
+    """Booked pax per (tour, date), kept current and capacity-checked by triggers (see availability.py)."""
+    tour_option = db.Column(db.String(100), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    booked_pax = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SchemaMigration(db.Model):
+    """Migrations (see migrations.py) that have been applied to this database."""
+    version = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class MigrationCheckpoint(db.Model):
+    """Progress of a batched data migration that has started but not finished."""
+    version = db.Column(db.String(100), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class ArchivedMonth(db.Model):
+    """A month whose reservations were moved to a Parquet file in ARCHIVE_DIR (see archive.py)."""
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,119 @@
+import base64
+from datetime import date
+from sqlalchemy import tuple_
+from .models import Reservation
+
+
+def encode_cursor(reservation):
+    """Encode the (date, id) position of a reservation as an opaque token."""
+    raw = f"{reservation.date.isoformat()}:{reservation.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token back to (date, id). Raises ValueError if malformed."""
+    padded = token + '=' * (-len(token) % 4)
+    raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    day, _, reservation_id = raw.partition(':')
+    return date.fromisoformat(day), int(reservation_id)
+
+
+class Page:
+    """One page of reservations plus the cursors to reach its neighbours."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def next_args(self):
+        return {'after': self.next_cursor} if self.next_cursor else None
+
+    @property
+    def prev_args(self):
+        return {'before': self.prev_cursor} if self.prev_cursor else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class OffsetPage(Page):
+    """A numbered page, used where results are ordered by relevance rather than (date, id)."""
+
+    def __init__(self, items, number, has_next):
+        super().__init__(items)
+        self.number = number
+        self._has_next = has_next
+
+    @property
+    def has_next(self):
+        return self._has_next
+
+    @property
+    def has_prev(self):
+        return self.number > 1
+
+    @property
+    def next_args(self):
+        return {'page': self.number + 1} if self.has_next else None
+
+    @property
+    def prev_args(self):
+        return {'page': self.number - 1} if self.has_prev else None
+
+
+def fetch_all(query):
+    return query.all()
+
+
+def paginate_offset(query, page=1, per_page=50, fetch=fetch_all):
+    """Return page number ``page`` of an already ordered query.
+
+    ``fetch`` runs the final query; pass one that executes a Core select to
+    page plain rows instead of ORM objects.
+    """
+    page = max(page, 1)
+    rows = fetch(query.offset((page - 1) * per_page).limit(per_page + 1))
+    return OffsetPage(rows[:per_page], page, has_next=len(rows) > per_page)
+
+
+def paginate(query, after=None, before=None, per_page=50, fetch=fetch_all):
+    """Return a newest-first Page of ``query`` using keyset pagination on (date, id).
+
+    ``after`` fetches the page following a cursor, ``before`` the page preceding
+    it. Only ``per_page + 1`` rows are read, so the cost of a page does not
+    depend on how deep into the table it is. Rows only need ``date`` and
+    ``id`` attributes, so ``fetch`` may return Core rows (see paginate_offset).
+    """
+    key = tuple_(Reservation.date, Reservation.id)
+    if before:
+        cursor = decode_cursor(before)
+        rows = fetch(query.filter(key > tuple_(*cursor))
+                     .order_by(Reservation.date.asc(), Reservation.id.asc())
+                     .limit(per_page + 1))
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return Page(items,
+                    next_cursor=encode_cursor(items[-1]) if items else None,
+                    prev_cursor=encode_cursor(items[0]) if has_more else None)
+
+    if after:
+        query = query.filter(key < tuple_(*decode_cursor(after)))
+    rows = fetch(query.order_by(Reservation.date.desc(), Reservation.id.desc())
+                 .limit(per_page + 1))
+    items = rows[:per_page]
+    return Page(items,
+                next_cursor=encode_cursor(items[-1]) if len(rows) > per_page else None,
+                prev_cursor=encode_cursor(items[0]) if after and items else None)
@@ -0,0 +1,115 @@
+"""A minimal single-page PDF writer for text and rules.
+
+Only the standard Helvetica faces are used. Every PDF viewer has them built
+in, so nothing is embedded and a page is a few kilobytes. Text is encoded as
+Windows Turkish (cp1254), i.e. WinAnsi with the six Turkish letters in place
+of the Icelandic ones, which ENCODING remaps. Other characters would print as
+'?', so callers check encodable() first and use another format for text
+such as Cyrillic, Greek or Arabic names.
+Output is deterministic (no timestamps or IDs), so equal content gives equal
+bytes.
+"""
+import zlib
+
+FONTS = {'regular': 'Helvetica', 'bold': 'Helvetica-Bold', 'italic': 'Helvetica-Oblique'}
+ENCODING = (b'<< /Type /Encoding /BaseEncoding /WinAnsiEncoding /Differences '
+            b'[208 /Gbreve 221 /Idotaccent 222 /Scedilla 240 /gbreve 253 /dotlessi 254 /scedilla] >>')
+
+# Advance widths (1/1000 em) of ASCII 32..126 from the Adobe core font metrics
+_REGULAR = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_BOLD = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+WIDTHS = {'regular': _REGULAR, 'bold': _BOLD, 'italic': _REGULAR}
+
+
+def text_width(text, font, size):
+    widths = WIDTHS[font]
+    units = sum(widths[ord(ch) - 32] if 32 <= ord(ch) <= 126 else 556 for ch in text)
+    return units * size / 1000
+
+
+def fit(text, font, size, max_width):
+    """Shorten ``text`` with '...' until it fits in ``max_width`` points."""
+    if text_width(text, font, size) <= max_width:
+        return text
+    while text and text_width(text + '...', font, size) > max_width:
+        text = text[:-1]
+    return text.rstrip() + '...'
+
+
+def encodable(text):
+    """Whether ``text`` can be drawn with the built-in fonts without losing characters."""
+    try:
+        text.encode('cp1254')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _escape(text):
+    raw = text.encode('cp1254', 'replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _rgb(color):
+    return ' '.join(f'{int(color[i:i + 2], 16) / 255:.3f}' for i in (1, 3, 5)).encode()
+
+
+class Page:
+    """Drawing commands for one page; coordinates are points from the top-left corner."""
+
+    def __init__(self, width=595, height=842):
+        self.width = width
+        self.height = height
+        self.ops = []
+
+    def text(self, x, y, text, font='regular', size=11, color='#000000', align='left'):
+        if align != 'left':
+            shift = text_width(text, font, size)
+            x -= shift / 2 if align == 'center' else shift
+        self.ops.append(b'BT /%s %g Tf %s rg %.2f %.2f Td (%s) Tj ET' % (
+            font[0].upper().encode(), size, _rgb(color), x, self.height - y, _escape(text)))
+
+    def line(self, x1, y1, x2, y2, width=1, color='#000000', dash=None):
+        pattern = b'[%d %d] 0 d' % dash if dash else b'[] 0 d'
+        self.ops.append(b'%s %g w %s RG %.2f %.2f m %.2f %.2f l S' % (
+            pattern, width, _rgb(color), x1, self.height - y1, x2, self.height - y2))
+
+    def to_pdf(self):
+        """Serialise the page as a complete PDF document."""
+        content = zlib.compress(b'\n'.join(self.ops), 6)
+        font_refs = b' '.join(b'/%s %d 0 R' % (key[0].upper().encode(), 4 + i) for i, key in enumerate(FONTS))
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> '
+            b'/Contents %d 0 R >>' % (self.width, self.height, font_refs, 4 + len(FONTS)),
+        ]
+        for name in FONTS.values():
+            objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding %s >>'
+                           % (name.encode(), ENCODING))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(content), content))
+
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        xref = len(out)
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+        return bytes(out)
@@ -0,0 +1,76 @@
+from datetime import date
+from sqlalchemy import exists, func, literal_column
+from .models import Reservation
+from . import db
+
+
+def month_range(year, month):
+    """Return the half-open [start, end) date range covering one calendar month."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def year_range(year):
+    """Return the half-open [start, end) date range covering one calendar year."""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def period_filter(start, end):
+    """Criterion for reservations dated in [start, end).
+
+    Comparing the bare column keeps the predicate sargable, so the date index
+    can seek straight to the range instead of scanning the table.
+    """
+    return (Reservation.date >= start) & (Reservation.date < end)
+
+
+def unpaid_filter():
+    """Criterion for reservations with a balance still to collect.
+
+    Spelled exactly like the predicate of ix_reservation_unpaid, with the 0
+    inlined rather than bound, so the planner can prove the partial index
+    covers the query and reads only unpaid rows.
+    """
+    return Reservation.balance_due > literal_column('0')
+
+
+def month_filter(year, month):
+    """Criterion for reservations dated within the given month."""
+    return period_filter(*month_range(year, month))
+
+
+def reservation_years():
+    """Distinct reservation years, newest first.
+
+    Reads MIN/MAX(date) (each a single index probe) and then checks every year
+    in between with an EXISTS range seek, so the cost depends on the number of
+    years rather than the number of reservations.
+    """
+    oldest = db.session.query(func.min(Reservation.date)).scalar()
+    if oldest is None:
+        return []
+    newest = db.session.query(func.max(Reservation.date)).scalar()
+    years = []
+    for year in range(newest.year, oldest.year - 1, -1):
+        found = db.session.query(exists().where(period_filter(*year_range(year)))).scalar()
+        if found:
+            years.append(year)
+    return years
+
+
+def period_fingerprint(start, end):
+    """Cheap change marker for [start, end): (row count, highest id, highest change_seq).
+
+    All three come from one range scan over the period's rows, so computing it
+    is proportional to the period, not the table. Every write stamps the row
+    with a new, larger change_seq (see sync.py), so adding, removing or
+    editing a booking in the period changes the fingerprint.
+    """
+    return tuple(db.session.query(func.count(Reservation.id), func.max(Reservation.id),
+                                  func.max(Reservation.change_seq)).filter(period_filter(start, end)).one())
+
+
+def month_fingerprint(year, month):
+    """The period fingerprint of one month."""
+    return period_fingerprint(*month_range(year, month))
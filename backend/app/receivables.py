@@ -0,0 +1,72 @@
+"""Outstanding balances, grouped by tour date, hotel or age.
+
+reservation.balance_due is a generated column (amount - paid_amount), and
+ix_reservation_unpaid indexes only rows where it is above zero. Every query
+here filters on queries.unpaid_filter(), so it reads that small index
+instead of the whole booking history.
+"""
+from datetime import timedelta
+from sqlalchemy import case, func, select
+from .models import Reservation
+from .queries import unpaid_filter
+from . import db
+
+# Age is counted in days since the tour date; (label, oldest day in the bucket)
+AGE_BUCKETS = [('upcoming', 0), ('1-30 days', 30), ('31-60 days', 60), ('61-90 days', 90), ('over 90 days', None)]
+GROUPINGS = ('age', 'date', 'hotel')
+
+
+def age_bucket(today):
+    """SQL expression naming the AGE_BUCKETS label of each reservation as of ``today``."""
+    whens = [(Reservation.date >= today - timedelta(days=days), label)
+             for label, days in AGE_BUCKETS if days is not None]
+    return case(*whens, else_=AGE_BUCKETS[-1][0])
+
+
+def _group_key(by, today):
+    if by == 'age':
+        return age_bucket(today)
+    if by == 'hotel':
+        return func.coalesce(Reservation.hotel, '')
+    return Reservation.date
+
+
+def receivable_groups(by, today, criteria=()):
+    """(key, reservations, amount, paid, balance) per group of unpaid reservations.
+
+    Groups come oldest age or date first; hotels come largest balance first.
+    """
+    key = _group_key(by, today)
+    stmt = (select(key, func.count(Reservation.id),
+                   func.coalesce(func.sum(Reservation.amount), 0),
+                   func.coalesce(func.sum(Reservation.paid_amount), 0),
+                   func.sum(Reservation.balance_due))
+            .where(unpaid_filter(), *criteria)
+            .group_by(key))
+    groups = db.session.execute(stmt).all()
+    if by == 'age':
+        order = {label: i for i, (label, _) in enumerate(reversed(AGE_BUCKETS))}
+        return sorted(groups, key=lambda group: order[group[0]])
+    if by == 'hotel':
+        return sorted(groups, key=lambda group: (-group[4], group[0]))
+    return sorted(groups, key=lambda group: group[0])
+
+
+def receivables(by, today, criteria=()):
+    """Groups and grand totals as a JSON-ready dict."""
+    totals = [0, 0.0, 0.0, 0.0]
+    groups = []
+    for key, *values in receivable_groups(by, today, criteria):
+        for i, value in enumerate(values):
+            totals[i] += value
+        count, amount, paid, balance = values
+        groups.append({'key': key.isoformat() if by == 'date' else key, 'reservations': count,
+                       'amount': round(amount, 2), 'paid': round(paid, 2), 'balance': round(balance, 2)})
+    count, amount, paid, balance = totals
+    return {
+        'as_of': today.isoformat(),
+        'by': by,
+        'totals': {'reservations': count, 'amount': round(amount, 2), 'paid': round(paid, 2),
+                   'balance': round(balance, 2)},
+        'groups': groups,
+    }
@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import func, select
+from .models import Reservation
+from .queries import period_filter
+from .archive import archive_totals
+from .exports import iter_period_rows, append_header
+from .rollups import rollup_available, rollup_totals
+from . import db
+
+SUMMARY_HEADERS = ['', 'Reservations', 'PAX', 'Tour Amount', 'Paid Amount', 'Outstanding']
+SUMMARY_DIMENSIONS = [
+    ('By tour option', 0),
+    ('By payment status', 1),
+    ('By payment method', 2),
+]
+
+
+def months_between(start, end):
+    """(year, month) pairs touched by the half-open date range [start, end)."""
+    year, month = start.year, start.month
+    last = end - timedelta(days=1)
+    months = []
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def first_of_month(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def grouped_totals(start, end):
+    """Per (tour option, payment status, payment method) totals for [start, end).
+
+    Whole months are read from the monthly rollup; only the partial months at
+    either edge of the range are aggregated from reservation rows.
+    """
+    whole_start = start if start.day == 1 else next_month(start)
+    whole_end = first_of_month(end)
+    if whole_start >= whole_end or not rollup_available(db.engine):
+        return scan_totals(start, end)
+
+    merged = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    parts = [rollup_totals(whole_start, whole_end)]
+    if start < whole_start:
+        parts.append(scan_totals(start, whole_start))
+    if whole_end < end:
+        parts.append(scan_totals(whole_end, end))
+    for part in parts:
+        for group in part:
+            totals = merged[tuple(group[:3])]
+            for i, value in enumerate(group[3:]):
+                totals[i] += value
+    return [(*key, *totals) for key, totals in merged.items()]
+
+
+def scan_totals(start, end):
+    """Per (tour option, payment status, payment method) totals, aggregated from reservation rows.
+
+    Rows of archived months are aggregated from their archive files; a key
+    may then appear twice, which every caller sums anyway.
+    """
+    stmt = (select(Reservation.tour_option, Reservation.payment_status, Reservation.payment_method,
+                   func.count(Reservation.id),
+                   func.coalesce(func.sum(Reservation.pax), 0),
+                   func.coalesce(func.sum(Reservation.amount), 0),
+                   func.coalesce(func.sum(Reservation.paid_amount), 0))
+            .where(period_filter(start, end))
+            .group_by(Reservation.tour_option, Reservation.payment_status, Reservation.payment_method))
+    return db.session.execute(stmt).all() + archive_totals(start, end)
+
+
+def summarize(groups):
+    """Fold the grouped rows into one table per summary dimension plus a grand total.
+
+    ``groups`` has at most tours x statuses x methods rows, so this is cheap no
+    matter how many reservations the period holds.
+    """
+    totals = [0, 0, 0.0, 0.0]
+    tables = {}
+    for title, index in SUMMARY_DIMENSIONS:
+        table = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        for group in groups:
+            row = table[group[index] or '-']
+            for i, value in enumerate(group[3:]):
+                row[i] += value
+        tables[title] = sorted(table.items())
+    for group in groups:
+        for i, value in enumerate(group[3:]):
+            totals[i] += value
+    return totals, tables
+
+
+def period_stats(start, end):
+    """Headline totals for [start, end) as a JSON-ready dict, from one GROUP BY."""
+    totals, tables = summarize(grouped_totals(start, end))
+    count, pax, amount, paid = totals
+
+    def breakdown(title):
+        return {label: {'count': v[0], 'pax': v[1], 'revenue': round(v[2], 2), 'paid': round(v[3], 2)}
+                for label, v in tables[title]}
+
+    return {
+        'start': start.isoformat(),
+        'end': (end - timedelta(days=1)).isoformat(),
+        'reservations': count,
+        'pax': pax,
+        'revenue': round(amount, 2),
+        'paid': round(paid, 2),
+        'outstanding': round(amount - paid, 2),
+        'by_tour': breakdown('By tour option'),
+        'by_status': breakdown('By payment status'),
+        'by_method': breakdown('By payment method'),
+    }
+
+
+def _summary_row(label, values):
+    count, pax, amount, paid = values
+    return [label, count, pax, round(amount, 2), round(paid, 2), round(amount - paid, 2)]
+
+
+def write_summary(workbook, start, end, groups):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    sheet = workbook.create_sheet('Summary')
+    bold = Font(bold=True)
+
+    def heading(text):
+        cell = WriteOnlyCell(sheet, value=text)
+        cell.font = bold
+        return cell
+
+    last = end - timedelta(days=1)
+    sheet.append([heading('Period'), f"{start:%Y-%m-%d} to {last:%Y-%m-%d}"])
+    sheet.append([])
+    totals, tables = summarize(groups)
+    sheet.append([heading(h) for h in SUMMARY_HEADERS])
+    sheet.append(_summary_row('Total', totals))
+    for title, rows in tables.items():
+        sheet.append([])
+        sheet.append([heading(title)])
+        for label, values in rows:
+            sheet.append(_summary_row(label, values))
+
+
+def write_range_report(fileobj, start, end):
+    """Write a workbook with a Summary sheet and one sheet per month of [start, end).
+
+    ``fileobj`` is a binary file object or a path.
+
+    The summary comes from a single GROUP BY; the month sheets are filled in
+    one ordered, chunked pass over the period's rows, moving to the next
+    sheet whenever the month changes.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    write_summary(workbook, start, end, grouped_totals(start, end))
+
+    sheets = {}
+    for year, month in months_between(start, end):
+        sheet = workbook.create_sheet(f"{year}-{month:02d}")
+        append_header(sheet)
+        sheets[(year, month)] = sheet
+    for row in iter_period_rows(start, end):
+        sheets[(int(row[0][:4]), int(row[0][5:7]))].append(row)
+    workbook.save(fileobj)
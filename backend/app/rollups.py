@@ -0,0 +1,163 @@
+from sqlalchemy import DDL, event, extract, func, inspect, insert, select, tuple_, delete
+from .models import ArchivedMonth, Reservation, ReservationMonthlyRollup as Rollup
+from . import db
+
+KEY = ('year', 'month', 'tour_option', 'payment_status', 'payment_method')
+ROLLUP_TRIGGER_COLUMNS = 'date, tour_option, payment_status, payment_method, pax, amount, paid_amount'
+
+
+def _key_values(row, year, month):
+    """SQL expressions for the rollup key of trigger row ``row`` ('new' or 'old')."""
+    return (f"{year}, {month}, coalesce({row}.tour_option, ''), "
+            f"coalesce({row}.payment_status, ''), coalesce({row}.payment_method, '')")
+
+
+def _key_match(row, year, month):
+    return (f"year = {year} AND month = {month} "
+            f"AND tour_option = coalesce({row}.tour_option, '') "
+            f"AND payment_status = coalesce({row}.payment_status, '') "
+            f"AND payment_method = coalesce({row}.payment_method, '')")
+
+
+def _add(row, year, month):
+    return f"""INSERT INTO reservation_monthly_rollup
+            (year, month, tour_option, payment_status, payment_method, reservations, pax, amount, paid_amount)
+        VALUES ({_key_values(row, year, month)}, 1,
+                coalesce({row}.pax, 0), coalesce({row}.amount, 0), coalesce({row}.paid_amount, 0))
+        ON CONFLICT (year, month, tour_option, payment_status, payment_method) DO UPDATE SET
+            reservations = reservation_monthly_rollup.reservations + 1,
+            pax = reservation_monthly_rollup.pax + excluded.pax,
+            amount = reservation_monthly_rollup.amount + excluded.amount,
+            paid_amount = reservation_monthly_rollup.paid_amount + excluded.paid_amount;"""
+
+
+def _remove(row, year, month):
+    return f"""UPDATE reservation_monthly_rollup SET
+            reservations = reservations - 1,
+            pax = pax - coalesce({row}.pax, 0),
+            amount = amount - coalesce({row}.amount, 0),
+            paid_amount = paid_amount - coalesce({row}.paid_amount, 0)
+        WHERE {_key_match(row, year, month)};
+        DELETE FROM reservation_monthly_rollup WHERE {_key_match(row, year, month)} AND reservations <= 0;"""
+
+
+def _sqlite_month(row):
+    return f"CAST(strftime('%%Y', {row}.date) AS INTEGER)", f"CAST(strftime('%%m', {row}.date) AS INTEGER)"
+
+
+def _pg_month(row):
+    return f"EXTRACT(YEAR FROM {row}.date)::int", f"EXTRACT(MONTH FROM {row}.date)::int"
+
+
+# Row triggers keep the rollup in the same transaction as every write to
+# reservation -- ORM flushes, executemany imports and bulk UPDATEs alike.
+SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_rollup_ai AFTER INSERT ON reservation BEGIN
+        {_add('new', *_sqlite_month('new'))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_rollup_ad AFTER DELETE ON reservation BEGIN
+        {_remove('old', *_sqlite_month('old'))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_rollup_au AFTER UPDATE OF {ROLLUP_TRIGGER_COLUMNS}
+    ON reservation BEGIN
+        {_remove('old', *_sqlite_month('old'))}
+        {_add('new', *_sqlite_month('new'))}
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION reservation_rollup_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_remove('OLD', *_pg_month('OLD'))}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_add('NEW', *_pg_month('NEW'))}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS reservation_rollup ON reservation",
+    f"""CREATE TRIGGER reservation_rollup AFTER INSERT OR DELETE OR UPDATE OF {ROLLUP_TRIGGER_COLUMNS}
+    ON reservation FOR EACH ROW EXECUTE FUNCTION reservation_rollup_apply()""",
+]
+
+
+def _backfill_statement(skip_archived=False):
+    year = extract('year', Reservation.date)
+    month = extract('month', Reservation.date)
+    tour = func.coalesce(Reservation.tour_option, '')
+    status = func.coalesce(Reservation.payment_status, '')
+    method = func.coalesce(Reservation.payment_method, '')
+    rows = (select(year, month, tour, status, method,
+                   func.count(Reservation.id),
+                   func.coalesce(func.sum(Reservation.pax), 0),
+                   func.coalesce(func.sum(Reservation.amount), 0),
+                   func.coalesce(func.sum(Reservation.paid_amount), 0))
+            .group_by(year, month, tour, status, method))
+    if skip_archived:
+        rows = rows.where(tuple_(year, month).not_in(select(ArchivedMonth.year, ArchivedMonth.month)))
+    return insert(Rollup).from_select(
+        [*KEY, 'reservations', 'pax', 'amount', 'paid_amount'], rows)
+
+
+def install_rollup(connection):
+    """Create the maintenance triggers (if missing) and fill the rollup from scratch.
+
+    Most rows of an archived month are no longer in reservation, so its
+    rollup rows are kept as they are. The triggers still maintain them for
+    rows added to the month later.
+    """
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(DDL(statement))
+    archives = inspect(connection).has_table(ArchivedMonth.__tablename__)
+    stale = delete(Rollup)
+    if archives:
+        stale = stale.where(tuple_(Rollup.year, Rollup.month).not_in(select(ArchivedMonth.year, ArchivedMonth.month)))
+    connection.execute(stale)
+    connection.execute(_backfill_statement(skip_archived=archives))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _rollup_created(target, connection, tables=(), **kw):
+    # Runs once the whole schema exists, so reservation is there to attach to
+    if Rollup.__table__ in tables:
+        install_rollup(connection)
+
+
+_available = {}
+
+
+def rollup_available(engine):
+    """True when the rollup table exists and the dialect keeps it current via triggers."""
+    key = str(engine.url)
+    if key not in _available:
+        _available[key] = (engine.dialect.name in ('sqlite', 'postgresql')
+                           and inspect(engine).has_table(Rollup.__tablename__))
+    return _available[key]
+
+
+def rebuild_rollups():
+    """Recompute the whole rollup from the reservation table (after backfills or restores)."""
+    Rollup.__table__.create(db.engine, checkfirst=True)
+    _available.pop(str(db.engine.url), None)
+    install_rollup(db.session.connection())
+    db.session.commit()
+    return db.session.query(func.count()).select_from(Rollup).scalar()
+
+
+def rollup_totals(start, end):
+    """Per (tour option, payment status, payment method) totals for the whole months in [start, end).
+
+    ``start`` and ``end`` must both be the first day of a month. Reads at most
+    months x tours x statuses x methods rows regardless of booking volume.
+    """
+    period = tuple_(Rollup.year, Rollup.month)
+    stmt = (select(func.nullif(Rollup.tour_option, ''), func.nullif(Rollup.payment_status, ''),
+                   func.nullif(Rollup.payment_method, ''),
+                   func.sum(Rollup.reservations), func.sum(Rollup.pax),
+                   func.sum(Rollup.amount), func.sum(Rollup.paid_amount))
+            .where(period >= tuple_(start.year, start.month), period < tuple_(end.year, end.month))
+            .group_by(Rollup.tour_option, Rollup.payment_status, Rollup.payment_method))
+    return db.session.execute(stmt).all()
@@ -1,12 +1,33 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, send_file
+from flask import (Blueprint, render_template, redirect, url_for, request, flash, send_file, current_app,
+                   jsonify, abort, has_app_context, make_response, session)
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from .models import User, Reservation
-from .forms import LoginForm, ReservationForm, ExportForm
+from .forms import LoginForm, ReservationForm, ExportForm, ReportForm, ImportForm
+from .pagination import paginate, paginate_offset
+from .search import apply_search
+from .queries import month_filter, month_fingerprint, month_range, period_fingerprint, unpaid_filter, year_range
+from .archive import all_reservation_years, archive_fingerprint, archive_period_fingerprint
+from .cache import reservations_changed, versioned
+from .versions import data_version
+from .availability import is_capacity_error, remaining_seats
+from .receivables import GROUPINGS, receivables
+from .exports import write_month_export, XLSX_MIMETYPE
+from .reports import write_range_report, period_stats
+from .importing import read_rows, import_rows
+from .vouchers import day_voucher_fields, printable, reservation_voucher_fields
+from .instrumentation import phase
+from .jobs import QueueClosed
+from .security import RateLimitExceeded, VerifierBusy
 from . import db, login_manager
 from flask_login import login_user, login_required, logout_user, current_user
-from datetime import datetime
-from io import BytesIO
-import pandas as pd
-from sqlalchemy import extract
+from datetime import date, datetime, timedelta
+from tempfile import TemporaryFile, mkstemp
+from zipfile import ZipFile, ZIP_STORED
+import hashlib
+import os
+import time
 
 
 bp = Blueprint('main', __name__)
@@ -14,7 +35,24 @@ bp = Blueprint('main', __name__)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    cache = current_app.extensions['user_cache']
+    user = cache.get(int(user_id))
+    if user is not None:
+        # Re-attach the cached row to this request's session without querying
+        return db.session.merge(user, load=False)
+    user = db.session.get(User, int(user_id))
+    if user is not None:
+        db.session.expunge(user)
+        cache.set(user.id, user)
+        user = db.session.merge(user, load=False)
+    return user
+
+
+@event.listens_for(User.password_hash, 'set')
+def password_changed(user, value, oldvalue, initiator):
+    # Drop the cached identity so sessions pick up the new credentials
+    if has_app_context() and user.id is not None:
+        current_app.extensions['user_cache'].invalidate(user.id)
 
 
 @bp.route('/')
@@ -26,8 +64,22 @@ def index():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        verifier = current_app.extensions['password_verifier']
+        try:
+            current_app.extensions['login_throttle'].check(request.remote_addr, form.username.data)
+            user = User.query.filter_by(username=form.username.data).first()
+            valid = verifier.verify(user.password_hash if user else None, form.password.data)
+        except RateLimitExceeded as exc:
+            flash(f'Too many login attempts. Try again in {exc.retry_after} seconds.', 'danger')
+            return render_template('login.html', form=form), 429, {'Retry-After': str(exc.retry_after)}
+        except VerifierBusy:
+            flash('The server is busy, please try again in a moment.', 'danger')
+            return render_template('login.html', form=form), 503, {'Retry-After': '1'}
+        if valid:
+            if verifier.needs_rehash(user.password_hash):
+                # Upgrade hashes made with older parameters while we have the plaintext
+                user.set_password(form.password.data, method=verifier.method)
+                db.session.commit()
             login_user(user)
             return redirect(url_for('main.dashboard'))
         flash('Invalid credentials', 'danger')
@@ -37,6 +89,7 @@ def login():
 @bp.route('/logout')
 @login_required
 def logout():
+    current_app.extensions['user_cache'].invalidate(current_user.id)
     logout_user()
     return redirect(url_for('main.login'))
 
@@ -47,29 +100,78 @@ def dashboard():
     q = request.args.get('q', '').strip()
     month = request.args.get('month', '')
     year = request.args.get('year', '')
+    per_page = request.args.get('per_page', type=int) or current_app.config['DASHBOARD_PAGE_SIZE']
+    per_page = max(1, min(per_page, current_app.config['DASHBOARD_MAX_PAGE_SIZE']))
+    filters = {k: v for k, v in request.args.items() if k in ('q', 'month', 'year', 'per_page') and v}
+
+    # Unchanged data + same URL + same user means the browser's copy is still good
+    version = data_version()
+    etag = dashboard_etag(version) if version is not None else None
+    if etag and request.if_none_match.contains_weak(etag) and not session.get('_flashes'):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    # Rendered table pages are shared between users; the version in the key
+    # retires them as soon as any reservation changes
+    cache_key = None
+    if version is not None and not q:
+        cache_key = (tuple(sorted((k, v) for k, v in request.args.items()
+                                  if k in ('month', 'year', 'after', 'before'))), per_page, version)
+    table = current_app.extensions['fragment_cache'].get(cache_key) if cache_key else None
+    if table is None:
+        table = render_template('_reservation_table.html', filters=filters,
+                                page=dashboard_page(q, month, year, per_page))
+        if cache_key:
+            current_app.extensions['fragment_cache'].set(cache_key, table)
+
+    # Export form: populate year choices from the cached distinct-year list
+    years = current_app.extensions['years_cache'].get_or_set(versioned('years'), all_reservation_years)
+    export_form = ExportForm()
+    export_form.year.choices = [(y, y) for y in years] if years else [(datetime.now().year, datetime.now().year)]
+
+    response = make_response(render_template('dashboard.html', table=Markup(table), filters=filters,
+                                              export_form=export_form, report_form=ReportForm()))
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def dashboard_page(q, month, year, per_page):
     reservations = Reservation.query
-    if q:
-        reservations = reservations.filter(
-            (Reservation.customer_name.ilike(f"%{q}%")) |
-            (Reservation.hotel.ilike(f"%{q}%")) |
-            (Reservation.tour_option.ilike(f"%{q}%"))
-        )
     if month and year:
         try:
             month_i = int(month)
             year_i = int(year)
-            reservations = reservations.filter(extract('month', Reservation.date) == month_i,
-                                               extract('year', Reservation.date) == year_i)
+            reservations = reservations.filter(month_filter(year_i, month_i))
         except ValueError:
             pass
-    reservations = reservations.order_by(Reservation.date.desc()).all()
+    if q:
+        # Search results are ranked by relevance, so they page by number
+        return paginate_offset(apply_search(reservations, q),
+                               page=request.args.get('page', 1, type=int), per_page=per_page)
+    try:
+        return paginate(reservations, after=request.args.get('after'),
+                        before=request.args.get('before'), per_page=per_page)
+    except ValueError:
+        # Malformed cursor: fall back to the first page
+        return paginate(reservations, per_page=per_page)
 
-    # Export form: populate year choices from reservations
-    years = sorted({r.date.year for r in Reservation.query.all()}, reverse=True)
-    export_form = ExportForm()
-    export_form.year.choices = [(y, y) for y in years] if years else [(datetime.now().year, datetime.now().year)]
 
-    return render_template('dashboard.html', reservations=reservations, export_form=export_form)
+def dashboard_etag(version):
+    """Validator for a dashboard page: data version, user, URL and CSRF token.
+
+    The page embeds CSRF tokens for the export forms. Those are signed with
+    the session's CSRF secret and expire, so the tag covers the secret (a
+    new session must not revalidate a page from an old one) and rolls over
+    every half token lifetime.
+    """
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    window = int(time.time() // (limit // 2)) if limit else 0
+    secret = session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'), '')
+    raw = f"{version}:{current_user.get_id()}:{request.full_path}:{window}:{secret}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
 
 
 @bp.route('/add', methods=['GET', 'POST'])
@@ -91,38 +193,335 @@ def add_reservation():
             payment_method=form.payment_method.data,
         )
         db.session.add(r)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as exc:
+            db.session.rollback()
+            if not is_capacity_error(exc):
+                raise
+            remaining = remaining_seats(form.tour_option.data, form.date.data)
+            flash(f'Only {remaining} seats left for {form.tour_option.data} on {form.date.data:%d/%m/%Y}.', 'danger')
+            return render_template('add_reservation.html', form=form), 409
+        reservations_changed([r.date])
         flash('Reservation saved', 'success')
         return redirect(url_for('main.dashboard'))
     return render_template('add_reservation.html', form=form)
 
 
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_reservations():
+    form = ImportForm()
+    if form.validate_on_submit():
+        upload = form.file.data
+        job = start_import(upload, dry_run=form.dry_run.data)
+        # Small files finish within the wait; large ones continue in the background
+        current_app.extensions['import_jobs'].settle(job, current_app.config['IMPORT_INLINE_WAIT'])
+        if job.finished_at is None:
+            if wants_json():
+                return jsonify(import_job_payload(job)), 202
+            return redirect(url_for('main.import_job_status', job_id=job.id))
+        return import_job_response(job)
+    return render_template('import.html', form=form, result=None)
+
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+
+def start_import(upload, dry_run):
+    """Save an uploaded sheet and queue its import on the import job pool."""
+    directory = current_app.config['IMPORT_UPLOAD_DIR']
+    os.makedirs(directory, exist_ok=True)
+    suffix = os.path.splitext(upload.filename)[1].lower()
+    handle, path = mkstemp(suffix=suffix, dir=directory)
+    with os.fdopen(handle, 'wb') as f:
+        upload.save(f)
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+
+    def work():
+        try:
+            with open(path, 'rb') as f:
+                return import_rows(read_rows(f, path), batch_size=batch_size, dry_run=dry_run)
+        finally:
+            os.remove(path)
+    return current_app.extensions['import_jobs'].run(work)
+
+
+def import_job_payload(job):
+    payload = {'id': job.id, 'status': job.status, 'error': job.error,
+               'status_url': url_for('main.import_job_status', job_id=job.id)}
+    if job.result is not None:
+        payload['result'] = job.result.to_dict()
+    return payload
+
+
+def import_job_response(job):
+    if wants_json():
+        if job.status == 'done':
+            return jsonify(job.result.to_dict())
+        return jsonify(import_job_payload(job)), 500 if job.status == 'failed' else 202
+    if job.status == 'failed':
+        flash(f'Import failed: {job.error}', 'danger')
+    elif job.status == 'done':
+        result = job.result
+        verb = 'validated' if result.dry_run else 'imported'
+        flash(f'{result.inserted} reservations {verb}, {result.rejected} rejected',
+              'success' if not result.rejected else 'danger')
+    else:
+        return render_template('job.html', job=job, title='Import in progress')
+    return render_template('import.html', form=ImportForm(), result=job.result)
+
+
+@bp.route('/import/jobs/<job_id>')
+@login_required
+def import_job_status(job_id):
+    job = current_app.extensions['import_jobs'].get(job_id)
+    if job is None:
+        abort(404)
+    return import_job_response(job)
+
+
 @bp.route('/export', methods=['POST'])
 @login_required
 def export():
-    year = int(request.form.get('year'))
-    month = int(request.form.get('month'))
-    qs = Reservation.query.filter(extract('year', Reservation.date) == year,
-                                  extract('month', Reservation.date) == month).all()
-    data = []
-    for r in qs:
-        data.append({
-            'Date': r.date.strftime('%Y-%m-%d'),
-            'Tour Option': r.tour_option,
-            'Hotel': r.hotel,
-            'Room': r.room_number,
-            'Customer': r.customer_name,
-            'Contact': r.contact,
-            'PAX': r.pax,
-            'Tour Amount': r.amount,
-            'Paid Amount': r.paid_amount,
-            'Payment Status': r.payment_status,
-            'Payment Method': r.payment_method,
-        })
-    df = pd.DataFrame(data)
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name=f"{year}-{month:02d}")
+    try:
+        year = int(request.form.get('year'))
+        month = int(request.form.get('month'))
+        month_filter(year, month)
+    except (TypeError, ValueError):
+        abort(400)
+    fmt = 'csv' if request.form.get('format') == 'csv' else 'xlsx'
+    job = submit_month_export(year, month, fmt)
+    # The file is rendered on the export pool; only short exports are waited for
+    with phase('export'):
+        finished = current_app.extensions['export_jobs'].settle(job, current_app.config['EXPORT_INLINE_WAIT'])
+    if finished and job.status == 'done':
+        return send_job_artifact(job)
+    if finished:
+        flash(f'Export failed: {job.error}', 'danger')
+        return redirect(url_for('main.dashboard'))
+    return redirect(url_for('main.export_job_page', job_id=job.id))
+
+
+def submit_month_export(year, month, fmt):
+    key = ('month', year, month, fmt, month_fingerprint(year, month), archive_fingerprint(year, month))
+    return current_app.extensions['export_jobs'].submit(
+        key, f"reservations_{year}_{month:02d}.{fmt}",
+        lambda path: write_month_export(path, year, month, fmt))
+
+
+def send_job_artifact(job):
+    mimetype = 'text/csv' if job.filename.endswith('.csv') else XLSX_MIMETYPE
+    return send_file(job.path, as_attachment=True, download_name=job.filename, mimetype=mimetype)
+
+
+@bp.errorhandler(QueueClosed)
+def queue_closed(exc):
+    # Draining for shutdown: the client should retry against another worker
+    response = jsonify(error=str(exc)) if wants_json() else make_response(str(exc))
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+@bp.route('/reservations/<int:reservation_id>/voucher.pdf')
+@login_required
+def voucher(reservation_id):
+    fields = reservation_voucher_fields(reservation_id)
+    if fields is None:
+        abort(404)
+    if not printable(fields):
+        # The PDF fonts cannot show these characters; let the browser print it
+        return redirect(url_for('main.voucher_page', reservation_id=reservation_id))
+    with phase('export'):
+        key, path = current_app.extensions['voucher_renderer'].get(fields)
+    # The content hash doubles as the ETag, so an unchanged voucher is a 304 on reprint
+    response = send_file(path, mimetype='application/pdf', as_attachment=request.args.get('download') == '1',
+                         download_name=f'Voucher_{reservation_id}.pdf', etag=key, conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@bp.route('/reservations/<int:reservation_id>/voucher')
+@login_required
+def voucher_page(reservation_id):
+    """The voucher as a printable web page, for text the PDF fonts cannot show."""
+    fields = reservation_voucher_fields(reservation_id)
+    if fields is None:
+        abort(404)
+    return render_template('voucher.html', fields=fields)
+
+
+@bp.route('/vouchers')
+@login_required
+def day_vouchers():
+    """A zip with the voucher of every reservation travelling on ``date``.
+
+    Vouchers the PDF fonts cannot show are added as printable HTML pages.
+    """
+    try:
+        day = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        abort(400)
+    fields = day_voucher_fields(day)
+    if not fields:
+        flash(f'No reservations on {day:%d/%m/%Y}.', 'danger')
+        return redirect(url_for('main.dashboard'))
+    renderer = current_app.extensions['voucher_renderer']
+    buffer = TemporaryFile()
+    with phase('export'):
+        renderer.prune()
+        # PDF content streams are already compressed, so the zip only stores them
+        pdfs = [item for item in fields if printable(item)]
+        paths = dict(zip((item['id'] for item in pdfs), renderer.get_many(pdfs)))
+        with ZipFile(buffer, 'w', ZIP_STORED) as archive:
+            for item in fields:
+                if item['id'] in paths:
+                    archive.write(paths[item['id']][1], f"Voucher_{item['id']}.pdf")
+                else:
+                    archive.writestr(f"Voucher_{item['id']}.html", render_template('voucher.html', fields=item))
     buffer.seek(0)
-    filename = f"reservations_{year}_{month:02d}.xlsx"
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return send_file(buffer, as_attachment=True, download_name=f'vouchers_{day.isoformat()}.zip',
+                     mimetype='application/zip')
+
+
+def send_report(start, end, filename):
+    """Build the report of [start, end) on the export pool, like /export.
+
+    Short reports are downloaded straight away; longer ones redirect to the
+    job's progress page.
+    """
+    key = ('report', start, end, filename, period_fingerprint(start, end), archive_period_fingerprint(start, end))
+    job = current_app.extensions['export_jobs'].submit(key, filename,
+                                                       lambda path: write_range_report(path, start, end))
+    with phase('export'):
+        finished = current_app.extensions['export_jobs'].settle(job, current_app.config['EXPORT_INLINE_WAIT'])
+    if finished and job.status == 'done':
+        return send_job_artifact(job)
+    if finished:
+        flash(f'Report failed: {job.error}', 'danger')
+        return redirect(url_for('main.dashboard'))
+    return redirect(url_for('main.export_job_page', job_id=job.id))
+
+
+@bp.route('/reports', methods=['POST'])
+@login_required
+def range_report():
+    form = ReportForm()
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            flash(errors[0], 'danger')
+        return redirect(url_for('main.dashboard'))
+    # The form's end date is inclusive
+    start, end = form.start.data, form.end.data + timedelta(days=1)
+    return send_report(start, end, f"report_{form.start.data:%Y%m%d}_{form.end.data:%Y%m%d}.xlsx")
+
+
+@bp.route('/reports/<int:year>')
+@login_required
+def yearly_report(year):
+    return send_report(*year_range(year), f"report_{year}.xlsx")
+
+
+@bp.route('/receivables')
+@login_required
+def receivables_page():
+    """Unpaid reservations with their balances, summarised by age, tour date or hotel."""
+    by = request.args.get('by', 'age')
+    if by not in GROUPINGS:
+        by = 'age'
+    hotel = request.args.get('hotel', '').strip()
+    criteria = [Reservation.hotel == hotel] if hotel else []
+    per_page = request.args.get('per_page', type=int) or current_app.config['DASHBOARD_PAGE_SIZE']
+    per_page = max(1, min(per_page, current_app.config['DASHBOARD_MAX_PAGE_SIZE']))
+    filters = {k: v for k, v in request.args.items() if k in ('by', 'hotel', 'per_page') and v}
+    reservations = Reservation.query.filter(unpaid_filter(), *criteria)
+    try:
+        page = paginate(reservations, after=request.args.get('after'),
+                        before=request.args.get('before'), per_page=per_page)
+    except ValueError:
+        page = paginate(reservations, per_page=per_page)
+    return render_template('receivables.html', summary=receivables(by, date.today(), criteria), page=page,
+                           filters=filters, groupings=GROUPINGS)
+
+
+def job_payload(job):
+    payload = job.to_dict()
+    payload['status_url'] = url_for('main.export_job_status', job_id=job.id)
+    if job.status == 'done':
+        payload['download_url'] = url_for('main.export_job_download', job_id=job.id)
+    return payload
+
+
+@bp.route('/export/jobs', methods=['POST'])
+@login_required
+def export_job_create():
+    try:
+        year = int(request.form.get('year'))
+        month = int(request.form.get('month'))
+        month_filter(year, month)
+    except (TypeError, ValueError):
+        return jsonify(error='year and month are required'), 400
+    fmt = 'csv' if request.form.get('format') == 'csv' else 'xlsx'
+    job = submit_month_export(year, month, fmt)
+    return jsonify(job_payload(job)), 202
+
+
+@bp.route('/export/jobs/<job_id>')
+@login_required
+def export_job_status(job_id):
+    job = current_app.extensions['export_jobs'].get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job_payload(job))
+
+
+@bp.route('/export/jobs/<job_id>/page')
+@login_required
+def export_job_page(job_id):
+    """Browser-facing progress page for an export that outlived EXPORT_INLINE_WAIT."""
+    job = current_app.extensions['export_jobs'].get(job_id)
+    if job is None:
+        abort(404)
+    return render_template('job.html', job=job, title='Export in progress',
+                           download_url=url_for('main.export_job_download', job_id=job.id))
+
+
+@bp.route('/export/jobs/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    job = current_app.extensions['export_jobs'].get(job_id)
+    if job is None:
+        abort(404)
+    if job.status != 'done':
+        return jsonify(job_payload(job)), 409
+    return send_job_artifact(job)
+
+
+@bp.route('/api/stats')
+def stats():
+    """Revenue/paid/outstanding/pax totals and breakdowns for a month or date range.
+
+    Accepts ``year`` and ``month``, or inclusive ISO ``start`` and ``end``
+    dates; defaults to the current month.
+    """
+    # A JSON client gets a 401 like the rest of the API, not the login page
+    if not current_user.is_authenticated:
+        return jsonify(error='authentication required'), 401
+    try:
+        if request.args.get('start') and request.args.get('end'):
+            start = date.fromisoformat(request.args['start'])
+            end = date.fromisoformat(request.args['end']) + timedelta(days=1)
+        else:
+            today = date.today()
+            year = request.args.get('year', today.year, type=int)
+            month = request.args.get('month', today.month, type=int)
+            start, end = month_range(year, month)
+    except ValueError:
+        return jsonify(error='invalid period'), 400
+    if end <= start:
+        return jsonify(error='end must not be before start'), 400
+    payload = current_app.extensions['stats_cache'].get_or_set(
+        versioned((start, end)), lambda: period_stats(start, end))
+    return jsonify(payload)
@@ -0,0 +1,106 @@
+import re
+from flask import current_app
+from sqlalchemy import DDL, event, inspect, select, text, table, column, func, literal, literal_column, false
+from .models import Reservation
+from . import db
+
+SEARCH_COLUMNS = ('customer_name', 'hotel', 'tour_option')
+
+# SQLite: an external-content FTS5 index over the searchable columns, kept in
+# step with the reservation table by triggers so every write path (forms,
+# bulk inserts, raw SQL) updates it in the same transaction.
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS reservation_fts USING fts5(
+        customer_name, hotel, tour_option,
+        content='reservation', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS reservation_fts_ai AFTER INSERT ON reservation BEGIN
+        INSERT INTO reservation_fts(rowid, customer_name, hotel, tour_option)
+        VALUES (new.id, new.customer_name, new.hotel, new.tour_option);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reservation_fts_ad AFTER DELETE ON reservation BEGIN
+        INSERT INTO reservation_fts(reservation_fts, rowid, customer_name, hotel, tour_option)
+        VALUES ('delete', old.id, old.customer_name, old.hotel, old.tour_option);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS reservation_fts_au AFTER UPDATE OF customer_name, hotel, tour_option
+    ON reservation BEGIN
+        INSERT INTO reservation_fts(reservation_fts, rowid, customer_name, hotel, tour_option)
+        VALUES ('delete', old.id, old.customer_name, old.hotel, old.tour_option);
+        INSERT INTO reservation_fts(rowid, customer_name, hotel, tour_option)
+        VALUES (new.id, new.customer_name, new.hotel, new.tour_option);
+    END""",
+]
+
+# Postgres: a trigram GIN index over the concatenated columns serves ILIKE
+# '%q%' without a sequential scan and gives similarity() for ranking.
+PG_SEARCH_EXPR = "(customer_name || ' ' || coalesce(hotel, '') || ' ' || tour_option)"
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_reservation_search_trgm ON reservation USING gin ({PG_SEARCH_EXPR} gin_trgm_ops)",
+]
+
+for statement in SQLITE_DDL:
+    event.listen(Reservation.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_DDL:
+    event.listen(Reservation.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(Reservation.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS reservation_fts').execute_if(dialect='sqlite'))
+
+fts = table('reservation_fts', column('rowid'), column('rank'))
+_backends = {}
+
+
+def search_backend(engine):
+    """Return 'fts5', 'trigram' or 'like' depending on what the database provides."""
+    key = str(engine.url)
+    if key not in _backends:
+        backend = 'like'
+        if engine.dialect.name == 'sqlite' and inspect(engine).has_table('reservation_fts'):
+            backend = 'fts5'
+        elif engine.dialect.name == 'postgresql':
+            with engine.connect() as conn:
+                if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+                    backend = 'trigram'
+        _backends[key] = backend
+    return _backends[key]
+
+
+def fts_match_expression(q):
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    words = re.findall(r'\w+', q)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def apply_search(query, q):
+    """Filter ``query`` to reservations matching ``q``, best matches first.
+
+    With FTS5, results are ordered by bm25 relevance as long as there are at
+    most SEARCH_RANK_LIMIT hits. Scoring every hit of a very common term (a
+    popular hotel, a tour name) costs far more than the ordering is worth,
+    so those searches come back newest-first straight from the index.
+    """
+    backend = search_backend(db.engine)
+    if backend == 'fts5':
+        match = fts_match_expression(q)
+        if not match:
+            return query.filter(false())
+        matches = text('reservation_fts MATCH :match').bindparams(match=match)
+        hit_count = db.session.execute(select(func.count()).select_from(fts).where(matches)).scalar()
+        hits = select(fts.c.rowid, fts.c.rank).where(matches).subquery()
+        query = query.join(hits, hits.c.rowid == Reservation.id)
+        if hit_count <= current_app.config['SEARCH_RANK_LIMIT']:
+            return query.order_by(hits.c.rank, hits.c.rowid.desc())
+        return query.order_by(hits.c.rowid.desc())
+
+    pattern = f"%{q}%"
+    if backend == 'trigram':
+        expr = literal_column(PG_SEARCH_EXPR)
+        return (query.filter(expr.op('ILIKE')(pattern))
+                .order_by(func.similarity(expr, literal(q)).desc(), Reservation.id.desc()))
+    return query.filter(
+        (Reservation.customer_name.ilike(pattern)) |
+        (Reservation.hotel.ilike(pattern)) |
+        (Reservation.tour_option.ilike(pattern))
+    ).order_by(Reservation.date.desc(), Reservation.id.desc())
+
@@ -0,0 +1,135 @@
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'rate limit exceeded, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class VerifierBusy(Exception):
+    """Raised when every password-hashing slot is taken."""
+
+
+def parse_rate(value):
+    """Parse 'attempts/seconds' (e.g. '10/60') into (capacity, refill per second)."""
+    attempts, _, seconds = value.partition('/')
+    capacity = int(attempts)
+    return capacity, capacity / float(seconds or 60)
+
+
+class MemoryRateLimitBackend:
+    """Token buckets held in process memory.
+
+    Any object with the same ``consume`` signature can be configured through
+    RATE_LIMIT_BACKEND instead, e.g. one backed by Redis so that all workers
+    share the same buckets.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        """Take ``cost`` tokens from ``key``'s bucket; return seconds to wait, or 0 if allowed."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                return (cost - tokens) / refill_rate
+            self._buckets[key] = (tokens - cost, now)
+            if len(self._buckets) > self.max_keys:
+                self._evict_full(now, refill_rate, capacity)
+            return 0
+
+    def _evict_full(self, now, refill_rate, capacity):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * refill_rate >= capacity:
+                del self._buckets[key]
+
+
+def load_backend(path):
+    """Instantiate a rate-limit backend from a 'module:Class' path."""
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)()
+
+
+class LoginThrottle:
+    """Per-IP and per-username token buckets for login attempts."""
+
+    def __init__(self, backend, ip_rate, user_rate):
+        self.backend = backend
+        self.ip_rate = parse_rate(ip_rate)
+        self.user_rate = parse_rate(user_rate)
+
+    def check(self, ip, username):
+        """Consume one attempt for both the client IP and the username, or raise RateLimitExceeded."""
+        wait = max(self.backend.consume(f'login:ip:{ip}', *self.ip_rate),
+                   self.backend.consume(f'login:user:{username.lower()}', *self.user_rate))
+        if wait:
+            raise RateLimitExceeded(int(wait) + 1)
+
+
+class PasswordVerifier:
+    """Runs password hash checks on a small, bounded thread pool.
+
+    Hashing is deliberately expensive; capping concurrent checks at
+    ``workers`` (plus ``queue`` waiting) keeps a flood of logins from
+    consuming every CPU and request thread. Checks beyond that fail fast
+    with VerifierBusy. A queued check still holds its caller's request
+    thread, so ``workers + queue`` must stay below the server's thread count
+    (WEB_THREADS) for other requests to get through.
+    """
+
+    def __init__(self, workers=2, queue=2, method='scrypt'):
+        self.method = method
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-check')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._dummy = None
+
+    @property
+    def _dummy_hash(self):
+        # Compared against when the user does not exist, so that both paths cost the same
+        if self._dummy is None:
+            self._dummy = generate_password_hash('not-a-real-password', method=self.method)
+        return self._dummy
+
+    @property
+    def prefix(self):
+        """Method/parameter prefix of hashes produced with the configured method."""
+        return self._dummy_hash.split('$', 1)[0]
+
+    def verify(self, password_hash, password, timeout=30):
+        """Check ``password`` against ``password_hash``; raise VerifierBusy if no slot frees up in time.
+
+        The slot is held until the check has actually finished, not just
+        until we stop waiting for it, so timed-out checks still count
+        against the cap.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise VerifierBusy()
+        try:
+            future = self.executor.submit(check_password_hash, password_hash or self._dummy_hash, password)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=timeout) and password_hash is not None
+        except FutureTimeout:
+            future.cancel()
+            raise VerifierBusy()
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.prefix
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
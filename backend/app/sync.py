@@ -0,0 +1,169 @@
+"""Delta sync: a change sequence on reservation plus tombstones for deletes.
+
+Every insert and update stamps the row's change_seq with the next value of
+the 'reservation_change' counter in data_version. Every delete records a
+tombstone stamped the same way. A client that remembers the highest sequence
+it has seen asks for everything above it and gets only what changed since.
+
+The counter is a single row that every writer updates, and its lock is held
+until commit. Sequences are therefore committed in increasing order, and a
+reader can never skip a smaller sequence that commits later.
+
+Rows moved to the archive (archive.py) are not deleted bookings, so they
+must not reach clients as tombstones. archive_month() raises the ARCHIVING
+marker in data_version inside its own transaction. The delete trigger skips
+the tombstone while the marker is up, and other transactions never see it
+raised.
+"""
+from contextlib import contextmanager
+from sqlalchemy import DDL, delete, event, func, insert, select, update
+from .models import DataVersion, Reservation, ReservationTombstone
+from .versions import EDITABLE_COLUMNS
+from . import db
+
+COUNTER = 'reservation_change'
+ARCHIVING = 'reservation_archiving'
+
+_NEXT = f"UPDATE data_version SET version = version + 1 WHERE name = '{COUNTER}';"
+_CURRENT = f"(SELECT version FROM data_version WHERE name = '{COUNTER}')"
+_ARCHIVING = f"EXISTS (SELECT 1 FROM data_version WHERE name = '{ARCHIVING}' AND version > 0)"
+
+SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_change_ai AFTER INSERT ON reservation BEGIN
+        {_NEXT}
+        UPDATE reservation SET change_seq = {_CURRENT} WHERE id = new.id;
+        DELETE FROM reservation_tombstone WHERE id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_change_au AFTER UPDATE OF {EDITABLE_COLUMNS} ON reservation BEGIN
+        {_NEXT}
+        UPDATE reservation SET change_seq = {_CURRENT} WHERE id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_change_ad AFTER DELETE ON reservation WHEN NOT {_ARCHIVING} BEGIN
+        {_NEXT}
+        INSERT OR REPLACE INTO reservation_tombstone (id, change_seq, deleted_at)
+        VALUES (old.id, {_CURRENT}, CURRENT_TIMESTAMP);
+    END""",
+]
+
+POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION reservation_change_stamp() RETURNS trigger AS $$
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = '{COUNTER}' RETURNING version INTO NEW.change_seq;
+        IF TG_OP = 'INSERT' THEN
+            DELETE FROM reservation_tombstone WHERE id = NEW.id;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    f"""CREATE OR REPLACE FUNCTION reservation_change_tombstone() RETURNS trigger AS $$
+    DECLARE
+        seq integer;
+    BEGIN
+        IF {_ARCHIVING} THEN
+            RETURN NULL;
+        END IF;
+        UPDATE data_version SET version = version + 1 WHERE name = '{COUNTER}' RETURNING version INTO seq;
+        INSERT INTO reservation_tombstone (id, change_seq, deleted_at) VALUES (OLD.id, seq, now())
+        ON CONFLICT (id) DO UPDATE SET change_seq = excluded.change_seq, deleted_at = excluded.deleted_at;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS reservation_change ON reservation",
+    """CREATE TRIGGER reservation_change BEFORE INSERT OR UPDATE ON reservation
+    FOR EACH ROW EXECUTE FUNCTION reservation_change_stamp()""",
+    "DROP TRIGGER IF EXISTS reservation_change_delete ON reservation",
+    """CREATE TRIGGER reservation_change_delete AFTER DELETE ON reservation
+    FOR EACH ROW EXECUTE FUNCTION reservation_change_tombstone()""",
+]
+
+
+def install_change_tracking(connection):
+    """Create the counter and triggers. The counter starts above every id, so
+    existing rows can be backfilled with change_seq = id (see migrations.py)."""
+    if connection.execute(select(DataVersion.name).where(DataVersion.name == COUNTER)).first() is None:
+        top = connection.execute(select(func.coalesce(func.max(Reservation.id), 0))).scalar()
+        connection.execute(insert(DataVersion).values(name=COUNTER, version=top))
+    if connection.execute(select(DataVersion.name).where(DataVersion.name == ARCHIVING)).first() is None:
+        connection.execute(insert(DataVersion).values(name=ARCHIVING, version=0))
+    for statement in {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(connection.dialect.name, []):
+        connection.execute(DDL(statement))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _tombstones_created(target, connection, tables=(), **kw):
+    if ReservationTombstone.__table__ in tables:
+        install_change_tracking(connection)
+
+
+@contextmanager
+def without_tombstones():
+    """Deletes inside the block leave no tombstone; for rows that move to the archive.
+
+    The marker is raised and lowered in the session's current transaction,
+    so a rollback lowers it too.
+    """
+    marker = update(DataVersion).where(DataVersion.name == ARCHIVING)
+    db.session.execute(marker.values(version=1))
+    yield
+    db.session.execute(marker.values(version=0))
+
+
+def current_seq():
+    return db.session.execute(select(DataVersion.version).where(DataVersion.name == COUNTER)).scalar() or 0
+
+
+def changes_since(since, limit, columns):
+    """Up to ``limit`` changes after sequence ``since``, oldest first.
+
+    Returns (rows, deleted ids, cursor, more): ``rows`` are Core rows of
+    ``columns`` followed by change_seq, and ``cursor`` is the sequence to
+    ask from next time.
+    """
+    rows = db.session.execute(
+        select(*columns, Reservation.change_seq).where(Reservation.change_seq > since)
+        .order_by(Reservation.change_seq).limit(limit + 1)).all()
+    tombstones = db.session.execute(
+        select(ReservationTombstone.id, ReservationTombstone.change_seq)
+        .where(ReservationTombstone.change_seq > since)
+        .order_by(ReservationTombstone.change_seq).limit(limit + 1)).all()
+    # Both lists are sorted by sequence; keep the ``limit`` lowest overall
+    merged = sorted([(row[-1], row) for row in rows] + [(seq, None, rid) for rid, seq in tombstones],
+                    key=lambda change: change[0])
+    more = len(merged) > limit
+    merged = merged[:limit]
+    upserts = [change[1] for change in merged if change[1] is not None]
+    deletes = [change[2] for change in merged if change[1] is None]
+    cursor = merged[-1][0] if merged else since
+    return upserts, deletes, cursor, more
+
+
+class SyncConflict(Exception):
+    """The row changed (or was deleted) since the client last saw it."""
+
+
+def apply_update(reservation_id, values, base_seq=None):
+    """Update a reservation, only if it is still at ``base_seq`` when one is given."""
+    stmt = update(Reservation.__table__).where(Reservation.id == reservation_id).values(**values)
+    if base_seq is not None:
+        stmt = stmt.where(Reservation.change_seq == base_seq)
+    if db.session.execute(stmt).rowcount != 1:
+        db.session.rollback()
+        raise SyncConflict()
+
+
+def apply_delete(reservation_id, base_seq=None):
+    stmt = delete(Reservation.__table__).where(Reservation.id == reservation_id)
+    if base_seq is not None:
+        stmt = stmt.where(Reservation.change_seq == base_seq)
+    if db.session.execute(stmt).rowcount != 1:
+        db.session.rollback()
+        raise SyncConflict()
+
+
+def is_deleted(reservation_id):
+    return db.session.get(ReservationTombstone, reservation_id) is not None
+
+
+def row_seq(reservation_id):
+    return db.session.execute(select(Reservation.change_seq).where(Reservation.id == reservation_id)).scalar()
+
@@ -0,0 +1,53 @@
+from sqlalchemy import DDL, event, inspect, insert, select
+from .models import DataVersion, Reservation
+from . import db
+
+# Columns a user edit can change. change_seq is written by sync.py's own
+# trigger after every write and must not count as a second change.
+EDITABLE_COLUMNS = ', '.join(c.name for c in Reservation.__table__.columns
+                             if c.name not in ('id', 'change_seq') and c.computed is None)
+
+# Statement-level where the database has it (Postgres), row-level on SQLite.
+# Either way the bump commits or rolls back with the write that caused it, so
+# every process sees the same counter.
+SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS reservation_version_{suffix} AFTER {operation} ON reservation BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'reservation';
+    END"""
+    for suffix, operation in (('ai', 'INSERT'), ('ad', 'DELETE'), ('au', f'UPDATE OF {EDITABLE_COLUMNS}'))
+]
+
+POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION reservation_version_bump() RETURNS trigger AS $$
+    BEGIN
+        UPDATE data_version SET version = version + 1 WHERE name = 'reservation';
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS reservation_version ON reservation",
+    """CREATE TRIGGER reservation_version AFTER INSERT OR UPDATE OR DELETE ON reservation
+    FOR EACH STATEMENT EXECUTE FUNCTION reservation_version_bump()""",
+]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _versions_created(target, connection, tables=(), **kw):
+    if DataVersion.__table__ not in tables:
+        return
+    connection.execute(insert(DataVersion).values(name='reservation', version=1))
+    for statement in {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(connection.dialect.name, []):
+        connection.execute(DDL(statement))
+
+
+_available = {}
+
+
+def data_version(name='reservation'):
+    """Current change counter for ``name``, or None if this database does not track it."""
+    key = str(db.engine.url)
+    if key not in _available:
+        _available[key] = (db.engine.dialect.name in ('sqlite', 'postgresql')
+                           and inspect(db.engine).has_table(DataVersion.__tablename__))
+    if not _available[key]:
+        return None
+    return db.session.execute(select(DataVersion.version).where(DataVersion.name == name)).scalar()
@@ -0,0 +1,168 @@
+"""Reservation vouchers as PDF, laid out like the browser voucher (js/views/voucher.js).
+
+Rendered files are cached on disk under the SHA-256 of exactly what the
+voucher prints. Reprinting an unchanged reservation serves the cached file
+without rendering. Any edit to a printed field gives a new key, so a stale
+voucher is never served. The misses of a batch are rendered on a small
+thread pool shared by the app.
+
+The PDF writer only has the built-in Latin fonts. A voucher whose text they
+cannot show (see printable()) is served as the HTML page in
+templates/voucher.html instead, which the browser prints with its own fonts.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from .models import Reservation
+from .pdf import Page, encodable, fit
+from . import db
+
+# Bump when the layout changes, so cached files from the old layout are not reused
+LAYOUT_VERSION = 1
+
+VOUCHER_COLUMNS = ('id', 'customer_name', 'contact', 'created_at', 'tour_option', 'date', 'hotel', 'room_number',
+                   'pax', 'payment_status', 'paid_amount')
+
+PRIMARY = '#0f172a'
+SECONDARY = '#64748b'
+ACCENT = '#fbbf24'
+RULE = '#dddddd'
+MUTED = '#888888'
+
+
+def format_currency(amount):
+    """USD with thousands separators, like FinancialService.formatCurrency."""
+    amount = amount or 0
+    return f"{'-' if amount < 0 else ''}${abs(amount):,.2f}"
+
+
+def voucher_fields(row):
+    """The printed text of a voucher for a reservation row (ORM object or Core row)."""
+    def day(value):
+        return value.strftime('%d/%m/%Y') if value else 'N/A'
+    return {
+        'id': str(row.id),
+        'customer': row.customer_name or '',
+        'phone': row.contact or '',
+        'booked': day(row.created_at),
+        'tour': row.tour_option or '',
+        'travel_date': day(row.date),
+        'hotel_room': f"{row.hotel or ''}, Room {row.room_number or ''}",
+        'pax': '' if row.pax is None else str(row.pax),
+        'status': (row.payment_status or '').replace('_', ' '),
+        'paid': format_currency(row.paid_amount),
+    }
+
+
+def printable(fields):
+    """Whether every field of a voucher can be rendered to PDF."""
+    return all(encodable(value) for value in fields.values())
+
+
+def content_key(fields):
+    payload = json.dumps([LAYOUT_VERSION, fields], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_voucher(fields):
+    """Lay out one voucher on an A4 page and return the PDF bytes."""
+    page = Page()
+    left, right, middle = 56, page.width - 56, page.width / 2
+    page.text(middle, 96, 'RESERVATION VOUCHER', font='bold', size=24, color=PRIMARY, align='center')
+    page.text(middle, 120, 'DANIEL TRAVEL - Adventure Awaits', size=11, color='#666666', align='center')
+    page.line(left, 140, right, 140, width=2, color=ACCENT)
+
+    column_width = middle - left - 16
+    columns = (
+        (left, [('RESERVATION ID', fields['id']), ('CUSTOMER NAME', fields['customer']),
+                ('PHONE', fields['phone']), ('BOOKING DATE', fields['booked'])]),
+        (middle + 8, [('TOUR OPTION', fields['tour']), ('TRAVEL DATE', fields['travel_date']),
+                      ('HOTEL & ROOM', fields['hotel_room']), ('NUMBER OF PEOPLE', fields['pax']),
+                      ('PAYMENT STATUS', fields['status'])]),
+    )
+    for x, details in columns:
+        y = 180
+        for label, value in details:
+            page.text(x, y, label, size=8, color=SECONDARY)
+            page.text(x, y + 17, fit(value, 'bold', 13, column_width), font='bold', size=13, color=PRIMARY)
+            y += 46
+
+    page.line(left, 430, right, 430, width=2, color=RULE, dash=(6, 4))
+    page.text(right, 462, 'TOTAL AMOUNT PAID', size=8, color=SECONDARY, align='right')
+    page.text(right, 494, fields['paid'], font='bold', size=26, color=PRIMARY, align='right')
+    page.text(middle, 560, 'Thank you for choosing DANIEL TRAVEL!', font='italic', size=11, color=MUTED,
+              align='center')
+    return page.to_pdf()
+
+
+def voucher_query():
+    table = Reservation.__table__
+    return select(*(table.c[name] for name in VOUCHER_COLUMNS))
+
+
+def reservation_voucher_fields(reservation_id):
+    row = db.session.execute(voucher_query().where(Reservation.id == reservation_id)).first()
+    return None if row is None else voucher_fields(row)
+
+
+def day_voucher_fields(day):
+    """Voucher fields for every reservation travelling on ``day``, grouped by tour for the print run."""
+    stmt = voucher_query().where(Reservation.date == day).order_by(Reservation.tour_option, Reservation.hotel,
+                                                                    Reservation.id)
+    return [voucher_fields(row) for row in db.session.execute(stmt)]
+
+
+class VoucherRenderer:
+    """Renders vouchers through a content-addressed disk cache."""
+
+    def __init__(self, cache_dir, max_workers=2, ttl=30 * 86400):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='voucher')
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.pdf')
+
+    def get(self, fields):
+        """Return (key, path) of the voucher for ``fields``, rendering it on a cache miss."""
+        key = content_key(fields)
+        path = self.path(key)
+        try:
+            # Refresh the mtime so prune() keeps vouchers that are still being reprinted
+            os.utime(path)
+        except FileNotFoundError:
+            self._store(path, render_voucher(fields))
+        return key, path
+
+    def get_many(self, fields_list):
+        """Like get() for many vouchers, rendering the misses on the pool. Keeps the input order."""
+        return list(self._executor.map(self.get, fields_list))
+
+    def _store(self, path, data):
+        # Written under a temporary name and renamed, so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def prune(self):
+        """Delete cached vouchers not used for VOUCHER_CACHE_TTL seconds."""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for directory, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
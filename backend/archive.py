@@ -0,0 +1,31 @@
+import argparse
+from app import create_app
+from app.archive import ArchiveError, archivable_months, archive_cutoff, archive_month
+from app.models import ArchivedMonth
+
+parser = argparse.ArgumentParser(description='Move closed months of reservations to compressed archive files.')
+parser.add_argument('--month', help='archive only this month (YYYY-MM)')
+parser.add_argument('--dry-run', action='store_true', help='list the months that would be archived')
+parser.add_argument('--list', action='store_true', help='list the months already archived')
+args = parser.parse_args()
+
+app = create_app()
+with app.app_context():
+    if args.list:
+        for entry in ArchivedMonth.query.order_by(ArchivedMonth.year, ArchivedMonth.month):
+            print(f'{entry.year}-{entry.month:02d}: {entry.rows} rows in {entry.filename}')
+    else:
+        if args.month:
+            year, month = (int(part) for part in args.month.split('-'))
+            months = [(year, month)]
+        else:
+            months = archivable_months()
+            print(f'Months before {archive_cutoff():%Y-%m} can be archived')
+        for year, month in months:
+            if args.dry_run:
+                print(f'{year}-{month:02d}')
+                continue
+            try:
+                print(f'{year}-{month:02d}: {archive_month(year, month)} rows archived', flush=True)
+            except ArchiveError as exc:
+                parser.exit(1, f'{exc}\n')
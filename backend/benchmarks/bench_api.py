@@ -0,0 +1,101 @@
+"""Compare the JSON API with the HTML dashboard: payload size and latency.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_api --rows 100000 --per-page 50 200
+
+Seeds a throwaway SQLite database, then for each page size times the
+dashboard page, the full API listing and a sparse ``fields=`` listing
+through the test client (median of ``--repeat`` requests) and reports the
+response sizes. It also times serialization alone: hydrating ORM objects
+and converting them to dicts versus the API's Core-row serializer.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.generator import seed_database
+
+SPARSE = 'id,date,customer_name,amount,paid_amount'
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--per-page', type=int, nargs='+', default=[50, 200])
+    args = parser.parse_args()
+
+    os.environ['TESTING'] = '1'
+    os.environ.setdefault('LOGIN_IP_RATE', '1000000/1')
+    os.environ.setdefault('LOGIN_USER_RATE', '1000000/1')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app, db
+        from app.api import FIELDS, columns, row_serializer
+        from app.models import Reservation, User
+        from sqlalchemy import select
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, args.rows)
+            db.session.remove()
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        app.extensions['fragment_cache'].maxsize = 0  # measure rendering, not the cache
+
+        for per_page in args.per_page:
+            routes = {
+                'html dashboard': f'/dashboard?per_page={per_page}',
+                'api full': f'/api/v1/reservations?per_page={per_page}',
+                'api sparse': f'/api/v1/reservations?per_page={per_page}&fields={SPARSE}',
+            }
+            print(f"per_page={per_page}")
+            for name, url in routes.items():
+                ms, rv = timed(lambda: client.get(url), args.repeat)
+                print(f"    {name:15} {ms:8.2f}ms {len(rv.data):>9,} bytes")
+
+            with app.app_context():
+                def orm():
+                    rows = (Reservation.query.order_by(Reservation.date.desc(), Reservation.id.desc())
+                            .limit(per_page).all())
+                    items = []
+                    for r in rows:
+                        item = {name: getattr(r, name) for name in FIELDS}
+                        item['date'] = r.date.isoformat()
+                        item['created_at'] = r.created_at.isoformat() if r.created_at else None
+                        items.append(item)
+                    db.session.expunge_all()
+                    return items
+
+                serialize = row_serializer(FIELDS)
+                stmt = (select(*columns(FIELDS))
+                        .order_by(Reservation.date.desc(), Reservation.id.desc()).limit(per_page))
+
+                def core():
+                    return [serialize(row) for row in db.session.execute(stmt)]
+
+                orm_ms, _ = timed(orm, args.repeat)
+                core_ms, _ = timed(core, args.repeat)
+                print(f"    serialize: orm={orm_ms:.2f}ms core={core_ms:.2f}ms speedup={orm_ms / core_ms:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
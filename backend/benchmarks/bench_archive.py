@@ -0,0 +1,86 @@
+"""Time exports and reports of a closed year before and after archiving it.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_archive --rows 300000
+
+Seeds a throwaway SQLite database (2024-2026) and times the busiest month's
+CSV export, the 2024 yearly report and a mid-month stats query. Then it
+moves every month of 2024 to Parquet files and runs them again. Also reports
+the time to archive, the size of the files, and how the database file shrank
+after VACUUM.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+
+from benchmarks.generator import seed_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000)
+    args = parser.parse_args()
+
+    os.environ['TESTING'] = '1'
+    os.environ.setdefault('LOGIN_IP_RATE', '1000000/1')
+    os.environ.setdefault('LOGIN_USER_RATE', '1000000/1')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+        os.environ['ARCHIVE_DIR'] = os.path.join(tmp, 'archive')
+        os.environ['EXPORT_ARTIFACT_DIR'] = os.path.join(tmp, 'exports')
+        from app import create_app, db
+        from app.archive import archive_month
+        from app.models import Reservation, User
+        from sqlalchemy import extract, func, select, text
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, args.rows)
+            month = extract('month', Reservation.date)
+            busiest = int(db.session.execute(
+                select(month).where(Reservation.date < date(2025, 1, 1)).group_by(month)
+                .order_by(func.count().desc()).limit(1)).scalar())
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+        def timed(label, request):
+            t0 = time.perf_counter()
+            rv = request()
+            assert rv.status_code == 200
+            print(f'    {label:24} {(time.perf_counter() - t0) * 1000:8.1f}ms {len(rv.data):>11,} bytes')
+
+        def run(title):
+            print(title)
+            app.extensions['stats_cache'].invalidate()
+            timed(f'export 2024-{busiest:02d} csv', lambda: client.post(
+                '/export', data={'year': '2024', 'month': str(busiest), 'format': 'csv'}))
+            timed('yearly report 2024', lambda: client.get('/reports/2024'))
+            timed('stats 2024-03-10..05-20', lambda: client.get('/api/stats?start=2024-03-10&end=2024-05-20'))
+
+        run('hot table')
+        with app.app_context():
+            t0 = time.perf_counter()
+            moved = sum(archive_month(2024, m, today=date(2026, 1, 1)) for m in range(1, 13))
+            elapsed = time.perf_counter() - t0
+            before = os.path.getsize(db_path)
+            db.session.execute(text('VACUUM'))
+            after = os.path.getsize(db_path)
+            remaining = db.session.query(func.count(Reservation.id)).scalar()
+        files = sum(entry.stat().st_size for entry in os.scandir(os.environ['ARCHIVE_DIR']))
+        print(f'archived {moved:,} rows of 2024 in {elapsed:.1f}s: '
+              f'{files:,} bytes of Parquet, database {before:,} -> {after:,} bytes, {remaining:,} rows left')
+        run('archived')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Mixed dashboard reads and reservation writes from several threads.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_concurrency --readers 8 --writers 4 --seconds 10
+    python -m benchmarks.bench_concurrency --untuned      # SQLite defaults, for comparison
+
+Each thread logs in with its own test client and loops for ``--seconds``:
+readers fetch the dashboard (alternating unfiltered and month-filtered),
+writers post new reservations. Reports throughput, p50/p95 latency and the
+number of failed requests (e.g. "database is locked").
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+UNTUNED = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT': '0',
+    'SQLITE_CACHE_SIZE': '-2000',
+    'SQLITE_MMAP_SIZE': '0',
+}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def worker(app, kind, clock, results, index):
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+    # Start the clock only once every thread has logged in
+    clock['barrier'].wait()
+    deadline = clock['deadline']
+    latencies, failures = [], 0
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            if kind == 'read':
+                url = '/dashboard' if i % 2 else '/dashboard?month=6&year=2026'
+                ok = client.get(url).status_code == 200
+            else:
+                rv = client.post('/add', data={
+                    'tour_option': 'Red tour', 'date': f'2026-06-{1 + i % 28:02d}', 'hotel': 'Bench Hotel',
+                    'customer_name': f'Writer {index}-{i}', 'pax': '2', 'amount': '100', 'paid_amount': '0',
+                    'payment_status': 'Pending', 'payment_method': 'Cash',
+                })
+                ok = rv.status_code == 302
+        except Exception:
+            ok = False
+        latencies.append((time.perf_counter() - t0) * 1000)
+        failures += not ok
+    results[kind].append((latencies, failures))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed-rows', type=int, default=20000)
+    parser.add_argument('--untuned', action='store_true', help='use SQLite defaults instead of the tuned PRAGMAs')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TESTING'] = '1'
+        # Benchmarks log in far more often than the production login throttle allows
+        os.environ.setdefault('LOGIN_IP_RATE', '1000000/1')
+        os.environ.setdefault('LOGIN_USER_RATE', '1000000/1')
+        if args.untuned:
+            os.environ.update(UNTUNED)
+        from app import create_app, db
+        from app.models import User
+        from benchmarks.generator import seed_database
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, args.seed_rows)
+
+        results = {'read': [], 'write': []}
+        clock = {}
+        clock['barrier'] = threading.Barrier(
+            args.readers + args.writers,
+            action=lambda: clock.update(deadline=time.perf_counter() + args.seconds))
+        threads = [threading.Thread(target=worker, args=(app, 'read', clock, results, i))
+                   for i in range(args.readers)]
+        threads += [threading.Thread(target=worker, args=(app, 'write', clock, results, i))
+                    for i in range(args.writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        mode = 'untuned' if args.untuned else 'tuned'
+        print(f"{mode}: {args.readers} readers, {args.writers} writers, {args.seconds:.0f}s")
+        for kind in ('read', 'write'):
+            latencies = [ms for samples, _ in results[kind] for ms in samples]
+            failures = sum(f for _, f in results[kind])
+            print(f"  {kind:5}: {len(latencies) / args.seconds:7.1f} req/s "
+                  f"p50={statistics.median(latencies) if latencies else 0:7.2f}ms "
+                  f"p95={percentile(latencies, 95):7.2f}ms failed={failures}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Time a bulk import of a generated booking sheet.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_import --rows 50000
+
+Writes a CSV with ``--rows`` bookings (about 1% deliberately invalid) and
+loads it through the same read_rows/import_rows path as the /import upload
+and import_reservations.py, reporting rows per second.
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from benchmarks.generator import generate
+
+HEADER = ['Date', 'Tour Option', 'Hotel', 'Room', 'Customer', 'Contact', 'PAX',
+          'Tour Amount', 'Paid Amount', 'Payment Status', 'Payment Method']
+
+
+def write_sheet(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i, r in enumerate(generate(rows, seed=3)):
+            writer.writerow([
+                r['date'].isoformat(),
+                r['tour_option'] if i % 100 else 'Unknown tour',
+                r['hotel'], r['room_number'], r['customer_name'], r['contact'], r['pax'],
+                r['amount'], r['paid_amount'], r['payment_status'], r['payment_method'],
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app, db
+        from app.importing import read_rows, import_rows
+
+        sheet = os.path.join(tmp, 'bookings.csv')
+        write_sheet(sheet, args.rows)
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            t0 = time.perf_counter()
+            with open(sheet, 'rb') as f:
+                result = import_rows(read_rows(f, sheet), batch_size=args.batch_size)
+            elapsed = time.perf_counter() - t0
+            print(f"{result.inserted:,} inserted, {result.rejected:,} rejected in {elapsed:.2f}s "
+                  f"({args.rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Load test: dashboard latency while several large exports run.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_load --rows 200000 --threads 4 --exporters 4
+
+Serves the app from a real HTTP server with a fixed pool of request threads
+(like one gunicorn gthread worker) and starts ``--exporters`` clients that
+each export a different month while a probe client requests the dashboard
+every ``--interval`` seconds. It runs twice: once with
+EXPORT_INLINE_WAIT set high, so every export occupies a request thread until
+its file is ready (the old synchronous behaviour), and once with the default
+short wait, so exports move to the job pool and free their thread. Reported
+are the probe's latency percentiles and how long the exports took overall.
+"""
+import argparse
+import http.cookiejar
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+from benchmarks.generator import seed_database
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server handling connections on a fixed number of threads."""
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def session(base):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'username': 'bench', 'password': 'bench'}).encode()
+    opener.open(f'{base}/login', data=data).read()
+    return opener
+
+
+def export_month(opener, base, month):
+    """POST an export and, if it was handed to the job pool, poll until the file is downloadable."""
+    data = urllib.parse.urlencode({'year': '2025', 'month': str(month)}).encode()
+    response = opener.open(f'{base}/export', data=data)
+    if response.headers.get_content_type() != 'text/html':
+        response.read()
+        return
+    job_id = response.url.rstrip('/').split('/')[-2]
+    while True:
+        try:
+            opener.open(f'{base}/export/jobs/{job_id}/download').read()
+            return
+        except urllib.error.HTTPError as exc:
+            if exc.code != 409:
+                raise
+        time.sleep(0.2)
+
+
+def run(app, threads, exporters, interval):
+    server = PooledWSGIServer(('127.0.0.1', 0), threads)
+    server.set_app(app)
+    base = f'http://127.0.0.1:{server.server_port}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        probe = session(base)
+        probe.open(f'{base}/dashboard').read()
+        clients = [session(base) for _ in range(exporters)]
+
+        done = threading.Event()
+        latencies = []
+
+        def probe_loop():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                probe.open(f'{base}/dashboard').read()
+                latencies.append((time.perf_counter() - t0) * 1000)
+                time.sleep(interval)
+
+        prober = threading.Thread(target=probe_loop)
+        prober.start()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=exporters) as pool:
+            list(pool.map(lambda i: export_month(clients[i], base, 1 + i % 12), range(exporters)))
+        export_s = time.perf_counter() - t0
+        done.set()
+        prober.join()
+    finally:
+        server.shutdown()
+        server.pool.shutdown(wait=False)
+    ordered = sorted(latencies)
+    return {
+        'exports_s': export_s,
+        'probes': len(ordered),
+        'p50': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=4, help='request threads in the server')
+    parser.add_argument('--exporters', type=int, default=4)
+    parser.add_argument('--interval', type=float, default=0.05, help='pause between dashboard probes')
+    args = parser.parse_args()
+
+    os.environ['TESTING'] = '1'
+    os.environ.setdefault('LOGIN_IP_RATE', '1000000/1')
+    os.environ.setdefault('LOGIN_USER_RATE', '1000000/1')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app, db
+        from app.jobs import drain_jobs
+        from app.models import User
+
+        seed_app = create_app()
+        with seed_app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, args.rows)
+            db.session.remove()
+
+        print(f"rows={args.rows:,} request threads={args.threads} concurrent exports={args.exporters}")
+        for label, inline_wait in (('inline (old)', '600'), ('offloaded', None)):
+            if inline_wait:
+                os.environ['EXPORT_INLINE_WAIT'] = inline_wait
+            else:
+                os.environ.pop('EXPORT_INLINE_WAIT', None)
+            # Separate artifact directories, so the second run cannot reuse the first one's files
+            os.environ['EXPORT_ARTIFACT_DIR'] = os.path.join(tmp, f"exports-{label.split()[0]}")
+            app = create_app()
+            result = run(app, args.threads, args.exporters, args.interval)
+            drain_jobs(app, timeout=60)
+            print(f"{label:13} dashboard p50={result['p50']:7.1f}ms p95={result['p95']:7.1f}ms "
+                  f"max={result['max']:7.1f}ms probes={result['probes']:4} exports done in {result['exports_s']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
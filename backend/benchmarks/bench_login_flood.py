@@ -0,0 +1,156 @@
+"""Dashboard latency while a credential-stuffing flood hits /login.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_login_flood --attackers 16 --seconds 10 --threads 8
+
+The app is served over real HTTP by a server with a fixed pool of
+``--threads`` request threads, like one gunicorn gthread worker
+(WEB_THREADS). A request that finds every thread busy waits for one, so the
+numbers show whether logins can starve the rest of the app of threads, not
+only of CPU.
+
+Three phases, each ``--seconds`` long, with one client polling the
+dashboard: no flood; a flood against the bounded password verifier
+(LOGIN_HASH_WORKERS/LOGIN_HASH_QUEUE as configured); and the same flood with
+the verifier effectively unbounded (one hashing thread per attacker). The
+attackers rotate X-Forwarded-For addresses behind PROXY_FIX_HOPS=1, so the
+per-IP limiter does not stop them and only the bounded verifier protects the
+rest of the app.
+"""
+import argparse
+import http.cookiejar
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Handles each connection on a fixed pool of threads, like gunicorn's gthread worker."""
+
+    def __init__(self, app, threads):
+        super().__init__('127.0.0.1', 0, app, handler=QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def request(opener, url, data=None, headers=None):
+    """Send one request and return its status code; error statuses are results here, not failures."""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    try:
+        with opener.open(urllib.request.Request(url, data=body, headers=headers or {}), timeout=60) as rv:
+            rv.read()
+            return rv.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def attacker(base, stop, index, outcomes, interval):
+    opener = urllib.request.build_opener()
+    i = 0
+    while not stop.wait(interval):
+        i += 1
+        code = request(opener, f'{base}/login', {'username': f'victim{i % 500}', 'password': f'guess{i}'},
+                       {'X-Forwarded-For': f'10.{index}.{i // 250 % 250}.{i % 250}'})
+        outcomes[code] = outcomes.get(code, 0) + 1
+
+
+def run_phase(base, label, attackers, seconds, interval):
+    # Follows the login redirect with the session cookie, like a browser
+    client = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    request(client, f'{base}/login', {'username': 'bench', 'password': 'bench'})
+    stop = threading.Event()
+    outcomes = {}
+    threads = [threading.Thread(target=attacker, args=(base, stop, i, outcomes, interval))
+               for i in range(attackers)]
+    for t in threads:
+        t.start()
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        request(client, f'{base}/dashboard')
+        samples.append((time.perf_counter() - t0) * 1000)
+    stop.set()
+    for t in threads:
+        t.join()
+    logins = ', '.join(f'{code}={count}' for code, count in sorted(outcomes.items())) or '-'
+    print(f"{label:22} dashboard p50={statistics.median(samples):7.2f}ms p95={percentile(samples, 95):8.2f}ms "
+          f"({len(samples)} requests) logins: {logins}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attackers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '8')),
+                        help='request threads of the server (WEB_THREADS)')
+    parser.add_argument('--seed-rows', type=int, default=20000)
+    parser.add_argument('--interval-ms', type=float, default=20, help='pause between attempts per attacker')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TESTING'] = '1'
+        os.environ['WEB_THREADS'] = str(args.threads)
+        os.environ['PROXY_FIX_HOPS'] = '1'
+        from app import create_app, db
+        from app.models import User
+        from app.security import PasswordVerifier
+        from benchmarks.generator import seed_database
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, args.seed_rows)
+
+        server = PooledWSGIServer(app, args.threads)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_port}'
+        print(f"{args.threads} request threads, {app.config['LOGIN_HASH_WORKERS']} hash workers, "
+              f"queue {app.config['LOGIN_HASH_QUEUE']}")
+        try:
+            interval = args.interval_ms / 1000
+            run_phase(base, 'no flood', 0, args.seconds, interval)
+            run_phase(base, 'flood, bounded', args.attackers, args.seconds, interval)
+            app.extensions['password_verifier'] = PasswordVerifier(
+                workers=args.attackers, queue=args.attackers, method=app.config['PASSWORD_HASH_METHOD'])
+            run_phase(base, 'flood, unbounded', args.attackers, args.seconds, interval)
+        finally:
+            server.shutdown()
+            server.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compare extract()-based month filtering with the sargable date-range filter.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_month_filter --rows 10000 100000 300000
+
+For each table size a throwaway SQLite database is filled with three years
+of synthetic reservations. The old ``extract('month'/'year')`` predicate must
+evaluate every row, so its cost grows with the table; the range predicate
+seeks on the date index and only touches the requested month.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.generator import seed_database
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def run(rows, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app, db
+        from app.models import Reservation
+        from app.queries import month_filter
+        from sqlalchemy import extract, func, select
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            seed_database(db, rows)
+
+            old = select(func.count()).select_from(Reservation).where(
+                extract('year', Reservation.date) == 2025, extract('month', Reservation.date) == 6)
+            new = select(func.count()).select_from(Reservation).where(month_filter(2025, 6))
+
+            def plan(stmt):
+                compiled = stmt.compile(db.engine, compile_kwargs={'literal_binds': True})
+                rows_ = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+                return '; '.join(r[-1] for r in rows_)
+
+            old_ms = timed(lambda: db.session.execute(old).scalar(), repeat)
+            new_ms = timed(lambda: db.session.execute(new).scalar(), repeat)
+            matched = db.session.execute(new).scalar()
+            print(f"rows={rows:>9,} month_rows={matched:>6,} "
+                  f"extract={old_ms:8.2f}ms range={new_ms:8.2f}ms speedup={old_ms / new_ms:6.1f}x")
+            print(f"    extract plan: {plan(old)}")
+            print(f"    range plan:   {plan(new)}")
+            db.session.remove()
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Time dashboard searches: leading-wildcard ILIKE versus the FTS5 index.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_search --rows 500000
+
+Builds a throwaway SQLite database with ``--rows`` reservations (the FTS
+index is filled by its triggers during the load) and times a handful of
+typical search-box queries through both code paths, fetching one dashboard
+page of ranked results each time.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.generator import seed_database
+
+QUERIES = ['pera', 'maria', 'müller', 'yusuf kaya', 'bursa', 'galata', 'moda inn', 'nobody']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--per-page', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app, db
+        from app.models import Reservation
+        from app.search import apply_search
+        from app.pagination import paginate_offset
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            t0 = time.perf_counter()
+            seed_database(db, args.rows)
+            print(f"seeded {args.rows:,} rows in {time.perf_counter() - t0:.1f}s")
+
+            def ilike(q):
+                pattern = f"%{q}%"
+                return Reservation.query.filter(
+                    Reservation.customer_name.ilike(pattern) | Reservation.hotel.ilike(pattern) |
+                    Reservation.tour_option.ilike(pattern)
+                ).order_by(Reservation.date.desc(), Reservation.id.desc())
+
+            for q in QUERIES:
+                results = {}
+                for name, build in (('ilike', ilike), ('fts5', lambda q: apply_search(Reservation.query, q))):
+                    samples = []
+                    for _ in range(args.repeat):
+                        t0 = time.perf_counter()
+                        paginate_offset(build(q), per_page=args.per_page)
+                        samples.append((time.perf_counter() - t0) * 1000)
+                        db.session.expunge_all()
+                    results[name] = statistics.median(samples)
+                hits = apply_search(Reservation.query, q).count()
+                print(f"q={q!r:14} hits={hits:>7,} ilike={results['ilike']:8.2f}ms fts5={results['fts5']:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Time a cold ``create_app()`` the way a freshly forked worker or CLI script pays for it.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_startup --runs 15
+    python -m benchmarks.bench_startup --preload openpyxl   # cost of an eager import
+
+Every run is a new interpreter, so nothing is shared through sys.modules.
+The child reports the wall time of ``from app import create_app;
+create_app()`` and which heavy optional modules ended up imported; the
+export libraries should only appear after the first export request.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ('openpyxl', 'pyarrow', 'pandas', 'numpy')
+
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+from app import create_app
+create_app()
+elapsed = (time.perf_counter() - t0) * 1000
+print(json.dumps({'ms': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def boot(preload, env):
+    out = subprocess.run([sys.executable, '-c', CHILD, *preload], env=env, check=True,
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--preload', nargs='*', default=[],
+                        help='modules imported inside the timed region, to simulate eager imports')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.db')}")
+        boot(args.preload, env)  # warm the OS file cache and __pycache__
+        results = [boot(args.preload, env) for _ in range(args.runs)]
+
+    samples = sorted(r['ms'] for r in results)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"create_app cold start over {args.runs} runs: "
+          f"p50={statistics.median(samples):.1f}ms p95={p95:.1f}ms min={samples[0]:.1f}ms")
+    print(f"heavy modules loaded at startup: {', '.join(results[-1]['loaded']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
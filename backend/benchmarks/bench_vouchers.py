@@ -0,0 +1,80 @@
+"""Time the voucher print run for a busy day, cold and from the cache.
+
+Run from ``backend/``::
+
+    python -m benchmarks.bench_vouchers --rows 100000
+
+Seeds a throwaway SQLite database and picks its busiest travel date. The
+batch zip for that date is requested three times. The first request renders
+every voucher into an empty cache. The second serves them all from the
+cache. The third follows an edit to one reservation, so one voucher is
+re-rendered. Also reports the time to render one voucher and the size of
+one PDF.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.generator import seed_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200, help='single renders to time')
+    args = parser.parse_args()
+
+    os.environ['TESTING'] = '1'
+    os.environ.setdefault('LOGIN_IP_RATE', '1000000/1')
+    os.environ.setdefault('LOGIN_USER_RATE', '1000000/1')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['VOUCHER_CACHE_DIR'] = os.path.join(tmp, 'vouchers')
+        from app import create_app, db
+        from app.models import Reservation, User
+        from app.vouchers import day_voucher_fields, render_voucher
+        from sqlalchemy import func, select
+
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, args.rows)
+            busiest, count = db.session.execute(
+                select(Reservation.date, func.count()).group_by(Reservation.date)
+                .order_by(func.count().desc()).limit(1)).one()
+            fields = day_voucher_fields(busiest)[0]
+            samples = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                pdf = render_voucher(fields)
+                samples.append((time.perf_counter() - t0) * 1000)
+            print(f"one voucher: {statistics.median(samples):.2f}ms to render, {len(pdf):,} bytes")
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        url = f'/vouchers?date={busiest.isoformat()}'
+        print(f"busiest day {busiest} has {count} reservations")
+
+        def timed(label):
+            t0 = time.perf_counter()
+            rv = client.get(url)
+            assert rv.status_code == 200
+            print(f"    {label:22} {(time.perf_counter() - t0) * 1000:8.1f}ms {len(rv.data):>11,} bytes")
+
+        timed('cold cache')
+        timed('warm cache')
+        with app.app_context():
+            reservation = Reservation.query.filter_by(date=busiest).first()
+            reservation.paid_amount = (reservation.paid_amount or 0) + 1
+            db.session.commit()
+        timed('after one edit')
+
+
+if __name__ == '__main__':
+    main()
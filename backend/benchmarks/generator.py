@@ -0,0 +1,105 @@
+"""Seeded synthetic reservation data with realistic shapes.
+
+Tour options come from ReservationForm so the data always matches what the
+app accepts. Dates follow a summer-peaked season, hotels a long-tailed
+popularity curve, and payment fields are internally consistent (a "Paid"
+booking has paid_amount == amount, "Pending" has nothing paid).
+"""
+import math
+import random
+from datetime import date, datetime, timedelta
+
+from app.forms import ReservationForm
+
+TOURS = [value for value, _ in ReservationForm.tour_option.kwargs['choices']]
+# Relative popularity and per-person price of each tour
+TOUR_WEIGHTS = {
+    'Red tour': 22, 'Sapanca tour': 12, 'Green tour': 14, 'Dinner cruise': 18,
+    'Bursa tour': 8, 'IST airport transfer': 16, 'SAW airport transfer': 10,
+}
+TOUR_PRICES = {
+    'Red tour': 55, 'Sapanca tour': 65, 'Green tour': 50, 'Dinner cruise': 45,
+    'Bursa tour': 70, 'IST airport transfer': 40, 'SAW airport transfer': 35,
+}
+STATUSES = [value for value, _ in ReservationForm.payment_status.kwargs['choices']]
+STATUS_WEIGHTS = [60, 25, 15]
+METHODS = [value for value, _ in ReservationForm.payment_method.kwargs['choices']]
+METHOD_WEIGHTS = [45, 40, 15]
+PAX_WEIGHTS = [(1, 20), (2, 45), (3, 12), (4, 14), (5, 5), (6, 4)]
+
+FIRST = ['Ahmet', 'Ayşe', 'John', 'Maria', 'Olga', 'Chen', 'Fatima', 'Lucas', 'Emma', 'Yusuf',
+         'Hans', 'Sofia', 'Ivan', 'Aiko', 'Omar', 'Noah', 'Elif', 'Mehmet', 'Sara', 'David']
+LAST = ['Yılmaz', 'Kaya', 'Smith', 'Garcia', 'Ivanova', 'Wang', 'Khan', 'Silva', 'Müller', 'Rossi',
+        'Demir', 'Novak', 'Tanaka', 'Haddad', 'Brown', 'Petrov', 'Şahin', 'Öztürk', 'Dubois', 'Cohen']
+HOTELS = ['Pera Palace', 'Grand Bazaar Inn', 'Sultanahmet Suites', 'Bosphorus View', 'Taksim Plaza',
+          'Golden Horn Hotel', 'Galata Residence', 'Kadıköy Boutique', 'Sirkeci Park', 'Levent Tower']
+HOTELS += [f"{name} {kind}" for name in ('Beyoğlu', 'Fatih', 'Üsküdar', 'Beşiktaş', 'Şişli', 'Eminönü',
+                                         'Ortaköy', 'Bebek', 'Moda', 'Cihangir')
+           for kind in ('Hotel', 'Suites', 'Inn', 'Residence')]
+# Zipf-like: the first hotels get most of the bookings
+HOTEL_WEIGHTS = [1 / (rank + 1) for rank in range(len(HOTELS))]
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+def _season_weights(start, days):
+    """Daily weights peaking in mid-July and bottoming out in January."""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        weights.append(1.6 + math.cos((day.timetuple().tm_yday - 196) / 365 * 2 * math.pi))
+    return weights
+
+
+def generate(rows, seed=42, start=date(2024, 1, 1), years=3):
+    """Yield ``rows`` reservation dicts ready for ``insert(Reservation)``."""
+    rng = random.Random(seed)
+    days = years * 365
+    day_weights = _season_weights(start, days)
+    tour_weights = [TOUR_WEIGHTS[t] for t in TOURS]
+    pax_values, pax_weights = zip(*PAX_WEIGHTS)
+    # Draw the categorical columns in bulk; random.choices is far cheaper per call than per row
+    chunk = 10_000
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        day_offsets = rng.choices(range(days), weights=day_weights, k=n)
+        tours = rng.choices(TOURS, weights=tour_weights, k=n)
+        hotels = rng.choices(HOTELS, weights=HOTEL_WEIGHTS, k=n)
+        paxes = rng.choices(pax_values, weights=pax_weights, k=n)
+        statuses = rng.choices(STATUSES, weights=STATUS_WEIGHTS, k=n)
+        methods = rng.choices(METHODS, weights=METHOD_WEIGHTS, k=n)
+        for i in range(n):
+            tour, pax, status = tours[i], paxes[i], statuses[i]
+            tour_date = start + timedelta(days=day_offsets[i])
+            amount = float(TOUR_PRICES[tour] * pax)
+            paid = amount if status == 'Paid' else round(amount * 0.3, 2) if status == 'Deposit' else 0.0
+            yield {
+                'tour_option': tour,
+                'date': tour_date,
+                'hotel': hotels[i],
+                'room_number': str(rng.randrange(101, 950)),
+                'customer_name': f"{rng.choice(FIRST)} {rng.choice(LAST)}",
+                'contact': f"+90 5{rng.randrange(10**8, 10**9)}",
+                'pax': pax,
+                'amount': amount,
+                'paid_amount': paid,
+                'payment_status': status,
+                'payment_method': methods[i],
+                'created_at': datetime.combine(tour_date - timedelta(days=rng.randrange(0, 60)),
+                                               datetime.min.time()),
+            }
+
+
+def seed_database(db, rows, seed=42, batch=10_000):
+    """Insert ``rows`` generated reservations in executemany batches."""
+    from app.models import Reservation
+    buffer = []
+    for record in generate(rows, seed=seed):
+        buffer.append(record)
+        if len(buffer) >= batch:
+            db.session.execute(db.insert(Reservation), buffer)
+            db.session.commit()
+            buffer.clear()
+    if buffer:
+        db.session.execute(db.insert(Reservation), buffer)
+        db.session.commit()
@@ -0,0 +1,194 @@
+"""Latency and memory benchmark suite with stored baselines.
+
+Run from ``backend/``::
+
+    python -m benchmarks.run --size 10k                 # compare against baselines.json
+    python -m benchmarks.run --size 100k --save-baseline
+    python -m benchmarks.run --size 1m --scenario dashboard dashboard_month
+
+Databases are generated once per size with benchmarks.generator and cached
+under ``--data-dir``; every run works on a fresh copy. Each scenario is timed
+over ``--iterations`` requests through the Flask test client (p50/p95), then
+run once more under tracemalloc for its peak Python allocation. When a
+baseline exists for the size, any scenario whose p95 or peak memory exceeds
+it by more than ``--tolerance`` (plus ``--slack-ms`` for p95) is reported as
+a REGRESSION and the process exits with status 1. A p95 over a few dozen
+requests on a shared machine is noisy, so the defaults only catch slowdowns
+well beyond run-to-run jitter.
+
+Every request of a scenario gets a distinct index. The export scenario turns
+it into a distinct month of the generated data, so each request builds its
+file instead of serving the artifact cached by the previous one.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(HERE, 'baselines.json')
+SEARCH_TERMS = ['pera', 'maria kaya', 'dinner', 'moda inn', 'müller', 'nobody']
+
+
+def add_payload(i):
+    # Far-future dates keep added rows out of the month views being measured
+    return {
+        'tour_option': 'Red tour', 'date': f'2099-01-{1 + i % 28:02d}', 'hotel': 'Bench Hotel',
+        'customer_name': f'Bench Guest {i}', 'contact': '', 'pax': '2', 'amount': '110',
+        'paid_amount': '0', 'payment_status': 'Pending', 'payment_method': 'Cash',
+    }
+
+
+def export_month(i):
+    # The generator spreads reservations over the 36 months from January 2024
+    month = i % 36
+    return {'year': str(2024 + month // 12), 'month': str(month % 12 + 1)}
+
+
+SCENARIOS = {
+    'login': (10, lambda c, i: c.post('/login', data={'username': 'bench', 'password': 'bench'})),
+    'dashboard': (30, lambda c, i: c.get('/dashboard')),
+    'dashboard_search': (30, lambda c, i: c.get(f'/dashboard?q={SEARCH_TERMS[i % len(SEARCH_TERMS)]}')),
+    'dashboard_month': (30, lambda c, i: c.get(f'/dashboard?month={1 + i % 12}&year=2025')),
+    'add': (30, lambda c, i: c.post('/add', data=add_payload(i))),
+    'export': (5, lambda c, i: c.post('/export', data=export_month(i))),
+}
+EXPECTED_STATUS = {'login': 302, 'add': 302}
+
+
+def schema_key(db):
+    """Fingerprint of the table definitions, so cached databases follow schema changes."""
+    ddl = sorted(f"{t.name}:{','.join(c.name for c in t.columns)}" for t in db.metadata.tables.values())
+    return hashlib.sha1('|'.join(ddl).encode()).hexdigest()[:10]
+
+
+def prepare_database(size, rows, seed, data_dir):
+    from app import create_app, db
+    from app.models import User
+    from benchmarks.generator import seed_database
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{size}-seed{seed}-{schema_key(db)}.db")
+    if not os.path.exists(path):
+        print(f"generating {rows:,} reservations into {path} ...", flush=True)
+        os.environ['DATABASE_URL'] = f"sqlite:///{path}.tmp"
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench')
+            user.set_password('bench')
+            db.session.add(user)
+            db.session.commit()
+            seed_database(db, rows, seed=seed)
+            db.session.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+            db.session.remove()
+            db.engine.dispose()
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+def measure(client, name, iterations):
+    _, request = SCENARIOS[name]
+    expected = EXPECTED_STATUS.get(name, 200)
+    # Warm-up and memory runs use indices after the timed ones, so no request repeats another
+    for i in range(2):
+        request(client, iterations + 1 + i)
+    samples = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        rv = request(client, i)
+        samples.append((time.perf_counter() - t0) * 1000)
+        if rv.status_code != expected:
+            raise RuntimeError(f"{name}: unexpected status {rv.status_code}")
+    tracemalloc.start()
+    request(client, iterations)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    ordered = sorted(samples)
+    return {
+        'p50': round(statistics.median(ordered), 2),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        'peak_kib': round(peak / 1024),
+    }
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{name}: p95 {result['p95']}ms vs baseline {base['p95']}ms")
+        if result['peak_kib'] > base['peak_kib'] * (1 + tolerance) + 256:
+            regressions.append(f"{name}: peak {result['peak_kib']}KiB vs baseline {base['peak_kib']}KiB")
+    return regressions
+
+
+def main():
+    from benchmarks.generator import SIZES
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='10k')
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=None, help='override per-scenario iteration counts')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(HERE, '.data'))
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative slowdown (0.5 = 50%%)')
+    parser.add_argument('--slack-ms', type=float, default=10.0, help='absolute p95 slack for very fast scenarios')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    os.environ['TESTING'] = '1'
+    # Benchmarks log in far more often than the production login throttle allows
+    os.environ.setdefault('LOGIN_IP_RATE', '1000000/1')
+    os.environ.setdefault('LOGIN_USER_RATE', '1000000/1')
+    # Time each export's whole build, not its hand-off to the job pool after EXPORT_INLINE_WAIT
+    os.environ.setdefault('EXPORT_INLINE_WAIT', '600')
+    source = prepare_database(args.size, SIZES[args.size], args.seed, args.data_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        work = os.path.join(tmp, 'bench.db')
+        shutil.copy(source, work)
+        os.environ['DATABASE_URL'] = f"sqlite:///{work}"
+        os.environ['EXPORT_ARTIFACT_DIR'] = os.path.join(tmp, 'exports')
+        from app import create_app
+        app = create_app()
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+        results = {}
+        print(f"{'scenario':18} {'p50 ms':>9} {'p95 ms':>9} {'peak KiB':>9}")
+        for name in args.scenario:
+            iterations = args.iterations or SCENARIOS[name][0]
+            results[name] = measure(client, name, iterations)
+            r = results[name]
+            print(f"{name:18} {r['p50']:9.2f} {r['p95']:9.2f} {r['peak_kib']:9}", flush=True)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines.setdefault(args.size, {}).update(results)
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline for {args.size} saved to {BASELINES}")
+        return 0
+
+    regressions = compare(results, baselines.get(args.size, {}), args.tolerance, args.slack_ms)
+    if regressions:
+        print('\nREGRESSION against baselines.json:')
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
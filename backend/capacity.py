@@ -0,0 +1,22 @@
+import argparse
+from app import create_app
+from app.availability import rebuild_bookings, set_capacity
+from app.models import TourCapacity
+
+parser = argparse.ArgumentParser(description='Show or change the daily seat capacity of tours.')
+parser.add_argument('tour', nargs='?', help='tour option to change (omit to list all capacities)')
+parser.add_argument('seats', nargs='?', type=int, help='seats per day')
+parser.add_argument('--clear', action='store_true', help='remove the capacity, making the tour unlimited')
+parser.add_argument('--rebuild', action='store_true', help='install the triggers and recount booked pax first')
+args = parser.parse_args()
+if args.tour and args.seats is None and not args.clear:
+    parser.error('give a number of seats, or --clear')
+
+app = create_app()
+with app.app_context():
+    if args.rebuild:
+        print(f'Booked pax recounted: {rebuild_bookings()} tour days')
+    if args.tour:
+        set_capacity(args.tour, None if args.clear else args.seats)
+    for capacity in TourCapacity.query.order_by(TourCapacity.tour_option):
+        print(f'{capacity.tour_option}: {capacity.seats} seats/day')
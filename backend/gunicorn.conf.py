@@ -0,0 +1,33 @@
+"""Gunicorn settings for serving the app in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gthread workers serve each process's requests from a fixed pool of threads,
+so one long request no longer blocks a whole worker. Exports and imports
+run on the app's own job pools (EXPORT_WORKERS / IMPORT_WORKERS) rather
+than on request threads; their status is kept under EXPORT_ARTIFACT_DIR, so
+any worker can answer a poll. On SIGTERM every worker stops accepting requests,
+finishes in-flight ones and then waits for queued and running jobs, all
+within GRACEFUL_TIMEOUT.
+"""
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_WORKERS', str(os.cpu_count() or 1)))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '8'))
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '60'))
+keepalive = 5
+# Recycle workers now and then; jitter keeps them from restarting together
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+# Each worker builds its own app, engine and job pools after the fork
+preload_app = False
+accesslog = '-'
+
+
+def worker_exit(server, worker):
+    from app.jobs import drain_jobs
+    # Leave a little of the graceful window so the drain finishes before the arbiter's SIGKILL
+    drain_jobs(worker.wsgi, timeout=max(1, server.cfg.graceful_timeout - 5))
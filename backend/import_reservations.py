@@ -0,0 +1,21 @@
+import argparse
+from app import create_app
+from app.importing import read_rows, import_rows
+
+parser = argparse.ArgumentParser(description='Bulk import reservations from a CSV or Excel booking sheet.')
+parser.add_argument('path', help='CSV or .xlsx file with a header row')
+parser.add_argument('--batch-size', type=int, default=None, help='rows per INSERT/commit (default IMPORT_BATCH_SIZE)')
+parser.add_argument('--dry-run', action='store_true', help='validate only, do not write anything')
+args = parser.parse_args()
+
+app = create_app()
+with app.app_context():
+    with open(args.path, 'rb') as f:
+        result = import_rows(read_rows(f, args.path),
+                             batch_size=args.batch_size or app.config['IMPORT_BATCH_SIZE'],
+                             dry_run=args.dry_run)
+    for error in result.errors:
+        problems = '; '.join(f"{field}: {', '.join(messages)}" for field, messages in error['errors'].items())
+        print(f"row {error['row']}: {problems}")
+    verb = 'validated' if args.dry_run else 'imported'
+    print(f'{result.inserted} rows {verb}, {result.rejected} rejected')
@@ -0,0 +1,34 @@
+import argparse
+from app import create_app
+from app.migrations import MIGRATIONS, applied_versions, checkpoint, ensure_tables, migrate
+
+parser = argparse.ArgumentParser(description='Apply pending schema and data migrations.')
+parser.add_argument('--status', action='store_true', help='list migrations and whether they are applied')
+parser.add_argument('--target', help='stop after this migration version')
+parser.add_argument('--batch-size', type=int, default=None, help='ids per data-migration batch (default MIGRATION_BATCH_SIZE)')
+parser.add_argument('--pause', type=float, default=None, help='seconds to sleep between batches (default MIGRATION_PAUSE)')
+args = parser.parse_args()
+
+
+def report(migration, last_id, max_id, rows_done):
+    print(f'  {migration.version}: up to id {last_id} of {max_id}, {rows_done} rows changed', flush=True)
+
+
+app = create_app()
+with app.app_context():
+    ensure_tables()
+    if args.status:
+        applied = applied_versions()
+        for migration in MIGRATIONS:
+            state = 'applied' if migration.version in applied else 'pending'
+            saved = checkpoint(migration.version)
+            if saved is not None:
+                state = f'interrupted at id {saved.last_id}'
+            print(f'{migration.version:40} {state:25} {migration.description}')
+    else:
+        done = migrate(batch_size=args.batch_size or app.config['MIGRATION_BATCH_SIZE'],
+                       pause=app.config['MIGRATION_PAUSE'] if args.pause is None else args.pause,
+                       target=args.target, progress=report)
+        for version in done:
+            print(f'Applied {version}')
+        print(f'{len(done)} migrations applied' if done else 'Database is up to date')
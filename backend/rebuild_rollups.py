@@ -0,0 +1,7 @@
+from app import create_app
+from app.rollups import rebuild_rollups
+
+app = create_app()
+with app.app_context():
+    groups = rebuild_rollups()
+    print(f'Monthly rollup rebuilt: {groups} groups')
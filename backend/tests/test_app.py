@@ -13,6 +13,10 @@ def app(tmp_path):
     os.environ['TESTING'] = '1'
     
     app = create_app()
+    app.config['EXPORT_ARTIFACT_DIR'] = str(tmp_path / 'exports')
+    app.config['IMPORT_UPLOAD_DIR'] = str(tmp_path / 'uploads')
+    app.extensions['voucher_renderer'].cache_dir = str(tmp_path / 'vouchers')
+    app.config['ARCHIVE_DIR'] = str(tmp_path / 'archive')
     
     with app.app_context():
         db.create_all()
@@ -114,6 +118,177 @@ class TestAuthentication:
         assert '/login' in rv.location
 
 
+# ============ LOGIN HARDENING TESTS ============
+
+class TestLoginThrottle:
+    """Test login rate limiting, bounded verification and transparent rehashing."""
+
+    def test_ip_rate_limit(self, app, client):
+        """Test that bursts beyond the per-IP bucket get 429 with Retry-After."""
+        app.extensions['login_throttle'].ip_rate = (3, 3 / 60)
+        for i in range(3):
+            rv = client.post('/login', data={'username': f'user{i}', 'password': 'x'})
+            assert rv.status_code == 200
+        rv = client.post('/login', data={'username': 'testuser', 'password': 'testpass'})
+        assert rv.status_code == 429
+        assert int(rv.headers['Retry-After']) >= 1
+        assert b'Too many login attempts' in rv.data
+
+    def test_username_rate_limit(self, app, client):
+        """Test that one account cannot be hammered from rotating addresses."""
+        app.extensions['login_throttle'].user_rate = (2, 2 / 60)
+        for i in range(2):
+            client.post('/login', data={'username': 'testuser', 'password': 'bad'},
+                        environ_base={'REMOTE_ADDR': f'10.0.0.{i}'})
+        rv = client.post('/login', data={'username': 'TestUser', 'password': 'bad'},
+                         environ_base={'REMOTE_ADDR': '10.0.0.9'})
+        assert rv.status_code == 429
+
+    def test_token_bucket_refills(self, monkeypatch):
+        """Test that tokens come back at the configured rate."""
+        from app import security
+        now = [100.0]
+        monkeypatch.setattr(security.time, 'monotonic', lambda: now[0])
+        backend = security.MemoryRateLimitBackend()
+        assert backend.consume('k', 2, 1.0) == 0
+        assert backend.consume('k', 2, 1.0) == 0
+        assert backend.consume('k', 2, 1.0) == pytest.approx(1.0)
+        now[0] += 1.0
+        assert backend.consume('k', 2, 1.0) == 0
+
+    def test_verifier_busy(self, app, client):
+        """Test that logins fail fast with 503 when every hashing slot is taken."""
+        verifier = app.extensions['password_verifier']
+        taken = 0
+        while verifier._slots.acquire(blocking=False):
+            taken += 1
+        try:
+            rv = client.post('/login', data={'username': 'testuser', 'password': 'testpass'})
+            assert rv.status_code == 503
+        finally:
+            for _ in range(taken):
+                verifier._slots.release()
+        assert login(client).status_code == 200
+
+    def test_verifier_timeout_holds_slot(self, monkeypatch):
+        """Test that a timed-out check raises VerifierBusy and keeps its slot until it finishes."""
+        import threading
+        from app import security
+        release = threading.Event()
+        monkeypatch.setattr(security, 'check_password_hash', lambda *args: release.wait(5))
+        verifier = security.PasswordVerifier(workers=1, queue=0)
+        verifier._dummy = 'dummy'
+        try:
+            with pytest.raises(security.VerifierBusy):
+                verifier.verify('hash', 'password', timeout=0.05)
+            with pytest.raises(security.VerifierBusy):
+                verifier.verify('hash', 'password', timeout=0.05)
+            release.set()
+            verifier.executor.submit(lambda: None).result(timeout=5)
+            assert verifier.verify('hash', 'password', timeout=5) is True
+        finally:
+            release.set()
+            verifier.shutdown()
+
+    @pytest.mark.parametrize('threads', ['2', '8', '32'])
+    def test_default_hash_slots_leave_request_threads_free(self, monkeypatch, threads):
+        """Test that logins hashing or queued for a hash can hold at most half of WEB_THREADS."""
+        monkeypatch.setenv('WEB_THREADS', threads)
+        monkeypatch.delenv('LOGIN_HASH_WORKERS', raising=False)
+        monkeypatch.delenv('LOGIN_HASH_QUEUE', raising=False)
+        config = create_app().config
+        assert config['LOGIN_HASH_WORKERS'] >= 1
+        assert config['LOGIN_HASH_WORKERS'] + config['LOGIN_HASH_QUEUE'] <= max(1, int(threads) // 2)
+
+    def test_proxy_fix_keys_on_forwarded_address(self, monkeypatch, tmp_path):
+        """Test that with PROXY_FIX_HOPS the per-IP bucket uses X-Forwarded-For, not the proxy."""
+        monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'proxy.db'}")
+        monkeypatch.setenv('TESTING', '1')
+        monkeypatch.setenv('PROXY_FIX_HOPS', '1')
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+        app.extensions['login_throttle'].ip_rate = (1, 1 / 60)
+        client = app.test_client()
+        for i in range(3):
+            rv = client.post('/login', data={'username': f'user{i}', 'password': 'x'},
+                             headers={'X-Forwarded-For': f'203.0.113.{i}'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+            assert rv.status_code == 200
+        rv = client.post('/login', data={'username': 'user9', 'password': 'x'},
+                         headers={'X-Forwarded-For': '203.0.113.0'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        assert rv.status_code == 429
+
+    def test_outdated_hash_is_upgraded(self, client, app_context):
+        """Test that a successful login rehashes with the configured method."""
+        from werkzeug.security import generate_password_hash
+        user = User.query.filter_by(username='testuser').one()
+        user.password_hash = generate_password_hash('testpass', method='pbkdf2:sha256:1000')
+        db.session.commit()
+        rv = login(client)
+        assert b'Reservation Panel' in rv.data
+        db.session.refresh(user)
+        assert user.password_hash.startswith('scrypt:')
+        assert user.check_password('testpass')
+
+
+# ============ USER CACHE TESTS ============
+
+class TestUserCache:
+    """Test the identity cache behind Flask-Login's user_loader."""
+
+    @staticmethod
+    def count_user_queries(app, client, url):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'FROM user' in statement:
+                statements.append(statement)
+
+        with app.app_context():
+            db.event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                client.get(url)
+            finally:
+                db.event.remove(db.engine, 'before_cursor_execute', record)
+        return len(statements)
+
+    def test_authenticated_requests_skip_user_query(self, app, client):
+        """Test that only the first request after login loads the user row."""
+        login(client)
+        assert self.count_user_queries(app, client, '/dashboard') == 0
+        app.extensions['user_cache'].invalidate()
+        assert self.count_user_queries(app, client, '/dashboard') == 1
+        assert self.count_user_queries(app, client, '/dashboard') == 0
+
+    def test_password_change_invalidates(self, app, client):
+        """Test that changing a password evicts the cached identity."""
+        login(client)
+        with app.app_context():
+            user = User.query.filter_by(username='testuser').one()
+            assert app.extensions['user_cache'].get(user.id) is not None
+            user.set_password('newpass')
+            db.session.commit()
+            assert app.extensions['user_cache'].get(user.id) is None
+
+    def test_logout_invalidates(self, app, client):
+        """Test that logging out evicts the cached identity."""
+        login(client)
+        assert len(app.extensions['user_cache']) == 1
+        logout(client)
+        assert len(app.extensions['user_cache']) == 0
+
+    def test_cached_user_is_session_bound(self, app, client):
+        """Test that current_user is a live, attached User in later requests."""
+        from flask_login import current_user
+
+        @app.route('/whoami')
+        def whoami():
+            return f"{current_user.username}:{current_user in db.session}"
+
+        login(client)
+        assert client.get('/whoami').data == b'testuser:True'
+
+
 # ============ RESERVATION TESTS ============
 
 class TestReservations:
@@ -226,10 +401,357 @@ class TestReservations:
         assert rv.status_code == 200
 
 
+# ============ DATABASE ENGINE TESTS ============
+
+class TestDatabaseEngine:
+    """Test SQLite tuning and pool configuration."""
+
+    def test_sqlite_pragmas_applied(self, app_context):
+        """Test that new connections run in WAL mode with a busy timeout."""
+        pragma = lambda name: db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1
+        assert pragma('busy_timeout') == 5000
+        assert pragma('cache_size') == -65536
+
+    def test_server_database_pool_options(self):
+        """Test that server databases get a pre-pinged, recycled pool."""
+        from app.database import engine_options
+        config = {'SQLALCHEMY_DATABASE_URI': 'postgresql://u:p@db/travel', 'DB_POOL_SIZE': 5,
+                  'DB_MAX_OVERFLOW': 2, 'DB_POOL_TIMEOUT': 10, 'DB_POOL_RECYCLE': 60}
+        options = engine_options(config)
+        assert options['pool_size'] == 5
+        assert options['pool_pre_ping'] is True
+        assert engine_options({'SQLALCHEMY_DATABASE_URI': 'sqlite:///x.db', 'SQLITE_BUSY_TIMEOUT': 2000}) == \
+            {'connect_args': {'timeout': 2.0}}
+
+
+# ============ PAGINATION TESTS ============
+
+class TestPagination:
+    """Test keyset pagination of the dashboard."""
+
+    @staticmethod
+    def add_reservations(count):
+        """Insert ``count`` reservations spread over a few dates."""
+        for i in range(count):
+            db.session.add(Reservation(
+                tour_option='Red tour',
+                date=datetime(2026, 3, 1 + i % 3).date(),
+                hotel='Hotel Page',
+                customer_name=f'Guest {i:02d}',
+            ))
+        db.session.commit()
+
+    def test_pages_cover_all_rows_once(self, client, app_context):
+        """Test that following next cursors visits every reservation exactly once."""
+        from app.pagination import paginate
+        self.add_reservations(7)
+        seen = []
+        page = paginate(Reservation.query, per_page=3)
+        seen.extend(r.id for r in page)
+        while page.has_next:
+            page = paginate(Reservation.query, after=page.next_cursor, per_page=3)
+            seen.extend(r.id for r in page)
+        assert len(seen) == 7
+        assert len(set(seen)) == 7
+
+    def test_prev_cursor_returns_previous_page(self, client, app_context):
+        """Test that the prev cursor of page two leads back to page one."""
+        from app.pagination import paginate
+        self.add_reservations(5)
+        first = paginate(Reservation.query, per_page=2)
+        second = paginate(Reservation.query, after=first.next_cursor, per_page=2)
+        back = paginate(Reservation.query, before=second.prev_cursor, per_page=2)
+        assert [r.id for r in back] == [r.id for r in first]
+        assert not back.has_prev
+
+    def test_dashboard_respects_per_page(self, client, app_context):
+        """Test that the dashboard renders a single page with a next link."""
+        login(client)
+        self.add_reservations(4)
+        rv = client.get('/dashboard?per_page=2')
+        assert rv.status_code == 200
+        assert rv.data.count(b'Guest ') == 2
+        assert b'after=' in rv.data
+
+    def test_dashboard_invalid_cursor(self, client):
+        """Test that a malformed cursor falls back to the first page."""
+        login(client)
+        rv = client.get('/dashboard?after=not-a-cursor')
+        assert rv.status_code == 200
+
+    def test_composite_index_exists(self, app_context):
+        """Test that the (date, id) index backing the cursor exists."""
+        indexes = db.inspect(db.engine).get_indexes('reservation')
+        assert any(ix['column_names'] == ['date', 'id'] for ix in indexes)
+
+
+# ============ DASHBOARD CACHING TESTS ============
+
+class TestDashboardCaching:
+    """Test the data-version ETag and the rendered table fragment cache."""
+
+    @staticmethod
+    def version():
+        from app.versions import data_version
+        return data_version()
+
+    def test_version_bumps_on_every_write(self, client, app_context):
+        """Test that inserts, updates and deletes advance the data version."""
+        login(client)
+        start = self.version()
+        TestReports.add(client, '2026-02-01')
+        assert self.version() == start + 1
+        reservation = Reservation.query.one()
+        reservation.pax = 5
+        db.session.commit()
+        db.session.delete(reservation)
+        db.session.commit()
+        assert self.version() == start + 3
+
+    def test_unchanged_dashboard_revalidates_with_304(self, client):
+        """Test If-None-Match handling before and after a write."""
+        login(client)
+        first = client.get('/dashboard')
+        etag = first.headers['ETag']
+        assert first.headers['Cache-Control'] == 'private, no-cache'
+        assert client.get('/dashboard', headers={'If-None-Match': etag}).status_code == 304
+        assert client.get('/dashboard?month=2&year=2026', headers={'If-None-Match': etag}).status_code == 200
+
+        TestReports.add(client, '2026-02-01')
+        changed = client.get('/dashboard', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+
+    def test_new_session_does_not_revalidate_old_csrf_tokens(self, app):
+        """Test that a page cached by another session is re-rendered with this session's CSRF tokens."""
+        import re
+        app.config['WTF_CSRF_ENABLED'] = True
+
+        def session_login():
+            c = app.test_client()
+            token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', c.get('/login').get_data(as_text=True))
+            c.post('/login', data={'username': 'testuser', 'password': 'testpass', 'csrf_token': token.group(1)})
+            return c
+
+        etag = session_login().get('/dashboard').headers['ETag']
+        other = session_login()
+        page = other.get('/dashboard', headers={'If-None-Match': etag})
+        assert page.status_code == 200
+        assert other.get('/dashboard', headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page.get_data(as_text=True)).group(1)
+        rv = other.post('/reports', data={'start': '2026-01-01', 'end': '2026-01-31', 'csrf_token': token})
+        assert rv.status_code == 200
+        assert 'spreadsheetml' in rv.content_type
+
+    def test_table_fragment_served_from_cache(self, app, client):
+        """Test that a repeated page is rendered without querying reservations."""
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        client.get('/dashboard?month=2&year=2026')
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'FROM reservation' in statement:
+                statements.append(statement)
+
+        with app.app_context():
+            db.event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                rv = client.get('/dashboard?month=2&year=2026')
+            finally:
+                db.event.remove(db.engine, 'before_cursor_execute', record)
+        assert b'Jane Smith' in rv.data
+        assert statements == []
+
+    def test_search_results_are_not_fragment_cached(self, app, client):
+        """Test that only unfiltered and month views populate the fragment cache."""
+        login(client)
+        app.extensions['fragment_cache'].invalidate()
+        client.get('/dashboard?q=john')
+        assert len(app.extensions['fragment_cache']) == 0
+        client.get('/dashboard')
+        assert len(app.extensions['fragment_cache']) == 1
+
+
+# ============ DATE RANGE TESTS ============
+
+class TestDateRange:
+    """Test the shared month/period filtering layer."""
+
+    def test_month_range_rolls_over_year(self):
+        """Test that December ends at January 1st of the next year."""
+        from app.queries import month_range
+        assert month_range(2025, 12) == (datetime(2025, 12, 1).date(), datetime(2026, 1, 1).date())
+        assert month_range(2026, 2) == (datetime(2026, 2, 1).date(), datetime(2026, 3, 1).date())
+
+    def test_month_filter_bounds(self, app_context):
+        """Test that the first and last day of a month are included and neighbours excluded."""
+        from app.queries import month_filter
+        for day in ('2026-01-31', '2026-02-01', '2026-02-28', '2026-03-01'):
+            db.session.add(Reservation(tour_option='Red tour', customer_name=day,
+                                       date=datetime.strptime(day, '%Y-%m-%d').date()))
+        db.session.commit()
+        names = sorted(r.customer_name for r in Reservation.query.filter(month_filter(2026, 2)))
+        assert names == ['2026-02-01', '2026-02-28']
+
+    def test_month_filter_uses_date_index(self, app_context):
+        """Test that SQLite seeks the date index instead of scanning the table."""
+        from app.queries import month_filter
+        stmt = db.select(Reservation.id).where(month_filter(2026, 2))
+        sql = str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+        assert 'SEARCH' in plan
+        assert 'ix_reservation_date_id' in plan
+
+
+# ============ YEAR CACHE TESTS ============
+
+class TestYearCache:
+    """Test the cached distinct-year list behind the export form."""
+
+    def test_reservation_years(self, app_context):
+        """Test that only years with reservations are returned, newest first."""
+        from app.queries import reservation_years
+        assert reservation_years() == []
+        for year in (2022, 2024, 2024, 2025):
+            db.session.add(Reservation(tour_option='Red tour', customer_name='Y',
+                                       date=datetime(year, 6, 1).date()))
+        db.session.commit()
+        assert reservation_years() == [2025, 2024, 2022]
+
+    def test_add_reservation_updates_cached_years(self, client, app_context):
+        """Test that a new year shows up without waiting for the cache to expire."""
+        from app.cache import versioned
+        login(client)
+        client.get('/dashboard')
+        cache = app_context.extensions['years_cache']
+        assert cache.get(versioned('years')) == []
+
+        data = TestReservations.get_valid_reservation_data()
+        data['date'] = '2031-05-01'
+        client.post('/add', data=data, follow_redirects=True)
+        assert cache.get(versioned('years')) == [2031]
+        rv = client.get('/dashboard')
+        assert b'2031' in rv.data
+
+    def test_ttl_cache_expiry_and_invalidate(self):
+        """Test TTL expiry, LRU eviction and explicit invalidation."""
+        from app.cache import TTLCache
+        cache = TTLCache(ttl=0, maxsize=2)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+        cache = TTLCache(ttl=60, maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        assert cache.get('a') is None
+        assert cache.get_or_set('b', lambda: 99) == 2
+        cache.invalidate('b')
+        assert cache.get('b') is None
+        cache.invalidate()
+        assert len(cache) == 0
+
+
+# ============ SEARCH TESTS ============
+
+class TestSearch:
+    """Test the full-text search behind the dashboard "q" box."""
+
+    @staticmethod
+    def add(name, hotel='Hotel Luxe', tour='Red tour', day=15):
+        db.session.add(Reservation(tour_option=tour, customer_name=name, hotel=hotel,
+                                   date=datetime(2026, 2, day).date()))
+        db.session.commit()
+
+    def test_fts_backend_in_use(self, app_context):
+        """Test that SQLite databases created by create_all get the FTS5 index."""
+        from app.search import search_backend
+        assert search_backend(db.engine) == 'fts5'
+
+    def test_search_matches_word_prefixes(self, client, app_context):
+        """Test that rows written through the ORM are searchable by word prefix."""
+        login(client)
+        self.add('Ayşe Yılmaz', hotel='Pera Palace')
+        self.add('John Doe', hotel='Grand Bazaar Inn', tour='Bursa tour')
+        rv = client.get('/dashboard?q=pera')
+        assert b'Pera Palace' in rv.data
+        assert b'John Doe' not in rv.data
+        rv = client.get('/dashboard?q=burs')
+        assert b'John Doe' in rv.data
+        rv = client.get('/dashboard?q=ayse')
+        assert 'Ayşe Yılmaz'.encode() in rv.data
+
+    def test_search_ranks_better_matches_first(self, app_context):
+        """Test that rows matching in more columns rank higher."""
+        from app.search import apply_search
+        self.add('Sapanca Guest', hotel='Other Hotel')
+        self.add('Sapanca Lover', hotel='Sapanca Lake Hotel', tour='Sapanca tour')
+        results = apply_search(Reservation.query, 'sapanca').all()
+        assert [r.customer_name for r in results] == ['Sapanca Lover', 'Sapanca Guest']
+
+    def test_common_terms_fall_back_to_newest_first(self, app_context):
+        """Test that searches above SEARCH_RANK_LIMIT hits skip bm25 scoring."""
+        from app.search import apply_search
+        app_context.config['SEARCH_RANK_LIMIT'] = 1
+        self.add('Sapanca Lover', hotel='Sapanca Lake Hotel', tour='Sapanca tour')
+        self.add('Sapanca Guest', hotel='Other Hotel')
+        results = apply_search(Reservation.query, 'sapanca').all()
+        assert [r.customer_name for r in results] == ['Sapanca Guest', 'Sapanca Lover']
+
+    def test_search_tracks_updates_and_deletes(self, app_context):
+        """Test that the triggers keep the index in sync with edits and deletes."""
+        from app.search import apply_search
+        self.add('Old Name')
+        r = Reservation.query.one()
+        r.customer_name = 'New Name'
+        db.session.commit()
+        assert apply_search(Reservation.query, 'old').count() == 0
+        assert apply_search(Reservation.query, 'new').count() == 1
+        db.session.delete(r)
+        db.session.commit()
+        assert apply_search(Reservation.query, 'new').count() == 0
+
+    def test_trigram_search_compiles_for_postgres(self, app_context, monkeypatch):
+        """Test that the pg_trgm path builds an ILIKE filter and similarity() ordering."""
+        from sqlalchemy.dialects import postgresql
+        from app import search
+        monkeypatch.setitem(search._backends, str(db.engine.url), 'trigram')
+        query = search.apply_search(Reservation.query, 'pera')
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        assert f'{search.PG_SEARCH_EXPR} ILIKE' in sql
+        assert f'similarity({search.PG_SEARCH_EXPR}' in sql
+
+    def test_search_pages_and_odd_input(self, client, app_context):
+        """Test numbered paging of search results and punctuation-only queries."""
+        login(client)
+        for i in range(3):
+            self.add(f'Paged Guest {i}')
+        rv = client.get('/dashboard?q=paged&per_page=2')
+        assert rv.data.count(b'Paged Guest') == 2
+        assert b'page=2' in rv.data
+        rv = client.get('/dashboard?q=paged&per_page=2&page=2')
+        assert rv.data.count(b'Paged Guest') == 1
+        assert client.get('/dashboard?q=%22*%28').status_code == 200
+
+
 # ============ EXPORT TESTS ============
 
 class TestExport:
     """Test export functionality."""
+
+    def test_startup_does_not_import_export_libraries(self, tmp_path):
+        """Test that create_app leaves openpyxl, pandas and pyarrow to their first use."""
+        import subprocess
+        import sys
+        code = ("import sys; from app import create_app; create_app(); "
+                "print(','.join(m for m in ('openpyxl', 'pandas', 'pyarrow') if m in sys.modules))")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}")
+        out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+        assert out.stdout.strip() == ''
     
     def test_export_excel_with_reservations(self, client, app_context):
         """Test exporting reservations to Excel."""
@@ -265,6 +787,47 @@ class TestExport:
         assert rv.status_code == 200
         assert 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' in rv.content_type
     
+    def test_export_excel_layout(self, client, app_context):
+        """Test that the streamed workbook keeps the column layout and month boundaries."""
+        from io import BytesIO
+        from openpyxl import load_workbook
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+        other = TestReservations.get_valid_reservation_data()
+        other['date'] = '2026-03-01'
+        client.post('/add', data=other, follow_redirects=True)
+
+        rv = client.post('/export', data={'year': '2026', 'month': '2'})
+        sheet = load_workbook(BytesIO(rv.data))['2026-02']
+        rows = list(sheet.iter_rows(values_only=True))
+        assert rows[0] == ('Date', 'Tour Option', 'Hotel', 'Room', 'Customer', 'Contact', 'PAX',
+                           'Tour Amount', 'Paid Amount', 'Payment Status', 'Payment Method')
+        assert rows[1:] == [('2026-02-15', 'Red tour', 'Hotel Luxe', '205', 'Jane Smith',
+                             'jane@example.com', 3, 500.0, 250.0, 'Deposit', 'Card')]
+
+    def test_export_csv_streams_rows(self, client, app_context):
+        """Test the chunked CSV export."""
+        login(client)
+        for day in range(1, 4):
+            data = TestReservations.get_valid_reservation_data()
+            data['date'] = f'2026-02-{day:02d}'
+            client.post('/add', data=data, follow_redirects=True)
+
+        rv = client.post('/export', data={'year': '2026', 'month': '2', 'format': 'csv'})
+        assert rv.status_code == 200
+        assert rv.mimetype == 'text/csv'
+        assert 'reservations_2026_02.csv' in rv.headers['Content-Disposition']
+        lines = rv.get_data(as_text=True).strip().splitlines()
+        assert lines[0].startswith('Date,Tour Option,Hotel')
+        assert [line.split(',')[0] for line in lines[1:]] == ['2026-02-01', '2026-02-02', '2026-02-03']
+
+    def test_csv_chunks(self):
+        """Test that CSV output is produced in bounded chunks."""
+        from app.exports import iter_csv
+        chunks = list(iter_csv(((str(i),) for i in range(10)), chunk_rows=4))
+        assert len(chunks) == 3
+        assert ''.join(chunks).splitlines()[1:] == [str(i) for i in range(10)]
+
     def test_export_requires_login(self, client):
         """Test that export requires login."""
         rv = client.post('/export', data={'year': '2026', 'month': '1'}, 
@@ -273,6 +836,1236 @@ class TestExport:
         assert '/login' in rv.location
 
 
+# ============ REPORT TESTS ============
+
+class TestReports:
+    """Test multi-sheet range and yearly reports."""
+
+    @staticmethod
+    def add(client, day, tour='Red tour', status='Paid', method='Cash', amount='100.00', paid='100.00'):
+        data = TestReservations.get_valid_reservation_data()
+        data.update({'date': day, 'tour_option': tour, 'payment_status': status,
+                     'payment_method': method, 'amount': amount, 'paid_amount': paid, 'pax': '2'})
+        client.post('/add', data=data, follow_redirects=True)
+
+    @staticmethod
+    def load(rv):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        return load_workbook(BytesIO(rv.data))
+
+    def test_yearly_report_sheets_and_summary(self, client, app_context):
+        """Test one sheet per month plus SQL-aggregated summary totals."""
+        login(client)
+        self.add(client, '2026-01-10')
+        self.add(client, '2026-01-20', tour='Bursa tour', status='Deposit', method='Card', paid='40.00')
+        self.add(client, '2026-03-05', status='Pending', paid='0')
+        self.add(client, '2027-01-01')
+
+        rv = client.get('/reports/2026')
+        assert rv.status_code == 200
+        book = self.load(rv)
+        assert book.sheetnames == ['Summary'] + [f'2026-{m:02d}' for m in range(1, 13)]
+        assert len(list(book['2026-01'].iter_rows())) == 3
+        assert len(list(book['2026-02'].iter_rows())) == 1
+        assert len(list(book['2026-03'].iter_rows())) == 2
+
+        summary = {row[0]: row[1:] for row in book['Summary'].iter_rows(values_only=True) if row}
+        assert summary['Total'] == (3, 6, 300.0, 140.0, 160.0)
+        assert summary['Red tour'] == (2, 4, 200.0, 100.0, 100.0)
+        assert summary['Deposit'] == (1, 2, 100.0, 40.0, 60.0)
+        assert summary['Cash'] == (2, 4, 200.0, 100.0, 100.0)
+
+    def test_range_report_spans_years(self, client, app_context):
+        """Test a date-range report crossing a year boundary."""
+        login(client)
+        self.add(client, '2025-12-31')
+        self.add(client, '2026-01-01')
+        self.add(client, '2026-01-02')
+        rv = client.post('/reports', data={'start': '2025-12-15', 'end': '2026-01-01'})
+        assert rv.status_code == 200
+        book = self.load(rv)
+        assert book.sheetnames == ['Summary', '2025-12', '2026-01']
+        assert len(list(book['2026-01'].iter_rows())) == 2
+
+    def test_range_report_rejects_inverted_period(self, client):
+        """Test that an end date before the start date is rejected."""
+        login(client)
+        rv = client.post('/reports', data={'start': '2026-02-01', 'end': '2026-01-01'},
+                         follow_redirects=True)
+        assert b'End date must not be before start date' in rv.data
+
+    def test_report_is_rebuilt_after_a_write_in_the_period(self, client, app_context):
+        """Test that a cached report artifact is not served once the period changes."""
+        login(client)
+        self.add(client, '2026-01-10')
+        assert len(list(self.load(client.get('/reports/2026'))['2026-01'].iter_rows())) == 2
+        self.add(client, '2026-01-11')
+        assert len(list(self.load(client.get('/reports/2026'))['2026-01'].iter_rows())) == 3
+
+    def test_slow_report_continues_in_background(self, app, client, monkeypatch):
+        """Test that a long report is built on the export pool behind a progress page."""
+        import threading
+        from app import reports
+        login(client)
+        app.config['EXPORT_INLINE_WAIT'] = 0.05
+        release = threading.Event()
+
+        def slow(*args, **kwargs):
+            release.wait(10)
+            return reports.write_range_report(*args, **kwargs)
+        monkeypatch.setattr('app.routes.write_range_report', slow)
+        rv = client.get('/reports/2026')
+        assert rv.status_code == 302
+        assert b'http-equiv="refresh"' in client.get(rv.headers['Location']).data
+
+        release.set()
+        job_id = rv.headers['Location'].split('/')[-2]
+        app.extensions['export_jobs'].wait(job_id, timeout=30)
+        assert b'Download report_2026.xlsx' in client.get(rv.headers['Location']).data
+        rv = client.get(f'/export/jobs/{job_id}/download')
+        assert rv.status_code == 200
+        assert self.load(rv).sheetnames[0] == 'Summary'
+
+
+# ============ STATS API TESTS ============
+
+class TestStatsApi:
+    """Test the server-side aggregated statistics endpoint."""
+
+    def test_month_stats(self, client, app_context):
+        """Test totals and breakdowns for a month."""
+        login(client)
+        TestReports.add(client, '2026-02-01', status='Paid', method='Cash', amount='100.00', paid='100.00')
+        TestReports.add(client, '2026-02-10', tour='Dinner cruise', status='Deposit', method='Card',
+                        amount='250.00', paid='50.00')
+        TestReports.add(client, '2026-03-01')
+
+        stats = client.get('/api/stats?year=2026&month=2').get_json()
+        assert stats['start'] == '2026-02-01'
+        assert stats['end'] == '2026-02-28'
+        assert stats['reservations'] == 2
+        assert stats['pax'] == 4
+        assert stats['revenue'] == 350.0
+        assert stats['paid'] == 150.0
+        assert stats['outstanding'] == 200.0
+        assert stats['by_tour']['Dinner cruise']['count'] == 1
+        assert stats['by_status']['Deposit']['paid'] == 50.0
+        assert stats['by_method']['Cash']['revenue'] == 100.0
+
+    def test_range_stats_and_bad_input(self, client, app_context):
+        """Test an explicit range and validation errors."""
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        TestReports.add(client, '2026-03-01')
+        stats = client.get('/api/stats?start=2026-02-01&end=2026-03-01').get_json()
+        assert stats['reservations'] == 2
+        assert client.get('/api/stats?start=2026-03-01&end=2026-02-01').status_code == 400
+        assert client.get('/api/stats?year=2026&month=13').status_code == 400
+
+    def test_stats_cache_invalidated_on_write(self, client, app_context):
+        """Test that a cached period is recomputed after add_reservation."""
+        login(client)
+        assert client.get('/api/stats?year=2026&month=2').get_json()['reservations'] == 0
+        assert len(app_context.extensions['stats_cache']) == 1
+        TestReports.add(client, '2026-02-01')
+        assert client.get('/api/stats?year=2026&month=2').get_json()['reservations'] == 1
+
+    def test_stats_requires_login(self, client):
+        """Test that the API is not public and answers anonymous callers in JSON."""
+        rv = client.get('/api/stats')
+        assert rv.status_code == 401
+        assert rv.get_json() == {'error': 'authentication required'}
+
+    def test_cached_stats_follow_writes_from_other_workers(self, app, client):
+        """Test that a second app on the same database sees a write on its next request."""
+        other = create_app()
+        other_client = other.test_client()
+        login(client)
+        login(other_client)
+        assert other_client.get('/api/stats?year=2026&month=2').get_json()['reservations'] == 0
+        assert b'2031' not in other_client.get('/dashboard').data
+        TestReports.add(client, '2026-02-01')
+        TestReports.add(client, '2031-05-01')
+        assert other_client.get('/api/stats?year=2026&month=2').get_json()['reservations'] == 1
+        assert b'2031' in other_client.get('/dashboard').data
+
+
+# ============ MONTHLY ROLLUP TESTS ============
+
+class TestMonthlyRollup:
+    """Test the trigger-maintained monthly rollup and its use by summaries."""
+
+    @staticmethod
+    def rollup():
+        from app.models import ReservationMonthlyRollup as Rollup
+        return {(r.year, r.month, r.tour_option, r.payment_status, r.payment_method):
+                (r.reservations, r.pax, r.amount, r.paid_amount) for r in Rollup.query.all()}
+
+    def test_insert_update_delete_keep_rollup_current(self, client, app_context):
+        """Test that every ORM write adjusts the rollup in the same transaction."""
+        login(client)
+        TestReports.add(client, '2026-02-01', amount='100.00', paid='40.00')
+        TestReports.add(client, '2026-02-15', amount='50.00', paid='50.00')
+        key = (2026, 2, 'Red tour', 'Paid', 'Cash')
+        assert self.rollup() == {key: (2, 4, 150.0, 90.0)}
+
+        moved = Reservation.query.filter_by(date=datetime(2026, 2, 15).date()).one()
+        moved.date = datetime(2026, 3, 1).date()
+        moved.payment_method = None
+        db.session.commit()
+        assert self.rollup() == {key: (1, 2, 100.0, 40.0), (2026, 3, 'Red tour', 'Paid', ''): (1, 2, 50.0, 50.0)}
+
+        db.session.delete(moved)
+        db.session.commit()
+        assert self.rollup() == {key: (1, 2, 100.0, 40.0)}
+
+    def test_bulk_import_updates_rollup(self, client, app_context):
+        """Test that executemany imports are rolled up too."""
+        login(client)
+        TestImport.upload(client, TestImport.CSV.encode())
+        assert self.rollup() == {
+            (2026, 4, 'Red tour', 'Deposit', 'Card'): (1, 2, 100.0, 50.0),
+            (2025, 11, 'Bursa tour', 'Pending', 'Cash'): (1, 0, 0.0, 0.0),
+        }
+
+    def test_rebuild_restores_rollup(self, client, app_context):
+        """Test that a rebuild recomputes the rollup from reservations."""
+        from app.models import ReservationMonthlyRollup as Rollup
+        from app.rollups import rebuild_rollups
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        TestReports.add(client, '2026-03-01')
+        expected = self.rollup()
+        Rollup.query.delete()
+        db.session.commit()
+        assert rebuild_rollups() == 2
+        assert self.rollup() == expected
+
+    def test_summaries_combine_rollup_and_edge_months(self, client, app_context):
+        """Test that whole months come from the rollup and partial edges from reservation rows."""
+        from app.models import ReservationMonthlyRollup as Rollup
+        login(client)
+        TestReports.add(client, '2026-01-20')
+        TestReports.add(client, '2026-02-10')
+        TestReports.add(client, '2026-03-02')
+        TestReports.add(client, '2026-03-20')
+        # Only the whole month (February) should be read from the rollup
+        Rollup.query.filter_by(month=2).update({'amount': 1000.0})
+        db.session.commit()
+        stats = client.get('/api/stats?start=2026-01-15&end=2026-03-10').get_json()
+        assert stats['reservations'] == 3
+        assert stats['revenue'] == 1200.0
+        assert client.get('/api/stats?year=2026&month=1').get_json()['revenue'] == 100.0
+
+
+# ============ IMPORT TESTS ============
+
+class TestImport:
+    """Test bulk reservation import."""
+
+    CSV = (
+        'Date,Tour Option,Hotel,Room,Customer,Contact,PAX,Tour Amount,Paid Amount,Payment Status,Payment Method\n'
+        '2026-04-01,Red tour,Hotel A,1,Alice,a@x,2,100,50,Deposit,Card\n'
+        '2026-04-02,Moon tour,Hotel B,2,Bob,b@x,2,100,50,Paid,Cash\n'
+        ',,,,,,,,,,\n'
+        'not-a-date,Green tour,Hotel C,3,Carol,c@x,1,80,80,Paid,Bank\n'
+        '2025-11-03,Bursa tour,Hotel D,,Dave,,,,,Pending,Cash\n'
+    )
+
+    @staticmethod
+    def upload(client, content, filename='bookings.csv', **extra):
+        from io import BytesIO
+        data = {'file': (BytesIO(content), filename)}
+        data.update(extra)
+        return client.post('/import', data=data, content_type='multipart/form-data',
+                           headers={'Accept': 'application/json'})
+
+    def test_import_reports_rejected_rows(self, client, app_context):
+        """Test that valid rows are inserted and invalid ones reported by line number."""
+        login(client)
+        report = self.upload(client, self.CSV.encode()).get_json()
+        assert report['inserted'] == 2
+        assert [e['row'] for e in report['errors']] == [3, 5]
+        assert 'tour_option' in report['errors'][0]['errors']
+        assert 'date' in report['errors'][1]['errors']
+        names = sorted(r.customer_name for r in Reservation.query.all())
+        assert names == ['Alice', 'Dave']
+        dave = Reservation.query.filter_by(customer_name='Dave').one()
+        assert dave.pax is None and dave.created_at is not None
+        from app.cache import versioned
+        client.get('/dashboard')
+        assert app_context.extensions['years_cache'].get(versioned('years')) == [2026, 2025]
+
+    def test_large_import_runs_in_background(self, app, client, app_context):
+        """Test that an import outliving IMPORT_INLINE_WAIT answers 202 and can be polled."""
+        login(client)
+        app.config['IMPORT_INLINE_WAIT'] = 0
+        rv = self.upload(client, self.CSV.encode())
+        assert rv.status_code == 202
+        status_url = rv.get_json()['status_url']
+        app.extensions['import_jobs'].wait(rv.get_json()['id'], timeout=30)
+        report = client.get(status_url, headers={'Accept': 'application/json'}).get_json()
+        assert report['inserted'] == 2
+        assert Reservation.query.count() == 2
+        assert os.listdir(app.config['IMPORT_UPLOAD_DIR']) == []
+        assert b'Rejected rows' in client.get(status_url).data
+
+    def test_dry_run_writes_nothing(self, client, app_context):
+        """Test validation-only imports."""
+        login(client)
+        report = self.upload(client, self.CSV.encode(), dry_run='y').get_json()
+        assert report['inserted'] == 2
+        assert Reservation.query.count() == 0
+
+    def test_export_round_trip(self, client, app_context):
+        """Test that an exported Excel month can be imported again."""
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+        workbook = client.post('/export', data={'year': '2026', 'month': '2'}).data
+        report = self.upload(client, workbook, filename='month.xlsx').get_json()
+        assert report == {'inserted': 1, 'rejected': 0, 'errors': []}
+        first, second = Reservation.query.order_by(Reservation.id).all()
+        for field in ('date', 'tour_option', 'hotel', 'room_number', 'customer_name', 'pax',
+                      'amount', 'paid_amount', 'payment_status', 'payment_method'):
+            assert getattr(first, field) == getattr(second, field)
+
+    def test_import_page_and_file_type(self, client):
+        """Test the upload page and rejection of unsupported files."""
+        login(client)
+        assert client.get('/import').status_code == 200
+        from io import BytesIO
+        rv = client.post('/import', data={'file': (BytesIO(b'x'), 'notes.txt')},
+                         content_type='multipart/form-data')
+        assert b'CSV or Excel files only' in rv.data
+
+    def test_batches(self, app_context, monkeypatch):
+        """Test that rows are committed in batches of the requested size."""
+        from app.importing import import_rows
+        commit = db.session.commit
+        commits = []
+        monkeypatch.setattr(db.session, 'commit', lambda: commits.append(1) or commit())
+        records = [(i, {'date': '2026-05-01', 'tour_option': 'Red tour', 'hotel': 'H',
+                        'customer_name': f'C{i}', 'payment_status': 'Paid', 'payment_method': 'Cash'})
+                   for i in range(2, 9)]
+        result = import_rows(records, batch_size=3)
+        assert result.inserted == 7
+        assert len(commits) == 3
+        assert Reservation.query.count() == 7
+
+
+# ============ JSON API TESTS ============
+
+class TestApi:
+    """Test the versioned JSON reservations API."""
+
+    @staticmethod
+    def payload(**overrides):
+        data = {'tour_option': 'Red tour', 'date': '2026-02-10', 'hotel': 'Hotel A', 'room_number': '12',
+                'customer_name': 'Api Guest', 'contact': 'api@example.com', 'pax': 2, 'amount': 120.5,
+                'paid_amount': 20, 'payment_status': 'Deposit', 'payment_method': 'Card'}
+        data.update(overrides)
+        return data
+
+    def test_requires_login(self, client):
+        """Test that the API answers 401 instead of redirecting to the login page."""
+        rv = client.get('/api/v1/reservations')
+        assert rv.status_code == 401
+        assert rv.get_json() == {'error': 'authentication required'}
+
+    def test_create_and_get(self, client):
+        """Test creating a reservation and reading it back with a sparse fieldset."""
+        login(client)
+        rv = client.post('/api/v1/reservations', json=self.payload())
+        assert rv.status_code == 201
+        created = rv.get_json()['data']
+        assert created['date'] == '2026-02-10'
+        assert created['amount'] == 120.5
+        assert rv.headers['Location'].endswith(f"/api/v1/reservations/{created['id']}")
+
+        rv = client.get(f"/api/v1/reservations/{created['id']}?fields=customer_name,pax")
+        assert rv.get_json() == {'data': {'customer_name': 'Api Guest', 'pax': 2}}
+        assert client.get('/api/v1/reservations/9999').status_code == 404
+        assert client.get('/api/v1/reservations/1?fields=secret').status_code == 400
+
+    def test_create_validation_and_content_type(self, client):
+        """Test 422 for invalid reservations and 415 for non-JSON bodies."""
+        login(client)
+        rv = client.post('/api/v1/reservations', json=self.payload(tour_option='Nowhere tour', date='soon'))
+        assert rv.status_code == 422
+        assert set(rv.get_json()['errors']) == {'tour_option', 'date'}
+        assert client.post('/api/v1/reservations', data=self.payload()).status_code == 415
+
+    def test_list_filters_and_keyset_pages(self, client):
+        """Test filtering, newest-first order and following next/prev links."""
+        login(client)
+        for day in range(1, 6):
+            client.post('/api/v1/reservations', json=self.payload(date=f'2026-03-{day:02d}'))
+        client.post('/api/v1/reservations', json=self.payload(date='2026-04-01', payment_method='Cash'))
+
+        rv = client.get('/api/v1/reservations?month=3&year=2026&per_page=2&fields=date')
+        body = rv.get_json()
+        assert body['data'] == [{'date': '2026-03-05'}, {'date': '2026-03-04'}]
+        second = client.get(body['links']['next']).get_json()
+        assert [r['date'] for r in second['data']] == ['2026-03-03', '2026-03-02']
+        back = client.get(second['links']['prev']).get_json()
+        assert back['data'] == body['data']
+
+        cash = client.get('/api/v1/reservations?payment_method=Cash&fields=date').get_json()
+        assert cash['data'] == [{'date': '2026-04-01'}]
+        ranged = client.get('/api/v1/reservations?start=2026-03-04&end=2026-04-01&fields=id').get_json()
+        assert len(ranged['data']) == 3
+        assert client.get('/api/v1/reservations?month=3').status_code == 400
+        assert client.get('/api/v1/reservations?after=garbage').status_code == 400
+
+    def test_list_search(self, client):
+        """Test free-text search through the API."""
+        login(client)
+        client.post('/api/v1/reservations', json=self.payload(customer_name='Ayşe Yılmaz'))
+        client.post('/api/v1/reservations', json=self.payload(customer_name='John Doe'))
+        rv = client.get('/api/v1/reservations?q=ayse&fields=customer_name')
+        assert rv.get_json()['data'] == [{'customer_name': 'Ayşe Yılmaz'}]
+
+    def test_bulk_create(self, client, app_context):
+        """Test bulk creation with per-row error reporting and dry runs."""
+        login(client)
+        items = [self.payload(customer_name='Bulk 1'), self.payload(date='nope'), self.payload(customer_name='Bulk 2')]
+        rv = client.post('/api/v1/reservations/bulk?dry_run=1', json=items)
+        assert rv.status_code == 200
+        assert Reservation.query.count() == 0
+
+        rv = client.post('/api/v1/reservations/bulk', json=items)
+        assert rv.status_code == 201
+        report = rv.get_json()
+        assert report['inserted'] == 2
+        assert [e['row'] for e in report['errors']] == [2]
+        assert Reservation.query.count() == 2
+        assert client.post('/api/v1/reservations/bulk', json=[self.payload(date='nope')]).status_code == 422
+        assert client.post('/api/v1/reservations/bulk', json={'not': 'a list'}).status_code == 400
+
+
+# ============ AVAILABILITY TESTS ============
+
+class TestAvailability:
+    """Test per-tour daily capacity and the booked-pax aggregate behind it."""
+
+    @staticmethod
+    def booked():
+        from app.models import TourDayBooking
+        return {(b.tour_option, b.date.isoformat()): b.booked_pax for b in TourDayBooking.query.all()}
+
+    @staticmethod
+    def limit(tour, seats):
+        from app.availability import set_capacity
+        set_capacity(tour, seats)
+
+    def test_writes_keep_booked_pax_current(self, client, app_context):
+        """Test that inserts, moves and deletes adjust the per-day aggregate."""
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        TestReports.add(client, '2026-02-01')
+        assert self.booked() == {('Red tour', '2026-02-01'): 4}
+
+        moved = Reservation.query.first()
+        moved.date = datetime(2026, 2, 2).date()
+        moved.pax = 3
+        db.session.commit()
+        assert self.booked() == {('Red tour', '2026-02-01'): 2, ('Red tour', '2026-02-02'): 3}
+
+        db.session.delete(moved)
+        db.session.commit()
+        assert self.booked()[('Red tour', '2026-02-02')] == 0
+
+    def test_add_rejects_overbooking(self, client, app_context):
+        """Test that the form refuses a booking that does not fit and saves nothing."""
+        login(client)
+        self.limit('Red tour', 5)
+        TestReports.add(client, '2026-02-01')
+        TestReports.add(client, '2026-02-01')
+        data = TestReservations.get_valid_reservation_data()
+        data.update({'date': '2026-02-01', 'tour_option': 'Red tour', 'pax': '2'})
+        rv = client.post('/add', data=data)
+        assert rv.status_code == 409
+        assert b'Only 1 seats left for Red tour on 01/02/2026' in rv.data
+        assert Reservation.query.count() == 2
+        # Another day and an unlimited tour are unaffected
+        data['date'] = '2026-02-02'
+        assert client.post('/add', data=data).status_code == 302
+        data.update({'date': '2026-02-01', 'tour_option': 'Green tour', 'pax': '9'})
+        assert client.post('/add', data=data).status_code == 302
+
+    def test_existing_bookings_can_shrink_under_lowered_capacity(self, client, app_context):
+        """Test that lowering a capacity only blocks changes that add seats."""
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        self.limit('Red tour', 1)
+        booking = Reservation.query.one()
+        booking.pax = 1
+        db.session.commit()
+        booking.pax = 2
+        with pytest.raises(Exception):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_availability_endpoint(self, client):
+        """Test remaining seats for a list of dates and for a range."""
+        login(client)
+        with client.application.app_context():
+            self.limit('Red tour', 10)
+        TestReports.add(client, '2026-02-02')
+        rv = client.get('/api/v1/availability?tour_option=Red tour&dates=2026-02-02,2026-02-01')
+        assert rv.get_json()['data'] == [{'date': '2026-02-01', 'booked': 0, 'remaining': 10},
+                                         {'date': '2026-02-02', 'booked': 2, 'remaining': 8}]
+        rv = client.get('/api/v1/availability?tour_option=Blue tour&start=2026-02-01&end=2026-02-03')
+        assert [d['remaining'] for d in rv.get_json()['data']] == [None, None, None]
+        assert client.get('/api/v1/availability?tour_option=Red tour').status_code == 400
+        assert client.get('/api/v1/availability?tour_option=Red tour&start=2026-01-01&end=2027-06-01').status_code == 400
+
+    def test_api_create_answers_conflict(self, client):
+        """Test that the JSON API reports overbooking as 409 with the seats left."""
+        login(client)
+        with client.application.app_context():
+            self.limit('Red tour', 3)
+        assert client.post('/api/v1/reservations', json=TestApi.payload()).status_code == 201
+        rv = client.post('/api/v1/reservations', json=TestApi.payload())
+        assert rv.status_code == 409
+        assert rv.get_json() == {'error': 'capacity exceeded', 'remaining': 1}
+
+    def test_import_rejects_rows_that_do_not_fit(self, client, app_context):
+        """Test that an overbooking batch is retried row by row and the extra rows reported."""
+        login(client)
+        self.limit('Red tour', 3)
+        csv = ('Date,Tour Option,Hotel,Room,Customer,Contact,PAX,Tour Amount,Paid Amount,Payment Status,Payment Method\n'
+               '2026-04-01,Red tour,Hotel A,1,Alice,a@x,2,100,50,Deposit,Card\n'
+               '2026-04-01,Red tour,Hotel A,2,Bob,b@x,2,100,50,Deposit,Card\n'
+               '2026-04-01,Red tour,Hotel A,3,Carol,c@x,1,100,50,Deposit,Card\n'
+               'not-a-date,Red tour,Hotel A,4,Dave,d@x,1,100,50,Deposit,Card\n')
+        result = TestImport.upload(client, csv.encode()).get_json()
+        assert result['inserted'] == 2
+        assert [e['row'] for e in result['errors']] == [3, 5]
+        assert 'pax' in result['errors'][0]['errors']
+        assert self.booked() == {('Red tour', '2026-04-01'): 3}
+
+    def test_concurrent_bookings_never_exceed_capacity(self, app):
+        """Test that parallel sessions racing for the last seats cannot overbook."""
+        import threading
+        from datetime import date
+        from sqlalchemy.exc import IntegrityError
+        with app.app_context():
+            self.limit('Red tour', 10)
+        outcomes = []
+
+        def book():
+            with app.app_context():
+                db.session.add(Reservation(tour_option='Red tour', date=date(2026, 5, 1), customer_name='Racer', pax=3))
+                try:
+                    db.session.commit()
+                    outcomes.append(True)
+                except IntegrityError:
+                    db.session.rollback()
+                    outcomes.append(False)
+
+        threads = [threading.Thread(target=book) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            assert outcomes.count(True) == 3
+            assert self.booked() == {('Red tour', '2026-05-01'): 9}
+            assert Reservation.query.count() == 3
+
+
+# ============ MIGRATION TESTS ============
+
+class TestMigrations:
+    """Test the versioned, batched migration runner."""
+
+    LEGACY_ROWS = [('standard', 'Ann'), ('premium', 'Ben'), ('vip', 'Cem'), ('standard', 'Dua'), ('premium', 'Eda')]
+
+    @pytest.fixture
+    def legacy_app(self, tmp_path):
+        """An app on a database from before pax/amounts, the indexes and the derived tables."""
+        import sqlite3
+        path = tmp_path / 'legacy.db'
+        conn = sqlite3.connect(path)
+        conn.execute("""CREATE TABLE reservation (id INTEGER PRIMARY KEY, tour_option VARCHAR(100) NOT NULL,
+            date DATE NOT NULL, hotel VARCHAR(200), room_number VARCHAR(50), customer_name VARCHAR(200) NOT NULL,
+            passport_id VARCHAR(100), contact VARCHAR(200), payment_status VARCHAR(50),
+            payment_method VARCHAR(50), created_at DATETIME)""")
+        conn.executemany("INSERT INTO reservation (tour_option, date, customer_name, payment_status) "
+                         "VALUES (?, '2026-02-01', ?, 'Paid')", self.LEGACY_ROWS)
+        conn.commit()
+        conn.close()
+        os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+        os.environ['TESTING'] = '1'
+        app = create_app()
+        with app.app_context():
+            yield app
+            db.session.remove()
+
+    def test_fresh_schema_is_current(self, app_context):
+        """Test that create_all records every migration as applied."""
+        from app.migrations import migrate, pending_migrations
+        assert pending_migrations() == []
+        assert migrate() == []
+
+    def test_legacy_database_is_brought_up_to_date(self, legacy_app):
+        """Test that every migration runs in order on an old database."""
+        from sqlalchemy import inspect
+        from app.migrations import MIGRATIONS, applied_versions, migrate
+        from app.models import ReservationMonthlyRollup
+        from app.search import apply_search
+        assert migrate(batch_size=2) == [m.version for m in MIGRATIONS]
+        assert applied_versions() == {m.version for m in MIGRATIONS}
+
+        assert {'pax', 'amount', 'paid_amount'} <= {c['name'] for c in inspect(db.engine).get_columns('reservation')}
+        indexes = {i['name'] for i in inspect(db.engine).get_indexes('reservation')}
+        assert {'ix_reservation_date_id', 'ix_reservation_unpaid'} <= indexes
+        tours = sorted(r.tour_option for r in Reservation.query.all())
+        assert tours == ['Red tour', 'Red tour', 'Sapanca tour', 'Sapanca tour', 'vip']
+        assert [r.customer_name for r in apply_search(Reservation.query, 'dua')] == ['Dua']
+        assert {r.tour_option: r.reservations for r in ReservationMonthlyRollup.query.all()} == {
+            'Red tour': 2, 'Sapanca tour': 2, 'vip': 1}
+        # Existing rows are numbered by id and new writes above them
+        assert [(r.id, r.change_seq) for r in Reservation.query.order_by(Reservation.id)] == [(i, i) for i in range(1, 6)]
+        db.session.get(Reservation, 2).pax = 3
+        db.session.commit()
+        assert db.session.get(Reservation, 2).change_seq == 6
+        trigger = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE name = 'reservation_change_ad'"))
+        assert 'reservation_archiving' in trigger.scalar()
+        # Ids are no longer reused once the highest row is gone
+        db.session.delete(db.session.get(Reservation, 5))
+        db.session.commit()
+        db.session.add(Reservation(tour_option='Red tour', customer_name='Next', date=datetime(2026, 3, 1).date()))
+        db.session.commit()
+        assert Reservation.query.filter_by(customer_name='Next').one().id == 6
+        assert [r.customer_name for r in apply_search(Reservation.query, 'next')] == ['Next']
+        assert migrate() == []
+
+    def test_interrupted_data_migration_resumes(self, legacy_app):
+        """Test that a data migration stopped mid-way continues from its checkpoint."""
+        from sqlalchemy import text
+        from app.migrations import checkpoint, migrate, pending_migrations
+        migrate(target='0004_derived_tables')
+        seen = []
+
+        def stop_after_first_batch(migration, last_id, max_id, rows_done):
+            seen.append((last_id, rows_done))
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            migrate(batch_size=2, progress=stop_after_first_batch)
+        saved = checkpoint('0005_tour_option_labels')
+        assert (saved.last_id, saved.rows_done) == (2, 2)
+        # Raw SQL: the model already has columns later migrations add
+        assert db.session.execute(text("SELECT count(*) FROM reservation WHERE tour_option = 'standard'")).scalar() == 1
+
+        def record(migration, last_id, max_id, rows_done):
+            if migration.version == '0005_tour_option_labels':
+                seen.append((last_id, rows_done))
+
+        migrate(batch_size=2, progress=record)
+        assert seen == [(2, 2), (4, 3), (5, 4)]
+        assert checkpoint('0005_tour_option_labels') is None
+        assert pending_migrations() == []
+        assert Reservation.query.filter(Reservation.tour_option.in_(['standard', 'premium'])).count() == 0
+
+
+# ============ VOUCHER TESTS ============
+
+class TestVouchers:
+    """Test server-side voucher PDFs and their content-addressed cache."""
+
+    @staticmethod
+    def page_text(pdf):
+        """Check the xref offsets and return the decompressed content stream."""
+        import re
+        import zlib
+        assert pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n')
+        xref = int(re.search(rb'startxref\n(\d+)', pdf).group(1))
+        assert pdf[xref:].startswith(b'xref')
+        offsets = [int(o) for o in re.findall(rb'(\d{10}) 00000 n', pdf)]
+        for number, offset in enumerate(offsets, start=1):
+            assert pdf[offset:].startswith(b'%d 0 obj' % number)
+        stream = re.search(rb'stream\n(.*)\nendstream', pdf, re.S).group(1)
+        return zlib.decompress(stream)
+
+    def test_voucher_pdf_is_cached_by_content(self, client, app_context, monkeypatch):
+        """Test that a reprint is served from the cache and an edit renders a new voucher."""
+        from app import vouchers
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data())
+        reservation = Reservation.query.one()
+        renders = []
+        real_render = vouchers.render_voucher
+        monkeypatch.setattr(vouchers, 'render_voucher', lambda fields: renders.append(fields) or real_render(fields))
+
+        rv = client.get(f'/reservations/{reservation.id}/voucher.pdf')
+        assert rv.status_code == 200
+        assert rv.mimetype == 'application/pdf'
+        text = self.page_text(rv.data)
+        assert b'(Jane Smith) Tj' in text
+        assert b'(RESERVATION VOUCHER) Tj' in text
+        etag = rv.headers['ETag']
+
+        assert client.get(f'/reservations/{reservation.id}/voucher.pdf').data == rv.data
+        assert client.get(f'/reservations/{reservation.id}/voucher.pdf',
+                          headers={'If-None-Match': etag}).status_code == 304
+        assert len(renders) == 1
+
+        reservation.paid_amount = 1234.5
+        db.session.commit()
+        rv = client.get(f'/reservations/{reservation.id}/voucher.pdf?download=1')
+        assert rv.headers['ETag'] != etag
+        assert 'attachment' in rv.headers['Content-Disposition']
+        assert b'($1,234.50) Tj' in self.page_text(rv.data)
+        assert len(renders) == 2
+        assert client.get('/reservations/9999/voucher.pdf').status_code == 404
+
+    def test_day_batch_zip(self, client):
+        """Test that the batch holds one voucher per reservation travelling that day."""
+        from io import BytesIO
+        from zipfile import ZipFile
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        TestReports.add(client, '2026-02-01', tour='Bursa tour')
+        TestReports.add(client, '2026-02-02')
+        rv = client.get('/vouchers?date=2026-02-01')
+        assert rv.status_code == 200
+        assert rv.mimetype == 'application/zip'
+        archive = ZipFile(BytesIO(rv.data))
+        assert sorted(archive.namelist()) == ['Voucher_1.pdf', 'Voucher_2.pdf']
+        assert b'(Bursa tour) Tj' in self.page_text(archive.read('Voucher_2.pdf'))
+        assert client.get('/vouchers?date=2026-03-01').status_code == 302
+        assert client.get('/vouchers?date=tomorrow').status_code == 400
+
+    def test_non_latin_name_falls_back_to_html(self, client):
+        """Test that a name the PDF fonts cannot show gets the printable HTML voucher, not '?' marks."""
+        from io import BytesIO
+        from zipfile import ZipFile
+        login(client)
+        data = TestReservations.get_valid_reservation_data()
+        client.post('/add', data=dict(data, customer_name='Анна Иванова'))
+        client.post('/add', data=dict(data, customer_name='Şükrü Öztürk'))
+
+        rv = client.get('/reservations/1/voucher.pdf')
+        assert rv.status_code == 302
+        page = client.get(rv.headers['Location'])
+        assert page.status_code == 200
+        assert 'Анна Иванова' in page.get_data(as_text=True)
+        assert client.get('/reservations/2/voucher.pdf').mimetype == 'application/pdf'
+
+        archive = ZipFile(BytesIO(client.get('/vouchers?date=2026-02-15').data))
+        assert sorted(archive.namelist()) == ['Voucher_1.html', 'Voucher_2.pdf']
+        assert 'Анна Иванова' in archive.read('Voucher_1.html').decode()
+        assert 'Şükrü Öztürk'.encode('cp1254') in self.page_text(archive.read('Voucher_2.pdf'))
+
+    def test_prune_drops_unused_vouchers(self, client, app_context):
+        """Test that cached vouchers idle for longer than the TTL are deleted."""
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data())
+        client.get('/reservations/1/voucher.pdf')
+        renderer = app_context.extensions['voucher_renderer']
+        assert renderer.prune() == 0
+        renderer.ttl = -1
+        assert renderer.prune() == 1
+
+
+# ============ SYNC TESTS ============
+
+class TestSync:
+    """Test the delta sync endpoints over change_seq and tombstones."""
+
+    @staticmethod
+    def pull(client, since=0, **params):
+        import gzip
+        import json
+        query = '&'.join(f'{k}={v}' for k, v in dict(since=since, **params).items())
+        rv = client.get(f'/api/v1/sync?{query}', headers={'Accept-Encoding': 'gzip'})
+        assert rv.status_code == 200
+        assert rv.headers['Content-Encoding'] == 'gzip'
+        return json.loads(gzip.decompress(rv.data))
+
+    def test_pull_returns_only_changes_since_cursor(self, client, app_context):
+        """Test that inserts, updates and deletes each show up once after the cursor."""
+        login(client)
+        for day in ('2026-02-01', '2026-02-02', '2026-02-03'):
+            TestReports.add(client, day)
+        first = self.pull(client)
+        assert [r['date'] for r in first['upserts']] == ['2026-02-01', '2026-02-02', '2026-02-03']
+        assert first['deleted'] == [] and first['more'] is False
+        assert self.pull(client, since=first['cursor'])['upserts'] == []
+
+        edited, removed = Reservation.query.filter(Reservation.id.in_([2, 3])).order_by(Reservation.id)
+        edited.pax = 6
+        db.session.commit()
+        db.session.delete(removed)
+        db.session.commit()
+        delta = self.pull(client, since=first['cursor'])
+        assert [(r['id'], r['pax']) for r in delta['upserts']] == [(2, 6)]
+        assert delta['upserts'][0]['change_seq'] > first['cursor']
+        assert delta['deleted'] == [3]
+
+    def test_pull_pages_with_more(self, client):
+        """Test that a large backlog comes in pages of ``limit``."""
+        login(client)
+        for day in ('2026-02-01', '2026-02-02', '2026-02-03'):
+            TestReports.add(client, day)
+        page = self.pull(client, limit=2)
+        assert len(page['upserts']) == 2 and page['more'] is True
+        page = self.pull(client, since=page['cursor'], limit=2)
+        assert len(page['upserts']) == 1 and page['more'] is False
+        plain = client.get('/api/v1/sync?since=0')
+        assert 'Content-Encoding' not in plain.headers
+        assert len(plain.get_json()['upserts']) == 3
+
+    def test_push_applies_batched_edits(self, client, app_context):
+        """Test creates, guarded updates and deletes, and conflict reporting."""
+        login(client)
+        TestReports.add(client, '2026-02-01')
+        seq = self.pull(client)['upserts'][0]['change_seq']
+        changes = [
+            {'op': 'upsert', 'ref': 'RES-1', 'data': TestApi.payload()},
+            {'op': 'upsert', 'id': 1, 'base_seq': seq, 'data': {'pax': 4}},
+            {'op': 'upsert', 'id': 1, 'base_seq': seq, 'data': {'pax': 5}},
+            {'op': 'upsert', 'data': {'customer_name': 'No date'}},
+            {'op': 'delete', 'id': 99},
+            {'op': 'rename'},
+        ]
+        rv = client.post('/api/v1/sync', json={'changes': changes})
+        assert rv.status_code == 200
+        results = rv.get_json()['results']
+        assert [r['status'] for r in results] == ['created', 'updated', 'conflict', 'invalid', 'not_found', 'invalid']
+        assert results[0]['ref'] == 'RES-1' and results[0]['id'] == 2
+        assert results[2]['change_seq'] == results[1]['change_seq']
+        assert db.session.get(Reservation, 1).pax == 4
+        assert db.session.get(Reservation, 1).customer_name == 'Jane Smith'
+
+        rv = client.post('/api/v1/sync', json={'changes': [
+            {'op': 'delete', 'id': 2, 'base_seq': results[0]['change_seq']},
+            {'op': 'upsert', 'id': 2, 'data': {'pax': 1}},
+        ]})
+        assert [r['status'] for r in rv.get_json()['results']] == ['deleted', 'deleted']
+        assert self.pull(client, since=results[1]['change_seq'])['deleted'] == [2]
+        assert client.post('/api/v1/sync', json={'changes': {}}).status_code == 400
+
+
+    def test_push_rejects_malformed_batch_before_writing(self, client, app_context):
+        """Test that a malformed change late in the batch fails the request without applying earlier ones."""
+        login(client)
+        rv = client.post('/api/v1/sync', json={'changes': [
+            {'op': 'upsert', 'data': TestApi.payload()},
+            {'op': 'upsert', 'data': ['not', 'an', 'object']},
+        ]})
+        assert rv.status_code == 400
+        assert 'changes[1].data' in rv.get_json()['error']
+        assert Reservation.query.count() == 0
+
+# ============ ARCHIVE TESTS ============
+
+class TestArchive:
+    """Test moving closed months to Parquet files and reading them back transparently."""
+
+    TODAY = datetime(2027, 6, 15).date()
+
+    @staticmethod
+    def seed(client):
+        TestReports.add(client, '2026-02-03')
+        TestReports.add(client, '2026-02-20', tour='Bursa tour', status='Deposit', method='Card', paid='40.00')
+        TestReports.add(client, '2026-03-01', status='Pending', paid='0')
+
+    def test_archive_moves_closed_month(self, app, client, app_context):
+        """Test that settled rows leave the table for a file, unpaid ones stay, and open months are refused."""
+        from app.archive import ArchiveError, archivable_months, archive_month, read_archive
+        from app.models import ArchivedMonth
+        from app.queries import month_filter
+        login(client)
+        self.seed(client)
+        assert archivable_months(self.TODAY) == [(2026, 2)]
+        assert archive_month(2026, 2, today=self.TODAY) == 1
+        assert [r.payment_status for r in Reservation.query.filter(month_filter(2026, 2))] == ['Deposit']
+        assert Reservation.query.count() == 2
+
+        entry = db.session.get(ArchivedMonth, (2026, 2))
+        assert entry.rows == 1
+        assert os.path.exists(os.path.join(app.config['ARCHIVE_DIR'], entry.filename))
+        table = read_archive(datetime(2026, 2, 1).date(), datetime(2026, 3, 1).date(),
+                             ['customer_name', 'payment_status'])
+        assert table.to_pylist() == [{'customer_name': 'Jane Smith', 'payment_status': 'Paid'}]
+        assert archive_month(2026, 2, today=self.TODAY) == 0
+        with pytest.raises(ArchiveError):
+            archive_month(2026, 6, today=self.TODAY)
+
+    def test_exports_and_reports_unchanged_by_archiving(self, app, client, app_context):
+        """Test that the month export, yearly report and range stats read archived rows."""
+        from app.archive import archive_month
+        login(client)
+        self.seed(client)
+
+        def snapshot():
+            app.extensions['stats_cache'].invalidate()
+            csv = client.post('/export', data={'year': '2026', 'month': '2', 'format': 'csv'}).data
+            book = TestReports.load(client.get('/reports/2026'))
+            sheets = {name: list(book[name].iter_rows(values_only=True)) for name in book.sheetnames}
+            stats = client.get('/api/stats?start=2026-02-10&end=2026-03-02').get_json()
+            return csv, sheets, stats
+
+        before = snapshot()
+        assert before[0].count(b'Jane Smith') == 2
+        assert before[2]['reservations'] == 2
+        archive_month(2026, 2, today=self.TODAY)
+        archive_month(2026, 3, today=self.TODAY)
+        assert Reservation.query.count() == 2  # the unpaid ones
+        assert snapshot() == before
+
+    def test_rearchive_and_rollup_rebuild(self, client, app_context):
+        """Test that rows added to an archived month are merged in and rebuilds keep its rollup."""
+        from app.archive import all_reservation_years, archive_month, archive_path
+        from app.models import ArchivedMonth
+        from app.rollups import rebuild_rollups, rollup_totals
+        login(client)
+        self.seed(client)
+        archive_month(2026, 2, today=self.TODAY)
+        first = db.session.get(ArchivedMonth, (2026, 2)).filename
+        TestReports.add(client, '2026-02-25')
+        assert archive_month(2026, 2, today=self.TODAY) == 1
+        entry = db.session.get(ArchivedMonth, (2026, 2))
+        assert entry.rows == 2
+        assert not os.path.exists(archive_path(first))
+
+        rebuild_rollups()
+        february = rollup_totals(datetime(2026, 2, 1).date(), datetime(2026, 3, 1).date())
+        assert sum(row[3] for row in february) == 3
+        archive_month(2026, 3, today=self.TODAY)
+        assert all_reservation_years() == [2026]
+
+
+    def test_archived_ids_are_not_reused(self, client, app_context):
+        """Test that a booking made after archiving the newest ids gets a fresh id, not an archived one."""
+        from app.archive import archive_month, archived_max_id, read_archive
+        login(client)
+        TestReports.add(client, '2026-05-01', status='Pending', paid='0')
+        for day in ('2025-05-03', '2025-05-10', '2025-05-20'):
+            TestReports.add(client, day)
+        assert archive_month(2025, 5, today=self.TODAY) == 3
+        TestReports.add(client, '2027-07-01')
+        assert [r.id for r in Reservation.query.order_by(Reservation.id)] == [1, 5]
+        archived = read_archive(datetime(2025, 5, 1).date(), datetime(2025, 6, 1).date(), ['id'])
+        assert archived.column('id').to_pylist() == [2, 3, 4]
+        assert archived_max_id(db.session.connection()) == 4
+
+    def test_archived_rows_are_not_synced_as_deletes(self, client, app_context):
+        """Test that archiving leaves no tombstones for sync clients while real deletes still do."""
+        from app.archive import archive_month
+        login(client)
+        self.seed(client)
+        before = TestSync.pull(client)
+        assert len(before['upserts']) == 3
+        assert archive_month(2026, 2, today=self.TODAY) == 1
+        delta = TestSync.pull(client, since=before['cursor'])
+        assert delta['deleted'] == [] and delta['upserts'] == []
+
+        db.session.delete(db.session.get(Reservation, 3))
+        db.session.commit()
+        assert TestSync.pull(client, since=before['cursor'])['deleted'] == [3]
+
+# ============ RECEIVABLES TESTS ============
+
+class TestReceivables:
+    """Test the generated balance_due column and the receivables views over unpaid rows."""
+
+    @staticmethod
+    def add(client, days_ago, hotel='Hotel Luxe', amount='100.00', paid='0'):
+        from datetime import date, timedelta
+        data = TestReservations.get_valid_reservation_data()
+        day = date.today() - timedelta(days=days_ago)
+        data.update({'date': day.isoformat(), 'hotel': hotel, 'amount': amount, 'paid_amount': paid,
+                     'payment_status': 'Paid' if paid == amount else 'Deposit'})
+        client.post('/add', data=data, follow_redirects=True)
+
+    def test_balance_due_follows_writes(self, client, app_context):
+        """Test that the database recomputes balance_due whenever the amounts change."""
+        login(client)
+        self.add(client, 5, amount='250.00', paid='100.00')
+        reservation = Reservation.query.one()
+        assert reservation.balance_due == 150.0
+        reservation.paid_amount = 250.0
+        db.session.commit()
+        assert db.session.get(Reservation, reservation.id).balance_due == 0
+        assert client.get(f'/api/v1/reservations/{reservation.id}').get_json()['data']['balance_due'] == 0
+
+    def test_receivables_grouped_with_totals(self, client, app_context):
+        """Test grouping by age, hotel and date, the unpaid listing and the HTML page."""
+        login(client)
+        self.add(client, -3, hotel='Pera Palace', paid='20.00')
+        self.add(client, 10, hotel='Pera Palace')
+        self.add(client, 45, hotel='Hotel Luxe', amount='300.00', paid='50.00')
+        self.add(client, 200, hotel='Hotel Luxe', paid='100.00')
+
+        body = client.get('/api/v1/receivables').get_json()
+        assert [(g['key'], g['balance']) for g in body['groups']] == [
+            ('31-60 days', 250.0), ('1-30 days', 100.0), ('upcoming', 80.0)]
+        assert body['totals'] == {'reservations': 3, 'amount': 500.0, 'paid': 70.0, 'balance': 430.0}
+        hotels = client.get('/api/v1/receivables?by=hotel').get_json()['groups']
+        assert [(g['key'], g['reservations']) for g in hotels] == [('Hotel Luxe', 1), ('Pera Palace', 2)]
+        days = client.get('/api/v1/receivables?by=date&hotel=Pera+Palace').get_json()
+        assert len(days['groups']) == 2 and days['groups'][0]['key'] < days['groups'][1]['key']
+        assert days['totals']['balance'] == 180.0
+        assert client.get('/api/v1/receivables?by=customer').status_code == 400
+
+        listed = client.get('/api/v1/reservations?unpaid=1&fields=id,balance_due').get_json()['data']
+        assert sorted(item['balance_due'] for item in listed) == [80.0, 100.0, 250.0]
+        rv = client.get('/receivables?by=hotel')
+        assert rv.status_code == 200
+        assert b'430.00' in rv.data and b'Pera Palace' in rv.data
+
+    def test_unpaid_queries_use_partial_index(self, app_context):
+        """Test that SQLite answers receivables from the index of unpaid rows."""
+        from datetime import date
+        from app.queries import unpaid_filter
+        from app.receivables import age_bucket
+        for stmt in (db.select(Reservation.id).where(unpaid_filter()),
+                     db.select(age_bucket(date.today()), db.func.sum(Reservation.balance_due))
+                     .where(unpaid_filter()).group_by(age_bucket(date.today()))):
+            sql = str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+            assert 'ix_reservation_unpaid' in plan
+
+
+# ============ BENCHMARK DATA TESTS ============
+
+class TestSyntheticData:
+    """Test the benchmark suite's synthetic data generator."""
+
+    def test_generated_rows_pass_form_validation(self, app_context):
+        """Test that generated bookings are valid ReservationForm input and reproducible."""
+        from benchmarks.generator import generate
+        from app.importing import import_rows
+        rows = list(generate(200, seed=1))
+        assert rows == list(generate(200, seed=1))
+        records = [(i, {k: str(v) for k, v in r.items() if k != 'created_at'}) for i, r in enumerate(rows, 2)]
+        result = import_rows(records)
+        assert result.rejected == 0
+        for r in rows:
+            if r['payment_status'] == 'Paid':
+                assert r['paid_amount'] == r['amount']
+            elif r['payment_status'] == 'Pending':
+                assert r['paid_amount'] == 0
+
+
+# ============ EXPORT JOB TESTS ============
+
+class TestExportJobs:
+    """Test the background export job queue."""
+
+    @pytest.fixture(autouse=True)
+    def artifact_dir(self, app, tmp_path):
+        app.config['EXPORT_ARTIFACT_DIR'] = str(tmp_path / 'exports')
+
+    def test_job_produces_downloadable_artifact(self, client, app_context):
+        """Test enqueue -> status -> download."""
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+
+        rv = client.post('/export/jobs', data={'year': '2026', 'month': '2'})
+        assert rv.status_code == 202
+        job_id = rv.get_json()['id']
+        app_context.extensions['export_jobs'].wait(job_id, timeout=30)
+
+        status = client.get(f'/export/jobs/{job_id}').get_json()
+        assert status['status'] == 'done'
+        rv = client.get(status['download_url'])
+        assert rv.status_code == 200
+        assert 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' in rv.content_type
+        assert 'reservations_2026_02.xlsx' in rv.headers['Content-Disposition']
+
+    def test_identical_requests_are_deduplicated(self, client, app_context):
+        """Test that repeated requests share a job until the month's data changes."""
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+        first = client.post('/export/jobs', data={'year': '2026', 'month': '2'}).get_json()['id']
+        second = client.post('/export/jobs', data={'year': '2026', 'month': '2'}).get_json()['id']
+        assert first == second
+
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+        third = client.post('/export/jobs', data={'year': '2026', 'month': '2'}).get_json()['id']
+        assert third != first
+        other_format = client.post('/export/jobs', data={'year': '2026', 'month': '2', 'format': 'csv'})
+        assert other_format.get_json()['id'] != third
+        jobs = app_context.extensions['export_jobs']
+        for job_id in (first, third, other_format.get_json()['id']):
+            jobs.wait(job_id, timeout=30)
+
+    def test_edit_produces_new_export(self, client, app_context):
+        """Test that editing a row in place, as a sync push does, retires the cached export."""
+        login(client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+        rv = client.post('/export', data={'year': '2026', 'month': '2', 'format': 'csv'})
+        assert b'500.0' in rv.data
+        rv = client.post('/api/v1/sync', json={'changes': [
+            {'op': 'upsert', 'id': 1, 'data': {'amount': 999, 'customer_name': 'Edited Name'}}]})
+        assert rv.get_json()['results'][0]['status'] == 'updated'
+        rv = client.post('/export', data={'year': '2026', 'month': '2', 'format': 'csv'})
+        assert b'Edited Name' in rv.data and b'999.0' in rv.data
+
+    def test_jobs_are_visible_to_other_workers(self, app, client, app_context):
+        """Test that a job started in one worker process can be polled and downloaded through another."""
+        other = create_app()
+        other.config['EXPORT_ARTIFACT_DIR'] = app.config['EXPORT_ARTIFACT_DIR']
+        other_client = other.test_client()
+        login(client)
+        login(other_client)
+        client.post('/add', data=TestReservations.get_valid_reservation_data(), follow_redirects=True)
+        job_id = client.post('/export/jobs', data={'year': '2026', 'month': '2'}).get_json()['id']
+        app.extensions['export_jobs'].wait(job_id, timeout=30)
+
+        status = other_client.get(f'/export/jobs/{job_id}').get_json()
+        assert status['status'] == 'done'
+        assert other_client.get(f'/export/jobs/{job_id}/page').status_code == 200
+        rv = other_client.get(status['download_url'])
+        assert rv.status_code == 200
+        assert 'reservations_2026_02.xlsx' in rv.headers['Content-Disposition']
+
+        app.config['IMPORT_INLINE_WAIT'] = 0
+        rv = TestImport.upload(client, TestImport.CSV.encode())
+        app.extensions['import_jobs'].wait(rv.get_json()['id'], timeout=30)
+        report = other_client.get(rv.get_json()['status_url'], headers={'Accept': 'application/json'}).get_json()
+        assert report['inserted'] == 2
+
+    def test_unknown_job_and_bad_input(self, client):
+        """Test 404 for unknown jobs and 400 for invalid periods."""
+        login(client)
+        assert client.get('/export/jobs/nope').status_code == 404
+        assert client.get('/export/jobs/nope/download').status_code == 404
+        assert client.post('/export/jobs', data={'year': '2026', 'month': '13'}).status_code == 400
+
+    @staticmethod
+    def blocked_export(monkeypatch):
+        """Make month exports wait on an event so they stay in flight."""
+        import threading
+        from app import exports
+        release = threading.Event()
+        original = exports.write_month_export
+
+        def slow(*args, **kwargs):
+            release.wait(10)
+            return original(*args, **kwargs)
+        monkeypatch.setattr('app.routes.write_month_export', slow)
+        return release
+
+    def test_slow_export_continues_in_background(self, app, client, monkeypatch):
+        """Test that /export hands a long export to the pool and redirects to a progress page."""
+        login(client)
+        app.config['EXPORT_INLINE_WAIT'] = 0.05
+        release = self.blocked_export(monkeypatch)
+        rv = client.post('/export', data={'year': '2026', 'month': '2'})
+        assert rv.status_code == 302
+        page = client.get(rv.headers['Location'])
+        assert b'http-equiv="refresh"' in page.data
+
+        release.set()
+        job_id = rv.headers['Location'].split('/')[-2]
+        app.extensions['export_jobs'].wait(job_id, timeout=30)
+        page = client.get(rv.headers['Location'])
+        assert b'Download reservations_2026_02.xlsx' in page.data
+        assert client.get(f'/export/jobs/{job_id}/download').status_code == 200
+
+    def test_drain_finishes_running_jobs_and_refuses_new_ones(self, app, client, monkeypatch):
+        """Test graceful shutdown: in-flight exports complete, new ones get 503."""
+        from app.jobs import drain_jobs
+        login(client)
+        release = self.blocked_export(monkeypatch)
+        job_id = client.post('/export/jobs', data={'year': '2026', 'month': '2'}).get_json()['id']
+        release.set()
+        assert drain_jobs(app, timeout=30) == 0
+        assert app.extensions['export_jobs'].get(job_id).status == 'done'
+        rv = client.post('/export', data={'year': '2026', 'month': '3'})
+        assert rv.status_code == 503
+        assert rv.headers['Retry-After'] == '5'
+
+    def test_prune_skips_partial_files(self, app):
+        """Test that pruning never touches an artifact that is still being written."""
+        jobs = app.extensions['export_jobs']
+        partial = os.path.join(jobs.artifact_dir, 'x.xlsx.abc.part')
+        open(partial, 'w').close()
+        os.utime(partial, (0, 0))
+        jobs.prune()
+        assert os.path.exists(partial)
+
+
+# ============ INSTRUMENTATION TESTS ============
+
+class TestInstrumentation:
+    """Test opt-in request profiling and the metrics endpoint."""
+
+    @pytest.fixture
+    def instrumented(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'instrumented.db'}")
+        monkeypatch.setenv('INSTRUMENTATION_ENABLED', '1')
+        monkeypatch.setenv('N_PLUS_ONE_THRESHOLD', '3')
+        monkeypatch.setenv('TESTING', '1')
+        # Keep exports and other artifacts out of the source tree's instance/ folder
+        for name, folder in (('EXPORT_ARTIFACT_DIR', 'exports'), ('IMPORT_UPLOAD_DIR', 'uploads'),
+                             ('VOUCHER_CACHE_DIR', 'vouchers'), ('ARCHIVE_DIR', 'archive')):
+            monkeypatch.setenv(name, str(tmp_path / folder))
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            user = User(username='testuser')
+            user.set_password('testpass')
+            db.session.add(user)
+            db.session.commit()
+        yield app
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_disabled_by_default(self, client):
+        """Test that nothing is added unless instrumentation is switched on."""
+        login(client)
+        assert 'Server-Timing' not in client.get('/dashboard').headers
+        assert client.get('/metrics').status_code == 404
+
+    def test_server_timing_header(self, instrumented):
+        """Test the per-phase breakdown on a traced request."""
+        client = instrumented.test_client()
+        login(client)
+        timing = client.get('/dashboard').headers['Server-Timing']
+        for part in ('sql;dur=', 'queries', 'render;dur=', 'app;dur=', 'total;dur='):
+            assert part in timing
+        timing = client.post('/export', data={'year': '2026', 'month': '1'}).headers['Server-Timing']
+        assert 'export;dur=' in timing
+
+    def test_n_plus_one_and_metrics(self, instrumented, caplog):
+        """Test that repeated statements are flagged and metrics are exported."""
+        @instrumented.route('/n-plus-one')
+        def n_plus_one():
+            for i in range(1, 5):
+                db.session.get(Reservation, i)
+            return 'ok'
+
+        client = instrumented.test_client()
+        client.get('/n-plus-one')
+        assert any('Possible N+1' in r.message for r in caplog.records)
+        # Without METRICS_TOKEN only logged-in users may read the metrics
+        assert client.get('/metrics').status_code == 401
+        login(client)
+        body = client.get('/metrics').get_data(as_text=True)
+        assert 'travel_request_duration_seconds_count{endpoint="n_plus_one",method="GET",status="200"} 1' in body
+        assert 'travel_n_plus_one_total{endpoint="n_plus_one"} 1' in body
+        assert 'travel_sql_queries_total{endpoint="n_plus_one"} 4' in body
+
+    def test_sampling_and_token(self, instrumented):
+        """Test that unsampled requests are untouched and the token guards /metrics."""
+        instrumented.config['INSTRUMENTATION_SAMPLE_RATE'] = 0.0
+        instrumented.config['METRICS_TOKEN'] = 'secret'
+        client = instrumented.test_client()
+        assert 'Server-Timing' not in client.get('/login').headers
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
 # ============ INTEGRATION TESTS ============
 
 class TestIntegration:
@@ -0,0 +1,12 @@
+"""Production entry point: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Gunicorn drains the background job queues from its worker_exit hook. For
+other WSGI servers the same drain runs at interpreter exit.
+"""
+import atexit
+import os
+from app import create_app
+from app.jobs import drain_jobs
+
+app = create_app()
+atexit.register(drain_jobs, app, timeout=float(os.getenv('GRACEFUL_TIMEOUT', '60')))